@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+#
+"""Load time, resident memory and lookup time of the journal abbreviation
+table, as JSON and as the compiled index. Every measurement runs in a fresh
+interpreter, e.g.,
+```
+python benchmarks/journals.py -n 10
+python benchmarks/journals.py --json > journals.json
+```
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# Each snippet prints the load time, the increase of the maximum resident set
+# size and the time of a lookup of every journal, in that order.
+_PROLOGUE = """
+import json, os, resource, time
+import betterbib.journals
+json_file = betterbib.journals.json_file
+# make sure the index exists
+betterbib.journals.JournalIndex().close()
+rss0 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.time()
+"""
+
+CASES = [
+    (
+        "json",
+        """
+with open(json_file) as f:
+    table = json.load(f)
+lookup = table.get
+""",
+    ),
+    (
+        "json, inverted",
+        """
+with open(json_file) as f:
+    table = json.load(f)
+table = {v: k for k, v in table.items()}
+lookup = table.get
+""",
+    ),
+    (
+        "index",
+        """
+index = betterbib.journals.JournalIndex()
+lookup = index.abbreviate
+""",
+    ),
+    (
+        "index, fuzzy",
+        """
+index = betterbib.journals.JournalIndex()
+# a typo: drop a letter in the middle
+lookup = lambda name: index.match(name[: len(name) // 2] + name[len(name) // 2 + 1 :])
+""",
+    ),
+]
+
+_EPILOGUE = """
+load = time.time() - start
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss0
+with open(json_file) as f:
+    names = list(json.load(f))
+start = time.time()
+for name in names:
+    lookup(name)
+print(load, rss, time.time() - start)
+"""
+
+
+def _run(code, env):
+    out = subprocess.check_output(
+        [sys.executable, "-c", _PROLOGUE + code + _EPILOGUE], env=env
+    )
+    load, rss, lookup = out.split()
+    return float(load), int(rss), float(lookup)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Measure loading and querying the journal table."
+    )
+    parser.add_argument(
+        "-n", "--repeat", type=int, default=5, help="runs per case (default: 5)"
+    )
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args(argv)
+
+    env = dict(os.environ)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env["PYTHONPATH"] = os.pathsep.join(
+        [root] + ([env["PYTHONPATH"]] if "PYTHONPATH" in env else [])
+    )
+
+    results = []
+    for name, code in CASES:
+        runs = [_run(code, env) for _ in range(args.repeat)]
+        results.append(
+            {
+                "name": name,
+                "load": min(r[0] for r in runs),
+                # ru_maxrss is in kilobytes on Linux
+                "rss_kb": min(r[1] for r in runs),
+                "lookup_all": min(r[2] for r in runs),
+            }
+        )
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(
+            "{:<20} {:>10} {:>10} {:>16}".format(
+                "", "load [ms]", "RSS [kB]", "lookup all [ms]"
+            )
+        )
+        for r in results:
+            print(
+                "{:<20} {:>10.1f} {:>10} {:>16.1f}".format(
+                    r["name"], 1000 * r["load"], r["rss_kb"], 1000 * r["lookup_all"]
+                )
+            )
+    return
+
+
+if __name__ == "__main__":
+    main()
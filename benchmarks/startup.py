@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+#
+"""Startup time of betterbib and its command-line tools. Every measurement runs
+in a fresh interpreter, e.g.,
+```
+python benchmarks/startup.py -n 20
+python benchmarks/startup.py --json > startup.json
+```
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+CASES = [
+    ("import betterbib", "import betterbib"),
+    ("import betterbib.cli.dedup_doi", "import betterbib.cli.dedup_doi"),
+    ("import betterbib.cli.doi2bibtex", "import betterbib.cli.doi2bibtex"),
+    ("import betterbib.cli.format", "import betterbib.cli.format"),
+    ("import betterbib.cli.sync", "import betterbib.cli.sync"),
+    (
+        "betterbib-dedup-doi --version",
+        "import betterbib.cli\n"
+        "try:\n"
+        "    betterbib.cli.dedup_doi(['--version'])\n"
+        "except SystemExit:\n"
+        "    pass",
+    ),
+]
+
+
+def _time(code, env):
+    start = time.time()
+    subprocess.check_call(
+        [sys.executable, "-c", code], env=env, stdout=subprocess.DEVNULL
+    )
+    return time.time() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure betterbib startup time.")
+    parser.add_argument(
+        "-n", "--repeat", type=int, default=10, help="runs per case (default: 10)"
+    )
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args(argv)
+
+    env = dict(os.environ)
+    env["BETTERBIB_NO_UPDATE_CHECK"] = "1"
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env["PYTHONPATH"] = os.pathsep.join(
+        [root] + ([env["PYTHONPATH"]] if "PYTHONPATH" in env else [])
+    )
+
+    # The bare interpreter startup, to be subtracted mentally.
+    baseline = min(_time("pass", env) for _ in range(args.repeat))
+
+    results = []
+    for name, code in CASES:
+        times = sorted(_time(code, env) for _ in range(args.repeat))
+        results.append(
+            {
+                "name": name,
+                "min": times[0],
+                "median": times[len(times) // 2],
+                "python": baseline,
+            }
+        )
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print("{:<35} {:>10} {:>10}".format("", "min [ms]", "median [ms]"))
+        print("{:<35} {:>10.1f}".format("python -c pass", 1000 * baseline))
+        for r in results:
+            print(
+                "{:<35} {:>10.1f} {:>10.1f}".format(
+                    r["name"], 1000 * r["min"], 1000 * r["median"]
+                )
+            )
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,499 @@
+# -*- coding: utf-8 -*-
+#
+"""Run time of the main code paths of betterbib on synthetic bibliographies of
+different sizes. The data is generated from a fixed seed, so the results of
+different releases, and of different machines, can be compared, e.g.,
+```
+python benchmarks/suite.py --root ../betterbib-old --sizes 1000 10000 --json > before.json
+python benchmarks/suite.py --sizes 1000 10000 --compare before.json
+```
+`--root` points the suite at the source tree of another release. Only APIs that
+all releases have are used; cases that a release lacks are skipped. With
+`--compare`, the exit code is 1 if any case got slower by more than
+`--threshold`.
+"""
+from __future__ import print_function
+
+import argparse
+import collections
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_WORDS = (
+    "a analysis and approach between convergence data deflated dynamics "
+    "efficient equations estimates for framework from high in large linear "
+    "method methods model models new nonlinear numerical of on order problems "
+    "robust solution solver sparse stability study subspace systems the theory "
+    "to via with"
+).split()
+# words whose capitalization needs protection, and some LaTeX
+_SPECIAL = [
+    "Newton",
+    "Krylov",
+    "GMRES",
+    "Navier--Stokes",
+    "{FEM}",
+    'Schr\\"odinger',
+    "$L^2$",
+    "3D",
+]
+_FIRST = ["Andr\\'e", "Martin", 'J\\"org', "Reinhard", "Jane", "John", "Li", "Maria"]
+_LAST = ["Gaul", "Gutknecht", "Liesen", "Nabben", "Doe", "Roe", "Wang", 'M\\"uller']
+_MONTHS = ["jan", "feb", "mar", "apr", "may", "jun"]
+
+
+def _title(rng):
+    words = [rng.choice(_WORDS) for _ in range(rng.randint(4, 12))]
+    for _ in range(rng.randint(0, 2)):
+        words.insert(rng.randint(0, len(words)), rng.choice(_SPECIAL))
+    words[0] = words[0].capitalize()
+    return " ".join(words)
+
+
+def _journals(rng):
+    import betterbib
+
+    # by path; all releases have it there
+    filename = os.path.join(os.path.dirname(betterbib.__file__), "data", "journals.json")
+    with open(filename) as f:
+        table = json.load(f)
+    names = sorted(table)
+    sample = rng.sample(names, 200)
+    # long names, abbreviations, and names that aren't in the table
+    return (
+        sample[:100]
+        + [table[name] for name in sample[100:]]
+        + ["Journal of Synthetic Results {}".format(k) for k in range(20)]
+    )
+
+
+def generate(n, seed=0):
+    """BibTeX data with `n` entries that look like the ones in the wild.
+    """
+    rng = random.Random(seed)
+    journals = _journals(rng)
+    out = []
+    for k in range(n):
+        authors = " and ".join(
+            "{}, {}".format(rng.choice(_LAST), rng.choice(_FIRST))
+            for _ in range(rng.randint(1, 5))
+        )
+        fields = [
+            ("title", "{" + _title(rng) + "}"),
+            ("author", "{" + authors + "}"),
+            ("journal", "{" + rng.choice(journals) + "}"),
+            ("year", "{}".format(rng.randint(1950, 2020))),
+            ("volume", "{}".format(rng.randint(1, 200))),
+            ("pages", "{{{}--{}}}".format(k % 900 + 1, k % 900 + 20)),
+            ("month", rng.choice(_MONTHS)),
+        ]
+        if rng.random() < 0.7:
+            fields.append(("doi", "{{10.{}/synth.{}}}".format(1000 + k % 97, k)))
+        out.append(
+            "@article{{key{},\n{}\n}}\n".format(
+                k, ",\n".join(" {} = {}".format(key, val) for key, val in fields)
+            )
+        )
+    return "\n".join(out)
+
+
+def _crossref_items(n, seed=0):
+    """Canned items of Crossref responses, of all types that don't need
+    another request. (Book chapters do in older releases.)
+    """
+    rng = random.Random(seed)
+    types = [
+        "journal-article",
+        "journal-article",
+        "journal-article",
+        "proceedings-article",
+        "book",
+        "report",
+        "dataset",
+    ]
+    items = []
+    for k in range(n):
+        item = {
+            "DOI": "10.{}/synth.{}".format(1000 + k % 97, k),
+            "type": rng.choice(types),
+            "title": [_title(rng)],
+            "subtitle": [],
+            "author": [
+                {"given": rng.choice(_FIRST), "family": rng.choice(_LAST)}
+                for _ in range(rng.randint(1, 5))
+            ],
+            "container-title": ["Journal of Synthetic Results"],
+            "short-container-title": ["J. Synth. Res."],
+            "publisher": "Synthetic Publishing",
+            "issued": {"date-parts": [[rng.randint(1950, 2020), rng.randint(1, 12)]]},
+            "volume": str(rng.randint(1, 200)),
+            "issue": str(rng.randint(1, 12)),
+            "page": "{}-{}".format(k % 900 + 1, k % 900 + 20),
+            "ISSN": ["0895-4798", "1095-7162"],
+            "URL": "http://dx.doi.org/10.{}/synth.{}".format(1000 + k % 97, k),
+            "source": "Crossref",
+            "score": rng.uniform(1.0, 100.0),
+        }
+        items.append(item)
+    return items
+
+
+def _dblp_hits(n, seed=0):
+    rng = random.Random(seed)
+    return [
+        {
+            "authors": {
+                "author": [
+                    "{} {}".format(rng.choice(_FIRST), rng.choice(_LAST))
+                    for _ in range(rng.randint(1, 5))
+                ]
+            },
+            "doi": "10.{}/synth.{}".format(1000 + k % 97, k),
+            "ee": "https://doi.org/10.{}/synth.{}".format(1000 + k % 97, k),
+            "key": "journals/synth/{}".format(k),
+            "number": str(rng.randint(1, 12)),
+            "pages": "{}-{}".format(k % 900 + 1, k % 900 + 20),
+            "title": _title(rng) + ".",
+            "type": "Journal Articles",
+            "venue": "J. Synth. Res.",
+            "volume": str(rng.randint(1, 200)),
+            "year": str(rng.randint(1950, 2020)),
+        }
+        for k in range(n)
+    ]
+
+
+def _unique_queries(n, seed=0):
+    """(results, d) pairs for heuristic_unique_result that end up in each of
+    its rules: the score, the DOI, the title, the pages, and JSTOR copies.
+    """
+    rng = random.Random(seed)
+    items = _crossref_items(2 * n, seed)
+    queries = []
+    for k in range(n):
+        a, b = items[2 * k], items[2 * k + 1]
+        rule = k % 5
+        if rule == 0:
+            a["score"] = 2 * b["score"]
+        else:
+            a["score"] = b["score"] = rng.uniform(1.0, 100.0)
+        d = {"genre": "article"}
+        if rule == 1:
+            d["doi"] = "https://doi.org/" + b["DOI"]
+        elif rule == 2:
+            d["title"] = "{} (extended version)".format(b["title"][0])
+        elif rule == 3:
+            d["pages"] = b["page"]
+        else:
+            b["publisher"] = "JSTOR"
+            b["title"] = list(a["title"])
+        queries.append(([a, b], d))
+    return queries
+
+
+def _parse(text):
+    from pybtex.database.input import bibtex
+
+    return collections.OrderedDict(bibtex.Parser().parse_string(text).entries.items())
+
+
+def _fresh_protection_cache(tools):
+    # Start every run with an empty cache of the capitalization decisions, if
+    # this version of betterbib has one.
+    if hasattr(tools, "_default_protection_cache"):
+        tools._default_protection_cache = None  # pylint: disable=protected-access
+        filename = os.path.join(tools.get_cache_dir(), "word-protection.json")
+        if os.path.exists(filename):
+            os.remove(filename)
+    return
+
+
+# Every case is a pair of functions. The first one, untimed, prepares the input
+# for the second one from the text and the number of entries. The functions
+# under test are looked up when the case is created, so that a release that
+# lacks them raises AttributeError or ImportError right away.
+def _case_parse():
+    def setup(text, n):
+        return text
+
+    return setup, _parse
+
+
+def _case_decode():
+    from betterbib import tools
+
+    def setup(text, n):
+        return _parse(text)
+
+    return setup, tools.decode
+
+
+def _case_format():
+    from betterbib import tools
+
+    write = tools.write
+
+    def setup(text, n):
+        _fresh_protection_cache(tools)
+        return tools.decode(_parse(text))
+
+    def run(od):
+        write(od, io.StringIO(), "braces", tab_indent=False)
+
+    return setup, run
+
+
+def _case_translate_title():
+    from betterbib import tools
+
+    translate_title = tools._translate_title  # pylint: disable=protected-access
+
+    def setup(text, n):
+        _fresh_protection_cache(tools)
+        return [entry.fields["title"] for entry in tools.decode(_parse(text)).values()]
+
+    def run(titles):
+        for title in titles:
+            translate_title(title)
+
+    return setup, run
+
+
+def _case_journal_names():
+    from betterbib import tools
+
+    updater = tools.JournalNameUpdater()
+
+    def setup(text, n):
+        return list(tools.decode(_parse(text)).values())
+
+    def run(entries):
+        for entry in entries:
+            updater.update(entry)
+
+    return setup, run
+
+
+def _case_heuristic_unique_result():
+    from betterbib import tools
+    from betterbib.errors import UniqueError
+
+    heuristic_unique_result = tools.heuristic_unique_result
+
+    def setup(text, n):
+        return _unique_queries(n)
+
+    def run(queries):
+        for results, d in queries:
+            try:
+                heuristic_unique_result(results, d)
+            except UniqueError:
+                pass
+
+    return setup, run
+
+
+def _case_crossref_to_pybtex():
+    from betterbib import crossref
+
+    # pylint: disable=protected-access
+    crossref_to_pybtex = crossref.Crossref()._crossref_to_pybtex
+
+    def setup(text, n):
+        return _crossref_items(n)
+
+    def run(items):
+        for item in items:
+            crossref_to_pybtex(item)
+
+    return setup, run
+
+
+def _case_dblp_to_pybtex():
+    from betterbib import dblp
+
+    dblp_to_pybtex = dblp._dblp_to_pybtex  # pylint: disable=protected-access
+
+    def setup(text, n):
+        return _dblp_hits(n)
+
+    def run(hits):
+        for hit in hits:
+            dblp_to_pybtex(hit)
+
+    return setup, run
+
+
+CASES = collections.OrderedDict(
+    [
+        ("parse", _case_parse),
+        ("decode", _case_decode),
+        ("format", _case_format),
+        ("translate_title", _case_translate_title),
+        ("journal_names", _case_journal_names),
+        ("heuristic_unique_result", _case_heuristic_unique_result),
+        ("crossref_to_pybtex", _case_crossref_to_pybtex),
+        ("dblp_to_pybtex", _case_dblp_to_pybtex),
+    ]
+)
+
+
+def run(cases, sizes, repeat):
+    """Time the `cases` on bibliographies of every size in `sizes`, `repeat`
+    times each, and return the list of results. Cases that this version of
+    betterbib doesn't support are skipped.
+    """
+    results = []
+    for n in sizes:
+        text = generate(n)
+        for name in cases:
+            try:
+                setup, function = CASES[name]()
+            except (AttributeError, ImportError) as e:
+                print("{:<25} skipped ({})".format(name, e), file=sys.stderr)
+                continue
+            times = []
+            for _ in range(repeat):
+                data = setup(text, n)
+                start = time.perf_counter()
+                function(data)
+                times.append(time.perf_counter() - start)
+            times.sort()
+            results.append(
+                {
+                    "case": name,
+                    "size": n,
+                    "min": times[0],
+                    "median": times[len(times) // 2],
+                }
+            )
+            print(
+                "{:<25} {:>7} {:>10.1f} {:>10.1f} {:>12.2f}".format(
+                    name,
+                    n,
+                    1000 * times[0],
+                    1000 * times[len(times) // 2],
+                    1.0e6 * times[0] / n,
+                ),
+                file=sys.stderr,
+            )
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Print the ratio of the times in `results` to the ones in `baseline` and
+    return the list of the cases that got slower by more than `threshold`.
+    """
+    before = {(r["case"], r["size"]): r["min"] for r in baseline["results"]}
+    regressions = []
+    print(
+        "{:<25} {:>7} {:>10} {:>10} {:>8}".format("", "size", "before", "now", "ratio")
+    )
+    for r in results:
+        key = (r["case"], r["size"])
+        if key not in before:
+            continue
+        ratio = r["min"] / before[key]
+        flag = ""
+        if ratio > threshold:
+            regressions.append(key)
+            flag = "  slower"
+        print(
+            "{:<25} {:>7} {:>10.1f} {:>10.1f} {:>8.2f}{}".format(
+                r["case"], r["size"], 1000 * before[key], 1000 * r["min"], ratio, flag
+            )
+        )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Measure betterbib on synthetic bibliographies."
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[1000, 10000, 100000],
+        help="numbers of entries (default: 1000 10000 100000)",
+    )
+    parser.add_argument(
+        "--cases",
+        nargs="+",
+        choices=list(CASES),
+        default=list(CASES),
+        help="what to measure (default: all)",
+    )
+    parser.add_argument(
+        "-n", "--repeat", type=int, default=3, help="runs per case (default: 3)"
+    )
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    parser.add_argument(
+        "--compare",
+        metavar="FILE",
+        type=argparse.FileType("r"),
+        help="compare to the JSON output of an earlier run",
+    )
+    parser.add_argument(
+        "--root",
+        default=_root,
+        help="source tree of the betterbib to measure (default: this one)",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.25,
+        help="with --compare, the ratio of the times that counts as a regression "
+        "(default: 1.25)",
+    )
+    args = parser.parse_args(argv)
+
+    # Keep the caches of the user out of it, and the other way around.
+    cache_dir = tempfile.mkdtemp()
+    os.environ["XDG_CACHE_HOME"] = cache_dir
+    sys.path.insert(0, os.path.abspath(args.root))
+    from betterbib import __about__
+
+    try:
+        print(
+            "{:<25} {:>7} {:>10} {:>10} {:>12}".format(
+                "", "size", "min [ms]", "median [ms]", "min/entry [us]"
+            ),
+            file=sys.stderr,
+        )
+        results = run(args.cases, args.sizes, args.repeat)
+    finally:
+        shutil.rmtree(cache_dir)
+
+    if args.json:
+        print(
+            json.dumps(
+                {
+                    "betterbib": __about__.__version__,
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "repeat": args.repeat,
+                    "results": results,
+                },
+                indent=2,
+            )
+        )
+
+    if args.compare:
+        regressions = compare(results, json.load(args.compare), args.threshold)
+        if regressions:
+            sys.exit(1)
+    return
+
+
+if __name__ == "__main__":
+    main()
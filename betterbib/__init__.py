@@ -1,23 +1,9 @@
 # -*- coding: utf-8 -*-
 #
-from __future__ import print_function
+import importlib
 
 from .__about__ import __version__, __author__, __author_email__, __website__
 
-from . import cli
-from .tools import (
-    create_dict,
-    decode,
-    pybtex_to_dict,
-    pybtex_to_bibtex_string,
-    write,
-    update,
-    JournalNameUpdater,
-    translate_month,
-)
-from .crossref import Crossref
-from .dblp import Dblp
-
 __all__ = [
     "__version__",
     "__author__",
@@ -36,10 +22,41 @@ __all__ = [
     "Dblp",
 ]
 
-try:
-    import pipdate
-except ImportError:
-    pass
-else:
-    if pipdate.needs_checking(__name__):
-        print(pipdate.check(__name__, __version__), end="")
+# The submodules pull in requests, pybtex, enchant etc. Only import them when
+# they are first used so that the command-line tools start up quickly.
+_lazy_attributes = {
+    "cli": (".cli", None),
+    "cache": (".cache", None),
+    "crossref": (".crossref", None),
+    "dblp": (".dblp", None),
+    "errors": (".errors", None),
+    "ratelimit": (".ratelimit", None),
+    "session": (".session", None),
+    "tools": (".tools", None),
+    "create_dict": (".tools", "create_dict"),
+    "decode": (".tools", "decode"),
+    "pybtex_to_dict": (".tools", "pybtex_to_dict"),
+    "pybtex_to_bibtex_string": (".tools", "pybtex_to_bibtex_string"),
+    "write": (".tools", "write"),
+    "update": (".tools", "update"),
+    "JournalNameUpdater": (".tools", "JournalNameUpdater"),
+    "translate_month": (".tools", "translate_month"),
+    "Crossref": (".crossref", "Crossref"),
+    "Dblp": (".dblp", "Dblp"),
+}
+
+
+def __getattr__(name):
+    try:
+        module_name, attribute = _lazy_attributes[name]
+    except KeyError:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    value = importlib.import_module(module_name, __name__)
+    if attribute is not None:
+        value = getattr(value, attribute)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
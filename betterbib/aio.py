@@ -0,0 +1,441 @@
+# -*- coding: utf-8 -*-
+#
+"""Coroutine versions of the source lookups, used by the asyncio engine of
+betterbib-sync. Requires Python 3 and aiohttp.
+"""
+import asyncio
+import functools
+import json
+import threading
+import time
+
+import aiohttp
+import requests
+
+from . import hedge, tools
+from .crossref import (
+    Crossref,
+    _get_book_doi,
+    _book_chapter_type,
+    _book_chapter_type_from_item,
+)
+from .dblp import Dblp, _dblp_to_pybtex
+from .errors import HttpError
+from .race import Race, merge, pick_error
+from .ratelimit import parse_retry_after
+from .session import LruCachedSession
+from .tools import pybtex_to_dict
+
+
+def _run_blocking(function, *args, **kwargs):
+    # for file locks and SQLite, which must not hold up the loop
+    return asyncio.get_event_loop().run_in_executor(
+        None, functools.partial(function, *args, **kwargs)
+    )
+
+
+# pylint: disable=too-many-arguments
+async def _get_once(
+    session, url, params, rate_limiter, retry_policy, circuit_breaker, timeout, headers
+):
+    """One attempt of _get_json; returns the status, headers and body.
+    """
+    connect, read = timeout
+    if retry_policy is not None:
+        connect, read = retry_policy.limit_timeout(timeout)
+    if rate_limiter is not None:
+        await _run_blocking(rate_limiter.acquire)
+
+    hedge.attempt_started()
+    try:
+        async with session.get(
+            url,
+            params=params,
+            headers=headers,
+            timeout=aiohttp.ClientTimeout(sock_connect=connect, sock_read=read),
+        ) as r:
+            status = r.status
+            response_headers = r.headers
+            hedge.attempt_done()
+            body = await r.read()
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        hedge.attempt_done(answered=False)
+        if circuit_breaker is not None:
+            circuit_breaker.failure()
+        raise
+
+    if rate_limiter is not None:
+        await _run_blocking(rate_limiter.update, response_headers)
+    if circuit_breaker is not None:
+        circuit_breaker.record(status)
+    return status, response_headers, body
+
+
+# pylint: disable=too-many-arguments
+async def _get_json(
+    session,
+    url,
+    params=None,
+    rate_limiter=None,
+    retry_policy=None,
+    circuit_breaker=None,
+    timeout=(None, None),
+    headers=None,
+    stats=None,
+    endpoint=None,
+    cache=None,
+):
+    """GET `url` with `headers` and return the decoded JSON, with the rate
+    limiting, retries, circuit breaking and (connect, read) `timeout` of
+    betterbib.session.RetryingAdapter. With `stats`, a pair of a RequestStats
+    and the name of the source, the request is recorded as one to `endpoint`.
+    With `cache`, the LruCachedSession of the source, the response is taken
+    from its cache if it's there, and stored in it otherwise.
+    """
+    start = time.time()
+    if cache is not None:
+        request = cache.prepare_request(requests.Request("GET", url, params=params))
+        # a copy, since that marks the request as only-if-cached
+        r = await _run_blocking(cache.send, request.copy(), only_if_cached=True)
+        # 504 if it isn't cached; only successful responses are
+        if r.ok:
+            if stats is not None:
+                stats[0].record(
+                    stats[1], endpoint, time.time() - start, from_cache=True
+                )
+            return r.json()
+
+    max_retries = 0 if retry_policy is None else retry_policy.max_retries
+    for k in range(max_retries + 1):
+        trial = circuit_breaker is not None and circuit_breaker.check()
+        try:
+            status, response_headers, body = await _get_once(
+                session,
+                url,
+                params,
+                rate_limiter,
+                retry_policy,
+                circuit_breaker,
+                timeout,
+                headers,
+            )
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            if k == max_retries:
+                raise HttpError("Failed request to {}".format(url))
+            await asyncio.sleep(retry_policy.delay(k))
+            continue
+        finally:
+            # also if the request was cancelled
+            if trial:
+                circuit_breaker.release()
+
+        if k == max_retries or not retry_policy.is_retryable(status):
+            break
+
+        delay = retry_policy.delay(
+            k, parse_retry_after(response_headers.get("Retry-After", ""))
+        )
+        if status == 429 and rate_limiter is not None:
+            # Hold back all other requests, too.
+            await _run_blocking(rate_limiter.pause, delay)
+        else:
+            await asyncio.sleep(delay)
+
+    if stats is not None:
+        stats[0].record(
+            stats[1], endpoint, time.time() - start, size=len(body), retries=k
+        )
+    if cache is not None:
+        # The cache decides what to keep, and for how long, like for the
+        # requests of the other engine.
+        await _run_blocking(
+            cache.send, request, answer=(status, response_headers, body)
+        )
+    if status >= 400:
+        raise HttpError("Failed request to {}".format(url))
+    return json.loads(body.decode("utf-8"))
+
+
+async def _hedged(hedger, kind, make_request):
+    """The result of the coroutine `make_request()`, a request of `kind`,
+    hedged like hedge.Hedger.call does it. The slower request is cancelled.
+    """
+
+    async def timed(attempts):
+        with hedge.tracking(attempts):
+            result = await make_request()
+        if attempts.seconds is not None:
+            hedger.record(kind, attempts.seconds)
+        return result
+
+    delay = hedger.delay(kind)
+    attempts = hedge.Attempts()
+    if delay is None:
+        return await timed(attempts)
+
+    first = asyncio.ensure_future(timed(attempts))
+    while True:
+        timeout = hedge.hedge_in(attempts, delay)
+        if timeout <= 0.0:
+            break
+        done, _ = await asyncio.wait([first], timeout=timeout)
+        if done:
+            return first.result()
+    if not hedger.allow():
+        return await first
+
+    second = asyncio.ensure_future(timed(hedge.Attempts()))
+    tasks = [first, second]
+    try:
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        winners = [t for t in tasks if t in done and t.exception() is None]
+        if not winners:
+            # The first one to finish failed; wait for the other.
+            await asyncio.wait(pending)
+            winners = [t for t in tasks if t.exception() is None]
+        if not winners:
+            return first.result()
+        if winners[0] is second:
+            hedger.won()
+        return winners[0].result()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def _get_cache(source):
+    if isinstance(source.session, LruCachedSession):
+        return source.session
+    return None
+
+
+def _get_headers(source):
+    # Same identification (User-Agent, Plus token) as the blocking session
+    return {
+        key: value
+        for key, value in source.session.headers.items()
+        if key not in ["Accept-Encoding", "Connection"]
+    }
+
+
+class AsyncCrossref(object):
+    def __init__(self, source):
+        self.source = source
+        self._stats = None if source.stats is None else (source.stats, "crossref")
+        self._timeout = tools.get_timeouts()
+        self._headers = _get_headers(source)
+        self._cache = _get_cache(source)
+        # Futures of the book types, one per book, shared by all its chapters
+        self._book_types = {}
+
+    # pylint: disable=protected-access
+    async def find_unique(self, session, entry):
+        d = pybtex_to_dict(entry)
+        data = await _hedged(
+            self.source.hedger,
+            "search",
+            lambda: _get_json(
+                session,
+                self.source.api_url,
+                self.source._get_search_params(d),
+                rate_limiter=self.source.rate_limiter,
+                retry_policy=self.source.retry_policy,
+                circuit_breaker=self.source.circuit_breaker,
+                timeout=self._timeout,
+                headers=self._headers,
+                stats=self._stats,
+                endpoint="search",
+                cache=self._cache,
+            ),
+        )
+        item = self.source._get_unique_item(data, d)
+
+        # Resolve the type here so _crossref_to_pybtex doesn't block the loop
+        bibtex_type = None
+        if item["type"] == "book-chapter":
+            bibtex_type = _book_chapter_type_from_item(item)
+            if bibtex_type is None:
+                book_doi = _get_book_doi(item)
+                if book_doi is None:
+                    bibtex_type = "incollection"
+                else:
+                    if book_doi not in self._book_types:
+                        self._book_types[book_doi] = asyncio.ensure_future(
+                            self._get_book_chapter_type(session, book_doi)
+                        )
+                    bibtex_type = await self._book_types[book_doi]
+
+        return self.source._crossref_to_pybtex(item, bibtex_type)
+
+    async def _get_book_chapter_type(self, session, book_doi):
+        bibtex_type = await _run_blocking(self.source.book_type_store.get, book_doi)
+        if bibtex_type is not None:
+            return bibtex_type
+
+        try:
+            book_data = await _get_json(
+                session,
+                self.source.api_url + "/" + book_doi,
+                rate_limiter=self.source.rate_limiter,
+                retry_policy=self.source.retry_policy,
+                circuit_breaker=self.source.circuit_breaker,
+                timeout=self._timeout,
+                headers=self._headers,
+                stats=self._stats,
+                endpoint="book-parent",
+                cache=self._cache,
+            )
+        except HttpError:
+            # Don't remember failures; the next chapter tries again.
+            del self._book_types[book_doi]
+            return _book_chapter_type(None)
+
+        bibtex_type = _book_chapter_type(book_data)
+        await _run_blocking(self.source.book_type_store.set, book_doi, bibtex_type)
+        return bibtex_type
+
+
+class AsyncDblp(object):
+    def __init__(self, source):
+        self.source = source
+        self._stats = None if source.stats is None else (source.stats, "dblp")
+        self._timeout = tools.get_timeouts()
+        self._headers = _get_headers(source)
+        self._cache = _get_cache(source)
+
+    # pylint: disable=protected-access
+    async def find_unique(self, session, entry):
+        d = pybtex_to_dict(entry)
+        data = await _get_json(
+            session,
+            self.source.api_url,
+            self.source._get_search_params(d),
+            retry_policy=self.source.retry_policy,
+            circuit_breaker=self.source.circuit_breaker,
+            timeout=self._timeout,
+            headers=self._headers,
+            stats=self._stats,
+            endpoint="search",
+            cache=self._cache,
+        )
+        return _dblp_to_pybtex(self.source._get_unique_item(data, d))
+
+
+class AsyncRace(object):
+    """The coroutine version of race.Race; the slower lookups are cancelled.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self._sources = [_to_async(s) for s in source.sources]
+
+    async def find_unique(self, session, entry):
+        tasks = [
+            asyncio.ensure_future(s.find_unique(session, entry)) for s in self._sources
+        ]
+        pending = set(tasks)
+        exceptions = []
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                # in the order of the sources if several are done
+                for task in [t for t in tasks if t in done]:
+                    if task.exception() is not None:
+                        exceptions.append(task.exception())
+                        continue
+                    data = task.result()
+                    if self.source.merge_wait > 0:
+                        if pending:
+                            _, pending = await asyncio.wait(
+                                pending, timeout=self.source.merge_wait
+                            )
+                        others = [
+                            t.result()
+                            for t in tasks
+                            if t is not task and t.done() and t.exception() is None
+                        ]
+                        data = merge(data, others)
+                    return data
+        finally:
+            for task in pending:
+                task.cancel()
+        raise pick_error(exceptions)
+
+
+def _to_async(source):
+    if isinstance(source, Race):
+        return AsyncRace(source)
+    if isinstance(source, Crossref):
+        return AsyncCrossref(source)
+    assert isinstance(source, Dblp), "Illegal source."
+    return AsyncDblp(source)
+
+
+class AsyncEngine(object):
+    """Runs the lookups of `source` on an asyncio event loop in a background
+    thread, with up to `num_concurrent_requests` requests in flight.
+    `submit(entry)` returns a concurrent.futures.Future of the result of
+    find_unique, like a thread pool's submit would.
+    """
+
+    def __init__(self, source, num_concurrent_requests):
+        self._source = source
+        self._async_source = _to_async(source)
+        self._num_concurrent_requests = num_concurrent_requests
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._open(), self._loop).result()
+        return
+
+    async def _open(self):
+        # The semaphore and the session belong to the loop, so create them on it.
+        self._semaphore = asyncio.Semaphore(self._num_concurrent_requests)
+        connector = aiohttp.TCPConnector(limit=self._num_concurrent_requests)
+        # The headers are per source; see _get_headers.
+        self._session = aiohttp.ClientSession(connector=connector)
+        return
+
+    async def _find_unique(self, entry, record_time):
+        async with self._semaphore:
+            start = time.time()
+            try:
+                return await self._async_source.find_unique(self._session, entry)
+            finally:
+                if record_time is not None:
+                    record_time(time.time() - start)
+
+    def submit(self, entry, record_time=None):
+        """With `record_time`, it's called with the seconds that the lookup
+        took, not counting the wait for a free slot.
+        """
+        return asyncio.run_coroutine_threadsafe(
+            self._find_unique(entry, record_time), self._loop
+        )
+
+    async def _close(self):
+        # Lookups still running, e.g., after a deadline, are given up.
+        current = asyncio.current_task()
+        tasks = [task for task in asyncio.all_tasks() if task is not current]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self._session.close()
+        return
+
+    def shutdown(self):
+        asyncio.run_coroutine_threadsafe(self._close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        return
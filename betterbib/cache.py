@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+#
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import pybtex.database
+
+
+def entry_to_dict(entry):
+    """JSON-serializable representation of a pybtex entry.
+    """
+    return {
+        "type": entry.type,
+        "fields": dict(entry.fields.items()),
+        "persons": {
+            role: [str(person) for person in persons]
+            for role, persons in entry.persons.items()
+        },
+    }
+
+
+def entry_from_dict(d):
+    persons = {
+        role: [pybtex.database.Person(string) for string in persons]
+        for role, persons in d["persons"].items()
+    }
+    return pybtex.database.Entry(d["type"], fields=d["fields"], persons=persons or None)
+
+
+class Store(object):
+    """Persistent key-value store with JSON values, backed by a table in an
+    SQLite file. Values older than `expire_after` seconds are treated as absent.
+    """
+
+    def __init__(self, filename, table="data", expire_after=None):
+        self.table = table
+        self.expire_after = expire_after
+
+        directory = os.path.dirname(filename)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        # The connection is shared by all threads, serialized by the lock.
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(filename, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS {} "
+                "(key TEXT PRIMARY KEY, value TEXT, created REAL)".format(table)
+            )
+        return
+
+    def get(self, key):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, created FROM {} WHERE key = ?".format(self.table),
+                (key,),
+            ).fetchone()
+        if row is None:
+            return None
+        value, created = row
+        if self.expire_after is not None and time.time() - created > self.expire_after:
+            return None
+        return json.loads(value)
+
+    def set(self, key, value):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO {} (key, value, created) "
+                "VALUES (?, ?, ?)".format(self.table),
+                (key, json.dumps(value), time.time()),
+            )
+        return
+
+    def remove_expired(self):
+        if self.expire_after is None:
+            return
+        with self._lock, self._connection:
+            self._connection.execute(
+                "DELETE FROM {} WHERE created < ?".format(self.table),
+                (time.time() - self.expire_after,),
+            )
+        return
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+        return
+
+
+class EntryCache(object):
+    """Maps the fingerprint of an input entry (see tools.fingerprint) to the
+    entry that a source resolved it to, so unchanged entries need neither a
+    request nor a conversion. `namespace` separates sources and their settings.
+    """
+
+    def __init__(self, filename, namespace, expire_after=30 * 24 * 3600):
+        self.namespace = namespace
+        self.store = Store(filename, table="entries", expire_after=expire_after)
+        self.store.remove_expired()
+        return
+
+    def get(self, fingerprint):
+        d = self.store.get(self.namespace + ":" + fingerprint)
+        if d is None:
+            return None
+        return entry_from_dict(d)
+
+    def set(self, fingerprint, data):
+        self.store.set(self.namespace + ":" + fingerprint, entry_to_dict(data))
+        return
+
+
+class Journal(object):
+    """Append-only log of the finished lookups of a sync in `filename`, one
+    JSON object per line with the key, the fingerprint of the input entry, the
+    outcome, and the entry found, so that an interrupted sync can pick up where
+    it stopped. Every line is flushed right away; it survives Ctrl-C and a
+    killed process, though not a crash of the machine. With `resume`, the
+    lookups already in the file are kept and can be read with get; otherwise,
+    the file starts over. The first line holds the `namespace` (see
+    EntryCache); a journal of another one is not resumed.
+    """
+
+    def __init__(self, filename, namespace, resume=False):
+        self.filename = filename
+        self.namespace = namespace
+        self._results = {}
+        self._lock = threading.Lock()
+
+        mode = "w"
+        torn = False
+        if resume and os.path.exists(filename):
+            with open(filename, "r") as f:
+                lines = f.read().split("\n")
+            try:
+                header = json.loads(lines[0])
+            except ValueError:
+                header = {}
+            if header.get("namespace") == namespace:
+                mode = "a"
+                for line in lines[1:]:
+                    try:
+                        r = json.loads(line)
+                    except ValueError:
+                        # the last line, cut short when the process was killed
+                        continue
+                    self._results[(r["key"], r["fingerprint"])] = (
+                        r["outcome"],
+                        r["data"],
+                    )
+                torn = lines[-1] != ""
+
+        self._file = open(filename, mode)
+        if mode == "w":
+            self._write({"namespace": namespace})
+        elif torn:
+            self._file.write("\n")
+        return
+
+    def _write(self, d):
+        with self._lock:
+            self._file.write(json.dumps(d) + "\n")
+            self._file.flush()
+        return
+
+    def get(self, key, fingerprint):
+        """The (outcome, entry or None) recorded for the entry `key` with the
+        given fingerprint, or None.
+        """
+        r = self._results.get((key, fingerprint))
+        if r is None:
+            return None
+        outcome, d = r
+        return outcome, None if d is None else entry_from_dict(d)
+
+    def record(self, key, fingerprint, outcome, data):
+        self._write(
+            {
+                "key": key,
+                "fingerprint": fingerprint,
+                "outcome": outcome,
+                "data": None if data is None else entry_to_dict(data),
+            }
+        )
+        return
+
+    def __len__(self):
+        return len(self._results)
+
+    def close(self):
+        self._file.close()
+        return
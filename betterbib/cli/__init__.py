@@ -1,10 +1,36 @@
 # -*- coding: utf-8 -*-
 #
+import importlib
+import sys
+import types
 
-from .dedup_doi import main as dedup_doi
-from .doi2bibtex import main as doi2bibtex
-from .format import main as format
-from .journal_abbrev import main as journal_abbrev
-from .sync import main as sync
+__all__ = [
+    "dedup_doi",
+    "doi2bibtex",
+    "format",
+    "journal_abbrev",
+    "pipeline",
+    "standin",
+    "sync",
+]
 
-__all__ = ["dedup_doi", "doi2bibtex", "format", "journal_abbrev", "sync"]
+
+class _Tools(types.ModuleType):
+    def __setattr__(self, name, value):
+        # Importing a submodule, e.g., `import betterbib.cli.sync`, sets the
+        # attribute to the module itself; keep the tool's main function.
+        if name in __all__ and isinstance(value, types.ModuleType):
+            value = value.main
+        super(_Tools, self).__setattr__(name, value)
+        return
+
+
+sys.modules[__name__].__class__ = _Tools
+
+
+def __getattr__(name):
+    # Import the command-line tools only when used; each one of them is
+    # exposed as its main function.
+    if name not in __all__:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    return importlib.import_module("." + name, __name__).main
@@ -5,37 +5,39 @@ from __future__ import unicode_literals
 import argparse
 import sys
 
-from pybtex.database.input import bibtex
-
-from .. import tools
+from .. import tools, profiling, stream
 from .. import __about__
+from .helpers import add_profile_arguments, check_for_update
 
 
 def main(argv=None):
     parser = _get_parser()
     args = parser.parse_args(argv)
+    check_for_update()
 
-    data = bibtex.Parser().parse_file(args.infile)
+    with profiling.profile(args.profile, args.profile_memory):
+        entries = profiling.iterate("parse", stream.read(args.infile))
+        entries = _deduplicate(entries, args.keep_doi)
+        with profiling.stage("write"):
+            _write(entries, args.outfile, "curly")
+    return
 
-    od = data.entries
 
-    # deduplicate
-    for key in data.entries:
-        if "url" in od[key].fields and "doi" in od[key].fields:
-            doi = tools.doi_from_url(od[key].fields["url"])
-            if doi == od[key].fields["doi"]:
+def _deduplicate(entries, keep_doi):
+    for key, entry in entries:
+        if "url" in entry.fields and "doi" in entry.fields:
+            doi = tools.doi_from_url(entry.fields["url"])
+            if doi == entry.fields["doi"]:
                 # Would be nicer to remove it completely; see
                 # <https://bitbucket.org/pybtex-devs/pybtex/issues/104/implement>.
-                if args.keep_doi:
-                    od[key].fields["url"] = None
+                if keep_doi:
+                    entry.fields["url"] = None
                 else:
-                    od[key].fields["doi"] = None
-
-    _write(od, args.outfile, "curly")
-    return
+                    entry.fields["doi"] = None
+        yield key, entry
 
 
-def _write(od, out, delimeter_type):
+def _write(entries, out, delimeter_type):
     # Write header to the output file.
     out.write(
         "%comment{{This file was created with betterbib v{}.}}\n\n".format(
@@ -43,15 +45,13 @@ def _write(od, out, delimeter_type):
         )
     )
 
-    # Create the dictionary only once
-    dictionary = tools.create_dict()
-
     # write the data out sequentially to respect ordering
-    for bib_id, d in od.items():
-        brace_delimeters = delimeter_type == "curly"
-        a = tools.pybtex_to_bibtex_string(
-            d, bib_id, brace_delimeters=brace_delimeters, dictionary=dictionary
-        )
+    brace_delimeters = delimeter_type == "curly"
+    strings = (
+        tools.pybtex_to_bibtex_string(d, bib_id, brace_delimeters=brace_delimeters)
+        for bib_id, d in entries
+    )
+    for a in profiling.iterate("format", strings):
         out.write(a + "\n\n")
     return
 
@@ -88,4 +88,5 @@ def _get_parser():
         action="store_true",
         help="keep the DOI rather than the URL (default: false)",
     )
+    add_profile_arguments(parser)
     return parser
@@ -5,18 +5,27 @@ from __future__ import print_function, unicode_literals
 import argparse
 import sys
 
-from .. import tools, crossref, __about__
+from .. import tools, crossref, errors, profiling, __about__
+from .helpers import add_profile_arguments, check_for_update
 
 
 def main(argv=None):
     parser = _get_parser()
     args = parser.parse_args(argv)
-    source = crossref.Crossref()
-    entry = source.get_by_doi(args.doi)
+    check_for_update()
+    with profiling.profile(args.profile, args.profile_memory):
+        with profiling.stage("network"):
+            source = crossref.Crossref()
+            try:
+                entry = source.get_by_doi(args.doi)
+            except (errors.NotFoundError, errors.HttpError) as e:
+                sys.exit(e.args[0])
 
-    bibtex_key = "key"
-    string = tools.pybtex_to_bibtex_string(entry, bibtex_key)
-    args.outfile.write(string)
+        bibtex_key = "key"
+        with profiling.stage("format"):
+            string = tools.pybtex_to_bibtex_string(entry, bibtex_key)
+        with profiling.stage("write"):
+            args.outfile.write(string)
     return
 
 
@@ -37,4 +46,5 @@ def _get_parser():
         default=sys.stdout,
         help="output file (default: stdout)",
     )
+    add_profile_arguments(parser)
     return parser
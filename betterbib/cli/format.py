@@ -3,63 +3,76 @@
 from __future__ import print_function, unicode_literals
 
 import argparse
-import collections
+import os
 import sys
 
-from pybtex.database.input import bibtex
-
-from .. import tools, __about__
+from .. import tools, profiling, stream, __about__
+from .helpers import add_profile_arguments, check_for_update
 
 
 def main(argv=None):
     parser = _get_parser()
     args = parser.parse_args(argv)
-
-    data = bibtex.Parser().parse_file(args.infile)
-
-    # Use an ordered dictionary to make sure that the entries are written out
-    # sorted by their BibTeX key if demanded.
-    od = tools.decode(
-        collections.OrderedDict(
-            sorted(data.entries.items())
-            if args.sort_by_bibkey
-            else data.entries.items()
+    check_for_update()
+
+    with profiling.profile(args.profile, args.profile_memory):
+        # The entries are read, processed and written one at a time, so that
+        # files of any size can be formatted in bounded memory.
+        entries = profiling.iterate("parse", stream.read(args.infile))
+        if args.sort_by_bibkey:
+            # sorting needs all entries at once
+            entries = sorted(entries)
+
+        entries = profiling.iterate(
+            "decode",
+            ((bib_id, tools.decode_entry(entry)) for bib_id, entry in entries),
+        )
+        entries = profiling.iterate(
+            "doi_urls", adapt_doi_urls(entries, args.doi_url_type)
         )
-    )
-
-    od = _adapt_doi_urls(od, args.doi_url_type)
 
-    tools.write(od, args.outfile, args.delimeter_type, tab_indent=args.tabs_indent)
+        with profiling.stage("write"):
+            tools.write(
+                entries,
+                args.outfile,
+                args.delimeter_type,
+                tab_indent=args.tabs_indent,
+                jobs=args.jobs or os.cpu_count(),
+            )
     return
 
 
-def _adapt_doi_urls(od, doi_url_type):
+def adapt_doi_urls(entries, doi_url_type, stats=None):
     if doi_url_type == "new":
-        od = _update_doi_url(od, lambda doi: "https://doi.org/" + doi)
+        entries = _update_doi_url(entries, lambda doi: "https://doi.org/" + doi)
     elif doi_url_type == "short":
+        # requests is slow to import; only do it when needed
+        from ..session import create_session
+
+        session = create_session(1)
 
         def update_to_short_doi(doi):
-            short_doi = tools.get_short_doi(doi)
+            short_doi = tools.get_short_doi(doi, session=session, stats=stats)
             if short_doi:
                 return "https://doi.org/" + short_doi
             return None
 
-        od = _update_doi_url(od, update_to_short_doi)
+        entries = _update_doi_url(entries, update_to_short_doi)
     else:
         assert doi_url_type == "unchanged"
 
-    return od
+    return entries
 
 
-def _update_doi_url(od, url_from_doi):
-    for bib_id in od:
-        if "url" in od[bib_id].fields:
-            doi = tools.doi_from_url(od[bib_id].fields["url"])
+def _update_doi_url(entries, url_from_doi):
+    for bib_id, entry in entries:
+        if "url" in entry.fields:
+            doi = tools.doi_from_url(entry.fields["url"])
             if doi:
                 new_url = url_from_doi(doi)
                 if new_url:
-                    od[bib_id].fields["url"] = new_url
-    return od
+                    entry.fields["url"] = new_url
+        yield bib_id, entry
 
 
 def _get_parser():
@@ -105,6 +118,14 @@ def _get_parser():
         default="braces",
         help=("which delimeters to use in the output file " "(default: braces {...})"),
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        metavar="N",
+        help="format the entries in N processes, 0 for one per CPU (default: 1)",
+    )
     parser.add_argument(
         "-u",
         "--doi-url-type",
@@ -115,4 +136,5 @@ def _get_parser():
             "short: https://doi.org/abcde)"
         ),
     )
+    add_profile_arguments(parser)
     return parser
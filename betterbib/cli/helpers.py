@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+#
+from __future__ import print_function
+
+import os
+import sys
+
+from .. import __about__
+
+
+def check_for_update():
+    """Tell the user if there is a newer version of betterbib on PyPI. Set the
+    environment variable BETTERBIB_NO_UPDATE_CHECK to skip the check, e.g., in
+    scripts.
+    """
+    if os.environ.get("BETTERBIB_NO_UPDATE_CHECK"):
+        return
+
+    try:
+        import pipdate
+    except ImportError:
+        return
+
+    if pipdate.needs_checking("betterbib"):
+        print(
+            pipdate.check("betterbib", __about__.__version__), end="", file=sys.stderr
+        )
+    return
+
+
+def add_profile_arguments(parser):
+    """Add the options for betterbib.profiling to `parser`.
+    """
+    parser.add_argument(
+        "--profile",
+        metavar="FILE",
+        help="write a CPU profile (pstats) of the main thread to FILE (default: none)",
+    )
+    parser.add_argument(
+        "--profile-memory",
+        metavar="FILE",
+        help=(
+            "write the time, peak memory and top allocation sites per stage as "
+            "JSON to FILE; slows everything down (default: none)"
+        ),
+    )
+    return
@@ -3,29 +3,49 @@
 from __future__ import print_function, unicode_literals
 
 import argparse
-import collections
 import sys
 
-from pybtex.database.input import bibtex
-
-from .. import tools, __about__
+from .. import tools, profiling, stream, __about__
+from .helpers import add_profile_arguments, check_for_update
 
 
 def main(argv=None):
     parser = _get_parser()
     args = parser.parse_args(argv)
+    check_for_update()
 
-    updater = tools.JournalNameUpdater(args.long_journal_names)
-
-    data = bibtex.Parser().parse_file(args.infile)
-    for key in data.entries:
-        updater.update(data.entries[key])
+    with profiling.profile(args.profile, args.profile_memory):
+        updater = tools.JournalNameUpdater(
+            args.long_journal_names,
+            fuzzy=args.fuzzy,
+            min_confidence=args.min_confidence,
+        )
 
-    od = tools.decode(collections.OrderedDict(data.entries.items()))
-    tools.write(od, args.outfile, "braces", tab_indent=False)
+        entries = profiling.iterate("parse", stream.read(args.infile))
+        entries = profiling.iterate("journals", update_journal_names(entries, updater))
+        entries = profiling.iterate(
+            "decode",
+            ((bib_id, tools.decode_entry(entry)) for bib_id, entry in entries),
+        )
+        with profiling.stage("write"):
+            tools.write(entries, args.outfile, "braces", tab_indent=False)
     return
 
 
+def update_journal_names(entries, updater):
+    for bib_id, entry in entries:
+        match = updater.update(entry)
+        if match is not None and match.method != "exact":
+            # Let the user double-check everything that wasn't an exact match.
+            print(
+                "{}: {} -> {} ({}, confidence {:.2f})".format(
+                    bib_id, match.key, match.name, match.method, match.confidence
+                ),
+                file=sys.stderr,
+            )
+        yield bib_id, entry
+
+
 def _get_parser():
     parser = argparse.ArgumentParser(description="(Un)abbreviate journal names.")
     parser.add_argument(
@@ -55,4 +75,17 @@ def _get_parser():
         action="store_true",
         help="use long journal names (default: false)",
     )
+    parser.add_argument(
+        "--fuzzy",
+        action="store_true",
+        help="also match journal names that are similar (default: false)",
+    )
+    parser.add_argument(
+        "--min-confidence",
+        type=float,
+        default=0.8,
+        help="least confidence, between 0 and 1, of a similar journal name "
+        "for --fuzzy (default: 0.8)",
+    )
+    add_profile_arguments(parser)
     return parser
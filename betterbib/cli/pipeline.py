@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+#
+from __future__ import print_function, unicode_literals
+
+import argparse
+import collections
+import os
+import sys
+import time
+
+from pybtex.database.input import bibtex
+
+from .. import tools, profiling, stats, __about__
+from .format import adapt_doi_urls
+from .helpers import add_profile_arguments, check_for_update
+from .journal_abbrev import update_journal_names
+from .sync import add_arguments, read_state, save_state, sync_entries
+
+
+def main(argv=None):
+    """Sync, (un)abbreviate journal names and format in one go. This is what
+    ```
+    betterbib-sync in.bib | betterbib-journal-abbrev | betterbib-format -b - out.bib
+    ```
+    does, but the file is parsed and written only once, and all stages work on
+    the same entries.
+    """
+    parser = _get_parser()
+    args = parser.parse_args(argv)
+    check_for_update()
+    deadline = None if args.deadline is None else time.time() + args.deadline
+
+    with profiling.profile(args.profile, args.profile_memory):
+        with profiling.stage("parse"):
+            data = bibtex.Parser().parse_file(args.infile)
+        with profiling.stage("decode"):
+            od = tools.decode(collections.OrderedDict(data.entries.items()))
+
+        state = read_state(args.state) if args.state else {}
+        outcomes = {}
+        request_stats = stats.RequestStats() if args.stats else None
+        entries = sync_entries(od, args, state, outcomes, request_stats, deadline)
+
+        updater = tools.JournalNameUpdater(
+            args.long_journal_name,
+            fuzzy=args.fuzzy,
+            min_confidence=args.min_confidence,
+        )
+        entries = profiling.iterate("journals", update_journal_names(entries, updater))
+        entries = profiling.iterate(
+            "doi_urls", adapt_doi_urls(entries, args.doi_url_type, request_stats)
+        )
+        if args.sort_by_bibkey:
+            entries = collections.OrderedDict(sorted(entries))
+
+        # Unless sorted, the entries stream through all stages and out. They are
+        # updated in place, so `od` has the final entries for save_state.
+        with profiling.stage("write"):
+            tools.write(
+                entries,
+                args.outfile,
+                args.delimeter_type,
+                tab_indent=args.tabs_indent,
+                jobs=args.jobs or os.cpu_count(),
+                flush=not args.sort_by_bibkey,
+            )
+
+        if args.state:
+            save_state(args.state, state, od, outcomes)
+        if args.stats:
+            request_stats.save(args.stats)
+    return
+
+
+def _get_parser():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Sync BibTeX files with information from online sources, "
+            "(un)abbreviate journal names, and reformat."
+        )
+    )
+    parser.add_argument(
+        "-v",
+        "--version",
+        help="display version information",
+        action="version",
+        version="betterbib {}, Python {}".format(__about__.__version__, sys.version),
+    )
+    parser.add_argument(
+        "infile",
+        nargs="?",
+        type=argparse.FileType("r"),
+        default=sys.stdin,
+        help="input BibTeX file (default: stdin)",
+    )
+    parser.add_argument(
+        "outfile",
+        nargs="?",
+        type=argparse.FileType("w"),
+        default=sys.stdout,
+        help="output BibTeX file (default: stdout)",
+    )
+
+    # sync; -l also selects long journal names in the next stage
+    add_arguments(parser)
+
+    # journal names
+    parser.add_argument(
+        "--fuzzy",
+        action="store_true",
+        help="also match journal names that are similar (default: false)",
+    )
+    parser.add_argument(
+        "--min-confidence",
+        type=float,
+        default=0.8,
+        help="least confidence, between 0 and 1, of a similar journal name "
+        "for --fuzzy (default: 0.8)",
+    )
+
+    # format
+    parser.add_argument(
+        "-b",
+        "--sort-by-bibkey",
+        action="store_true",
+        help="sort entries by BibTeX key (default: false)",
+    )
+    parser.add_argument(
+        "-t",
+        "--tabs-indent",
+        action="store_true",
+        help="use tabs for indentation (default: false)",
+    )
+    parser.add_argument(
+        "-d",
+        "--delimeter-type",
+        choices=["braces", "quotes"],
+        default="braces",
+        help=("which delimeters to use in the output file " "(default: braces {...})"),
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        metavar="N",
+        help="format the entries in N processes, 0 for one per CPU (default: 1)",
+    )
+    parser.add_argument(
+        "-u",
+        "--doi-url-type",
+        choices=["unchanged", "new", "short"],
+        default="new",
+        help=(
+            "DOI URL (new: https://doi.org/<DOI> (default), "
+            "short: https://doi.org/abcde)"
+        ),
+    )
+    add_profile_arguments(parser)
+    return parser
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+#
+from __future__ import print_function, unicode_literals
+
+import argparse
+import sys
+
+from .. import __about__
+from ..standin import Faults, StandIn
+
+
+def main(argv=None):
+    parser = _get_parser()
+    args = parser.parse_args(argv)
+
+    faults = Faults(
+        latency=args.latency / 1000.0,
+        jitter=args.jitter / 1000.0,
+        rate_429=args.rate_429,
+        rate_5xx=args.rate_5xx,
+        rate_timeout=args.rate_timeout,
+        retry_after=args.retry_after,
+        hang=args.hang,
+        seed=args.seed,
+    )
+    standin = StandIn(
+        cassette=args.cassette,
+        record=args.record,
+        synthesize=args.synthesize,
+        not_found=args.not_found,
+        faults=faults,
+        rate_limit=args.rate_limit,
+        host=args.host,
+        port=args.port,
+    )
+    print("Crossref: {}".format(standin.crossref_url), file=sys.stderr)
+    print("DBLP:     {}".format(standin.dblp_url), file=sys.stderr)
+    try:
+        standin.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    standin.stopped.set()
+    standin.server.server_close()
+
+    print(file=sys.stderr)
+    for key, value in sorted(standin.stats.items()):
+        print("{}: {}".format(key, value), file=sys.stderr)
+    return
+
+
+def _get_parser():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Serve recorded or made-up Crossref and DBLP responses locally, "
+            "with injected latency and errors."
+        )
+    )
+    parser.add_argument(
+        "-v",
+        "--version",
+        help="display version information",
+        action="version",
+        version="betterbib {}, Python {}".format(__about__.__version__, sys.version),
+    )
+    parser.add_argument(
+        "--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)"
+    )
+    parser.add_argument(
+        "-p", "--port", type=int, default=8080, help="port to listen on (default: 8080)"
+    )
+    parser.add_argument(
+        "--cassette",
+        metavar="FILE",
+        help="replay the responses recorded in this file (default: none)",
+    )
+    parser.add_argument(
+        "--record",
+        action="store_true",
+        help="fetch responses that aren't in the cassette from the real APIs "
+        "and add them (default: false)",
+    )
+    parser.add_argument(
+        "--synthesize",
+        action="store_true",
+        help="make up responses that aren't in the cassette (default: false)",
+    )
+    parser.add_argument(
+        "--not-found",
+        type=float,
+        default=0.0,
+        metavar="P",
+        help="with --synthesize, the fraction of searches without result "
+        "(default: 0)",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        metavar="MS",
+        help="delay of every response in milliseconds (default: 0)",
+    )
+    parser.add_argument(
+        "--jitter",
+        type=float,
+        default=0.0,
+        metavar="MS",
+        help="additional random delay of up to this many milliseconds (default: 0)",
+    )
+    parser.add_argument(
+        "--rate-429",
+        type=float,
+        default=0.0,
+        metavar="P",
+        help="probability of 429 Too Many Requests (default: 0)",
+    )
+    parser.add_argument(
+        "--retry-after",
+        type=float,
+        default=1.0,
+        metavar="SECONDS",
+        help="Retry-After of the 429 responses (default: 1)",
+    )
+    parser.add_argument(
+        "--rate-5xx",
+        type=float,
+        default=0.0,
+        metavar="P",
+        help="probability of 503 Service Unavailable (default: 0)",
+    )
+    parser.add_argument(
+        "--rate-timeout",
+        type=float,
+        default=0.0,
+        metavar="P",
+        help="probability that a request gets no answer (default: 0)",
+    )
+    parser.add_argument(
+        "--hang",
+        type=float,
+        default=30.0,
+        metavar="SECONDS",
+        help="how long requests without answer are kept open (default: 30)",
+    )
+    parser.add_argument(
+        "--rate-limit",
+        type=int,
+        metavar="N",
+        help="announce a rate limit of N requests per second in the "
+        "X-Rate-Limit-* headers (default: none)",
+    )
+    parser.add_argument(
+        "--seed", type=int, help="seed of the random faults (default: random)"
+    )
+    return parser
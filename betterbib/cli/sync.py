@@ -6,67 +6,523 @@ import argparse
 import collections
 
 import concurrent.futures
+import json
+import os
 import sys
+import threading
+import time
 
 from pybtex.database.input import bibtex
 from tqdm import tqdm
 
-from .. import tools, crossref, dblp, errors, __about__
+from .. import tools, cache, crossref, dblp, errors, profiling, race, stats, stream
+from .. import __about__
+from .helpers import add_profile_arguments, check_for_update
 
 
 def main(argv=None):
     parser = _get_parser()
     args = parser.parse_args(argv)
+    check_for_update()
+    deadline = None if args.deadline is None else time.time() + args.deadline
 
-    data = bibtex.Parser().parse_file(args.infile)
+    with profiling.profile(args.profile, args.profile_memory):
+        with profiling.stage("parse"):
+            data = bibtex.Parser().parse_file(args.infile)
 
-    # Use an ordered dictionary to make sure that the entries are written out
-    # the way they came in.
-    od = tools.decode(collections.OrderedDict(data.entries.items()))
+        # Use an ordered dictionary to make sure that the entries are written
+        # out the way they came in.
+        with profiling.stage("decode"):
+            od = tools.decode(collections.OrderedDict(data.entries.items()))
 
-    if args.source == "crossref":
-        source = crossref.Crossref(args.long_journal_name)
-    else:
-        assert args.source == "dblp", "Illegal source."
-        source = dblp.Dblp()
+        state = read_state(args.state) if args.state else {}
+        outcomes = {}
+        request_stats = stats.RequestStats() if args.stats else None
+        # Every entry is written as soon as it and all entries before it are
+        # synced.
+        with profiling.stage("write"):
+            tools.write(
+                sync_entries(od, args, state, outcomes, request_stats, deadline),
+                args.outfile,
+                "braces",
+                tab_indent=False,
+                flush=True,
+            )
 
-    print()
-    od, num_success = _update_from_source(od, source, args.num_concurrent_requests)
+        if args.state:
+            save_state(args.state, state, od, outcomes)
+        if args.stats:
+            request_stats.save(args.stats)
+    return
 
-    print("\n\nTotal number of entries: {}".format(len(data.entries)))
-    print("Found: {}".format(num_success))
 
-    tools.write(od, args.outfile, "braces", tab_indent=False)
-    return
+# pylint: disable=too-many-arguments
+def sync_entries(od, args, state, outcomes, request_stats=None, deadline=None):
+    """Update the entries in `od` in place with the data from the source
+    selected in `args` (see add_arguments) and yield the (key, entry) pairs in
+    order, each one as soon as it and all before it are done. A summary is
+    printed at the end. With a `state` from read_state, only new, changed and
+    outdated entries are looked up. The outcome and the fingerprint of the
+    input of every looked-up entry are put into the dictionary `outcomes` for
+    save_state. All requests and lookups are
+    recorded in `request_stats`, a RequestStats, if given. At the `deadline`, a
+    time.time(), the lookups stop and the entries not done yet are yielded
+    unchanged. Finished lookups go to a journal (see _get_journal_file) right
+    away; with `args.resume`, the ones in it aren't looked up again. The
+    journal is removed once all lookups are done.
+    """
+    source = _create_source(args)
+    for s in getattr(source, "sources", [source]):
+        s.stats = request_stats
+        s.retry_policy.deadline = deadline
+
+    namespace = "{}:{}".format(
+        args.source, "long" if args.long_journal_name else "short"
+    )
+    entry_cache = None
+    if args.entry_cache_days > 0:
+        entry_cache = cache.EntryCache(
+            os.path.join(tools.get_cache_dir(), "entries.sqlite"),
+            namespace,
+            expire_after=args.entry_cache_days * 24 * 3600,
+        )
+
+    journal = None
+    journal_file = _get_journal_file(args)
+    if journal_file is not None:
+        journal = cache.Journal(journal_file, namespace, resume=args.resume)
+    elif args.resume:
+        print("No journal to resume from; use --journal.", file=sys.stderr)
 
+    # Only look up entries that are new, changed, or whose last lookup is too
+    # old. The others are written out as they are.
+    items = [
+        (
+            bib_id,
+            entry,
+            _needs_update(state.get(bib_id), entry, args.state_max_age_days),
+        )
+        for bib_id, entry in od.items()
+    ]
+    num_todo = sum(1 for item in items if item[2])
 
-def _update_from_source(od, source, num_concurrent_requests):
+    # The output may go to stdout, so all messages go to stderr.
+    print(file=sys.stderr)
+    if journal is not None and len(journal) > 0:
+        print("Resuming with {} lookups done.".format(len(journal)), file=sys.stderr)
     num_success = 0
-    # pylint: disable=bad-continuation
-    with concurrent.futures.ThreadPoolExecutor(
-        max_workers=num_concurrent_requests
-    ) as executor:
-        responses = {
-            executor.submit(source.find_unique, entry): (bib_id, entry)
-            for bib_id, entry in od.items()
+    num_done = 0
+    try:
+        with tqdm(total=num_todo) as progress:
+            results = _lookup_in_order(
+                items,
+                source,
+                args.num_concurrent_requests,
+                args.engine,
+                entry_cache,
+                args.window,
+                request_stats,
+                deadline=deadline,
+                journal=journal,
+            )
+            for bib_id, entry, data, outcome, fingerprint in profiling.iterate(
+                "network", results
+            ):
+                if outcome is not None:
+                    outcomes[bib_id] = (outcome, fingerprint)
+                    num_done += 1
+                    num_success += outcome == "found"
+                    od[bib_id] = tools.update(entry, data)
+                    progress.update()
+                yield bib_id, od[bib_id]
+    finally:
+        if journal is not None:
+            journal.close()
+        if isinstance(source, race.Race):
+            source.shutdown()
+        for s in getattr(source, "sources", [source]):
+            hedger = getattr(s, "hedger", None)
+            if hedger is not None:
+                hedger.shutdown()
+                if request_stats is not None:
+                    request_stats.record_hedges(
+                        s.__class__.__name__.lower(), hedger.num_hedges, hedger.num_wins
+                    )
+    if journal is not None and num_done == num_todo:
+        os.remove(journal_file)
+
+    print("\n\nTotal number of entries: {}".format(len(od)), file=sys.stderr)
+    if args.state:
+        print(
+            "Unchanged since last sync: {}".format(len(od) - num_todo), file=sys.stderr
+        )
+    print("Found: {}".format(num_success), file=sys.stderr)
+    if num_done < num_todo:
+        print(
+            "Deadline passed, left unchanged: {}".format(num_todo - num_done),
+            file=sys.stderr,
+        )
+    return
+
+
+def _create_source(args, name=None):
+    """The source `name`, by default the one selected in `args`. The source
+    "race" races Crossref and DBLP; see race.Race.
+    """
+    name = name or args.source
+    if name == "race":
+        if args.api_url:
+            sys.exit(
+                "--api-url can't point at two sources; "
+                "set api_url in the config file instead."
+            )
+        return race.Race(
+            [_create_source(args, "crossref"), _create_source(args, "dblp")],
+            merge_wait=args.merge_wait,
+            num_concurrent_requests=args.num_concurrent_requests,
+        )
+    if name == "crossref":
+        return crossref.Crossref(
+            args.long_journal_name,
+            num_concurrent_requests=args.num_concurrent_requests,
+            api_url=args.api_url,
+            max_retries=args.max_retries,
+            hedge_ratio=args.hedge_ratio,
+        )
+    assert name == "dblp", "Illegal source."
+    return dblp.Dblp(
+        num_concurrent_requests=args.num_concurrent_requests,
+        api_url=args.api_url,
+        max_retries=args.max_retries,
+    )
+
+
+def _get_journal_file(args):
+    """The journal given with --journal or, if the output goes to a file, the
+    output file name plus ".journal".
+    """
+    if args.journal:
+        return args.journal
+    if args.outfile is sys.stdout:
+        return None
+    name = getattr(args.outfile, "name", None)
+    if not isinstance(name, str):
+        return None
+    return name + ".journal"
+
+
+def save_state(filename, state, od, outcomes):
+    """Record the `outcomes` of sync_entries for the entries in `od`, as they
+    are written out, in the state file.
+    """
+    now = time.time()
+    for bib_id, (outcome, fingerprint) in outcomes.items():
+        state[bib_id] = {
+            # The hash of the input, so that syncing the same input file again
+            # skips the entry, and the hash of the entry as written, so that
+            # syncing the output file in place does, too.
+            "hash": fingerprint,
+            "output_hash": tools.fingerprint(od[bib_id]),
+            "outcome": outcome,
+            "timestamp": now,
         }
-        for future in tqdm(
-            concurrent.futures.as_completed(responses), total=len(responses)
-        ):
-            bib_id, entry = responses[future]
-            data = None
+    # Entries given up at the deadline have no state yet.
+    _write_state(filename, {bib_id: state[bib_id] for bib_id in od if bib_id in state})
+    return
+
+
+def read_state(filename):
+    try:
+        with open(filename, "r") as f:
+            return json.load(f)["entries"]
+    except (IOError, OSError, ValueError, KeyError):
+        # No or unusable state file: sync everything
+        return {}
+
+
+def _write_state(filename, entries):
+    # Write to a temporary file first so that an interruption never leaves a
+    # broken state file behind.
+    tmp = filename + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"version": 1, "entries": entries}, f, indent=1, sort_keys=True)
+    os.replace(tmp, filename)
+    return
+
+
+def _needs_update(previous, entry, max_age_days):
+    if previous is None:
+        return True
+    # Failed requests are always retried.
+    if previous["outcome"] == "error":
+        return True
+    if time.time() - previous["timestamp"] > max_age_days * 24 * 3600:
+        return True
+    return tools.fingerprint(entry) not in [
+        previous["hash"],
+        previous.get("output_hash"),
+    ]
+
+
+# pylint: disable=too-many-arguments,too-many-locals,too-many-statements
+def _lookup_in_order(
+    items,
+    source,
+    num_concurrent_requests,
+    engine="threads",
+    entry_cache=None,
+    window=1000,
+    request_stats=None,
+    batch_size=40,
+    retry_concurrency=None,
+    deadline=None,
+    journal=None,
+):
+    """Look up the entries of `items`, (key, entry, lookup) triples, in
+    `source` and yield (key, entry, data, outcome, fingerprint) in the same
+    order, every one as soon as it and all before it are done. `outcome` is one
+    of "found", "not found", "ambiguous", and "error", or None if `lookup` is
+    false; `data` is None unless the entry was found. `fingerprint` is the
+    tools.fingerprint of the entry before the lookup, or None if `lookup` is
+    false.
+
+    Entries are only started while the reorder buffer has room, so at most
+    `window` entries are in flight or waiting for an earlier one. Those with a
+    DOI are resolved in batches of up to `batch_size`; the ones not found that
+    way fall back to find_unique. With `request_stats`, the time that the
+    requests of every entry take is recorded, as are the entry cache hits.
+
+    Lookups that fail with an HttpError are tried once more when nothing else
+    is in flight, i.e., at the end or when the window is full, with at most
+    `retry_concurrency` (default: a quarter of `num_concurrent_requests`) at a
+    time, so that a struggling source isn't hit as hard again.
+
+    At the `deadline`, a time.time(), all lookups that aren't done are given up
+    and the remaining entries are yielded with the outcome None.
+
+    With a `journal`, a cache.Journal, the lookups recorded in it aren't made
+    again, and all others are recorded as they finish, unless they failed.
+    """
+    if retry_concurrency is None:
+        retry_concurrency = max(1, num_concurrent_requests // 4)
+    buffer = stream.ReorderBuffer(window)
+    items = enumerate(items)
+    upcoming = next(items, None)
+    # index -> (key, entry, fingerprint) of all entries not done yet
+    entries = {}
+    # index -> seconds spent on the requests of the entry
+    busy = collections.Counter()
+    busy_lock = threading.Lock()
+    # future -> ("dois", [(index, doi), ...]) or ("find", index)
+    pending = {}
+    doi_batch = []
+    # indices of the failed lookups to try again, and of those tried again
+    retry_queue = collections.deque()
+    retried = set()
+    # the futures of the lookups tried again
+    retrying = set()
+    breaker_waited = []
+
+    executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=num_concurrent_requests
+    )
+    if engine == "async":
+        from .. import aio
+
+        async_engine = aio.AsyncEngine(source, num_concurrent_requests)
+        submit_find = async_engine.submit
+    else:
+        assert engine == "threads", "Illegal engine."
+        async_engine = None
+
+        def submit_find(entry, record_time=None):
+            return executor.submit(_timed, record_time, source.find_unique, entry)
+
+    def timer(indices):
+        # Time spent waiting for a slot doesn't count.
+        if request_stats is None:
+            return None
+
+        def record_time(seconds):
+            with busy_lock:
+                for index in indices:
+                    busy[index] += seconds
+            return
+
+        return record_time
+
+    def complete(index, data, outcome, record=True):
+        bib_id, entry, fingerprint = entries.pop(index)
+        if journal is not None and record and outcome not in [None, "error"]:
+            journal.record(bib_id, fingerprint, outcome, data)
+        if request_stats is not None and outcome is not None:
+            with busy_lock:
+                seconds = busy.pop(index, 0.0)
+            request_stats.record_entry(bib_id, seconds, outcome)
+        return buffer.put(index, (bib_id, entry, data, outcome, fingerprint))
+
+    def found(index, data):
+        if entry_cache is not None:
+            entry_cache.set(entries[index][2], data)
+        return complete(index, data, "found")
+
+    def start(index, bib_id, entry, lookup):
+        if not lookup:
+            entries[index] = (bib_id, entry, None)
+            return complete(index, None, None)
+
+        # Fingerprint the input before it gets updated
+        fingerprint = tools.fingerprint(entry)
+        entries[index] = (bib_id, entry, fingerprint)
+
+        if journal is not None:
+            done = journal.get(bib_id, fingerprint)
+            if done is not None:
+                outcome, data = done
+                return complete(index, data, outcome, record=False)
+
+        if entry_cache is not None:
+            data = entry_cache.get(fingerprint)
+            if request_stats is not None:
+                request_stats.record_entry_cache(data is not None)
+            if data is not None:
+                return complete(index, data, "found")
+
+        if hasattr(source, "get_by_dois") and entry.fields.get("doi"):
+            # sometimes, the doi field contains a doi url
+            doi = tools.doi_from_url(entry.fields["doi"]) or entry.fields["doi"]
+            doi_batch.append((index, doi.strip()))
+            if len(doi_batch) == batch_size:
+                submit_dois()
+            return []
+
+        pending[submit_find(entry, timer([index]))] = ("find", index)
+        return []
+
+    def submit_dois():
+        dois = list(collections.OrderedDict.fromkeys(doi for _, doi in doi_batch))
+        record_time = timer([index for index, _ in doi_batch])
+        future = executor.submit(
+            _timed, record_time, source.get_by_dois, dois, batch_size
+        )
+        pending[future] = ("dois", list(doi_batch))
+        del doi_batch[:]
+        return
+
+    def submit_retries():
+        breakers = [s.circuit_breaker for s in getattr(source, "sources", [source])]
+        if all(b.is_open for b in breakers) and not breaker_waited:
+            # Give the source one chance to come back.
+            breaker_waited.append(True)
+            wait = min(b.retry_in() for b in breakers)
+            if deadline is not None:
+                wait = min(wait, max(0.0, deadline - time.time()))
+            time.sleep(wait)
+        while retry_queue and len(retrying) < retry_concurrency:
+            index = retry_queue.popleft()
+            retried.add(index)
+            future = submit_find(entries[index][1], timer([index]))
+            pending[future] = ("find", index)
+            retrying.add(future)
+        return
+
+    def finish(future):
+        retrying.discard(future)
+        kind, payload = pending.pop(future)
+        if kind == "dois":
             try:
                 data = future.result()
-            except (errors.NotFoundError, errors.UniqueError):
-                pass
             except errors.HttpError as e:
-                print(e.args[0])
-            else:
-                num_success += 1
+                # The entries of this batch fall back to find_unique.
+                print(e.args[0], file=sys.stderr)
+                data = {}
+            ready = []
+            for index, doi in payload:
+                if doi.lower() in data:
+                    ready += found(index, data[doi.lower()])
+                else:
+                    future = submit_find(entries[index][1], timer([index]))
+                    pending[future] = ("find", index)
+            return ready
+
+        index = payload
+        try:
+            return found(index, future.result())
+        except errors.NotFoundError:
+            return complete(index, None, "not found")
+        except errors.UniqueError:
+            return complete(index, None, "ambiguous")
+        except errors.HttpError as e:
+            if index not in retried:
+                retry_queue.append(index)
+                return []
+            print(e.args[0], file=sys.stderr)
+            return complete(index, None, "error")
+
+    try:
+        while True:
+            if deadline is not None and time.time() >= deadline:
+                # Give up on everything not done; it's written as it is.
+                del doi_batch[:]
+                retry_queue.clear()
+                for index in sorted(entries):
+                    for result in complete(index, None, None):
+                        yield result
+                while upcoming is not None:
+                    index, (bib_id, entry, _) = upcoming
+                    upcoming = next(items, None)
+                    for result in start(index, bib_id, entry, False):
+                        yield result
+                break
+
+            ready = []
+            while upcoming is not None and buffer.has_room(upcoming[0]):
+                index, (bib_id, entry, lookup) = upcoming
+                upcoming = next(items, None)
+                ready += start(index, bib_id, entry, lookup)
+
+            # Send a partial batch of DOIs only if the oldest entry is in it or
+            # there is nothing left to add; otherwise, completing other entries
+            # makes room for more.
+            if doi_batch and (upcoming is None or doi_batch[0][0] == buffer.next):
+                submit_dois()
 
-            od[bib_id] = tools.update(entry, data)
+            if retry_queue and len(pending) == len(retrying):
+                submit_retries()
 
-    return od, num_success
+            for result in ready:
+                yield result
+
+            if not pending:
+                assert upcoming is None and not entries
+                break
+
+            done, _ = concurrent.futures.wait(
+                pending,
+                timeout=None if deadline is None else max(0.0, deadline - time.time()),
+                return_when=concurrent.futures.FIRST_COMPLETED,
+            )
+            for future in done:
+                for result in finish(future):
+                    yield result
+    finally:
+        for future in pending:
+            future.cancel()
+        # Don't wait for lookups given up at the deadline.
+        executor.shutdown(wait=False)
+        if async_engine is not None:
+            async_engine.shutdown()
+    return
+
+
+def _timed(record_time, function, *args):
+    if record_time is None:
+        return function(*args)
+    start = time.time()
+    try:
+        return function(*args)
+    finally:
+        record_time(time.time() - start)
 
 
 def _get_parser():
@@ -94,12 +550,41 @@ def _get_parser():
         default=sys.stdout,
         help="output BibTeX file (default: stdout)",
     )
+    add_arguments(parser)
+    add_profile_arguments(parser)
+    return parser
+
+
+def add_arguments(parser):
+    """Add the options of the sync stage to `parser`.
+    """
     parser.add_argument(
         "-s",
         "--source",
-        choices=["crossref", "dblp"],
+        choices=["crossref", "dblp", "race"],
         default="crossref",
-        help="data source (default: crossref)",
+        help=(
+            "data source; race asks Crossref and DBLP at the same time and takes "
+            "the first unique match (default: crossref)"
+        ),
+    )
+    parser.add_argument(
+        "--merge-wait",
+        type=float,
+        default=0.0,
+        metavar="SECONDS",
+        help=(
+            "with --source race, wait this long for the slower source and fill "
+            "in what the first match lacks if both found the same DOI (default: 0)"
+        ),
+    )
+    parser.add_argument(
+        "--api-url",
+        metavar="URL",
+        help=(
+            "API of the data source, e.g., of a betterbib-standin server "
+            "(default: the real one)"
+        ),
     )
     parser.add_argument(
         "-l",
@@ -115,4 +600,103 @@ def _get_parser():
         metavar="N",
         help="number of concurrent HTTPS requests (default: 10)",
     )
-    return parser
+    parser.add_argument(
+        "-e",
+        "--engine",
+        choices=["threads", "async"],
+        default="threads",
+        help=(
+            "run the requests in a thread pool or on an asyncio event loop; "
+            "async needs aiohttp and scales to many more concurrent requests "
+            "(default: threads)"
+        ),
+    )
+    parser.add_argument(
+        "--max-retries",
+        type=int,
+        metavar="N",
+        help=(
+            "retry failed requests up to N times with exponential backoff "
+            "(default: 3, or max_retries in the [NETWORK] section of the config)"
+        ),
+    )
+    parser.add_argument(
+        "--journal",
+        metavar="FILE",
+        help=(
+            "record finished lookups in this file as they happen "
+            "(default: the output file plus .journal, removed when done)"
+        ),
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="skip the lookups recorded in the journal of an interrupted run",
+    )
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        metavar="SECONDS",
+        help=(
+            "stop looking up entries this many seconds after the start and write "
+            "the ones not done yet unchanged (default: no deadline)"
+        ),
+    )
+    parser.add_argument(
+        "--hedge-ratio",
+        type=float,
+        metavar="R",
+        help=(
+            "send Crossref searches and DOI lookups that take longer than 95%% "
+            "of them again, for at most this fraction of the requests; 0 turns "
+            "it off (default: 0.05, or hedge_ratio in the [NETWORK] section of "
+            "the config)"
+        ),
+    )
+    parser.add_argument(
+        "--window",
+        type=int,
+        default=1000,
+        metavar="N",
+        help=(
+            "work on at most N entries beyond the last one written; each entry "
+            "is written as soon as all entries before it are done (default: 1000)"
+        ),
+    )
+    parser.add_argument(
+        "--entry-cache-days",
+        type=float,
+        default=30,
+        metavar="DAYS",
+        help=(
+            "reuse results for unchanged entries for this many days, "
+            "0 disables the cache (default: 30)"
+        ),
+    )
+    parser.add_argument(
+        "--state",
+        metavar="FILE",
+        help=(
+            "record the outcome per entry in this file and, in later runs, only "
+            "sync entries that are new or changed since (default: sync all)"
+        ),
+    )
+    parser.add_argument(
+        "--stats",
+        metavar="FILE",
+        help=(
+            "write a JSON report of the requests, cache hits, latencies and the "
+            "slowest entries to this file (default: none)"
+        ),
+    )
+    parser.add_argument(
+        "--state-max-age-days",
+        type=float,
+        default=30,
+        metavar="DAYS",
+        help=(
+            "with --state, sync unchanged entries again if their last sync is "
+            "older than this (default: 30)"
+        ),
+    )
+    return
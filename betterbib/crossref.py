@@ -3,17 +3,25 @@
 from __future__ import print_function
 
 import codecs
+import concurrent.futures
+import hashlib
+import os
 import re
+import threading
 
 import pybtex
 import pybtex.database
 import requests
-import requests_cache
 
-from .__about__ import __version__, __website__, __author_email__
+from . import hedge, retry, tools
+from .cache import Store
 from .errors import NotFoundError, HttpError
+from .ratelimit import RateLimiter
+from .session import create_session, user_agent
 from .tools import pybtex_to_dict, heuristic_unique_result
 
+_default_api_url = "https://api.crossref.org/works"
+
 
 def _bibtex_to_crossref_type(bibtex_type):
     _bibtex_to_crossref_map = {
@@ -32,18 +40,136 @@ def _bibtex_to_crossref_type(bibtex_type):
         return []
 
 
+def _crossref_to_bibtex_type(crossref_type):
+    # All cases but book-chapter
+    _crossref_to_bibtex_map = {
+        "book": "book",
+        "dataset": "misc",
+        "journal-article": "article",
+        "monograph": "book",
+        "other": "misc",
+        "proceedings": "proceedings",
+        "proceedings-article": "inproceedings",
+        "report": "techreport",
+    }
+    return _crossref_to_bibtex_map[crossref_type]
+
+
+def _get_book_doi(entry):
+    # To get the book, make use of the fact that the chapter DOIs are the book
+    # DOI plus some appendix, e.g., .ch3, _3, etc. In other words: Strip the
+    # last digits plus whatever is nondigit before it.
+    a = re.match("(.*?)([^0-9]+[0-9]+)$", entry["DOI"])
+    if a is None:
+        return None
+    return a.group(1)
+
+
+def _book_chapter_type_from_item(item):
+    # Chapters that list editors belong to edited collections; no need to look
+    # at the book then.
+    if item.get("editor"):
+        return "incollection"
+    return None
+
+
+def _book_chapter_type(book_data):
+    # If the containing book has authors, consider it a monograph and use
+    # inbook; otherwise incollection.
+    if book_data is not None and "author" in book_data["message"]:
+        return "inbook"
+    return "incollection"
+
+
 class Crossref(object):
     """
     Documentation of the Crossref Search API:
     <https://github.com/Crossref/rest-api-doc/blob/master/rest_api.md>.
+
+    The request rate is limited according to the `X-Rate-Limit-*` headers sent
+    by Crossref; the budget is shared by all betterbib processes on the host.
+    A contact address for the polite pool and a Metadata Plus token can be set
+    in the config file:
+    ```
+    [CROSSREF]
+    mailto=me@example.com
+    plus_token=...
+    ```
+    `api_url`, as argument or in the config file, points betterbib at another
+    server, e.g., a StandIn. Failed requests are retried up to `max_retries`
+    times (default: from the config file, see betterbib.retry), and requests
+    stop for a while once Crossref is clearly down. Searches and DOI lookups
+    that take unusually long are sent again, for at most a fraction
+    `hedge_ratio` of the requests (default: from the config file, see
+    betterbib.hedge).
     """
 
-    def __init__(self, prefer_long_journal_name=False):
-        self.api_url = "https://api.crossref.org/works"
+    def __init__(
+        self,
+        prefer_long_journal_name=False,
+        num_concurrent_requests=10,
+        api_url=None,
+        max_retries=None,
+        hedge_ratio=None,
+    ):
+        self.api_url = api_url or tools.get_config_value(
+            "CROSSREF", "api_url", _default_api_url
+        )
         self.prefer_long_journal_name = prefer_long_journal_name
 
-        requests_cache.install_cache("betterbib_cache", expire_after=3600)
-        # requests_cache.remove_expired_responses()
+        mailto = tools.get_config_value("CROSSREF", "mailto")
+        headers = {"User-Agent": user_agent(mailto)}
+        plus_token = tools.get_config_value("CROSSREF", "plus_token")
+        if plus_token:
+            headers["Crossref-Plus-API-Token"] = "Bearer " + plus_token.strip()
+            # Plus users have a budget of their own.
+            state_file = "crossref-plus-ratelimit.json"
+        else:
+            state_file = "crossref-ratelimit.json"
+        if self.api_url != _default_api_url:
+            # Keep the budget of the real API out of it.
+            state_file = "ratelimit-{}.json".format(
+                hashlib.sha1(self.api_url.encode("utf-8")).hexdigest()[:10]
+            )
+
+        cache_dir = tools.get_cache_dir()
+        self.rate_limiter = RateLimiter(os.path.join(cache_dir, state_file))
+        self.retry_policy, self.circuit_breaker = retry.create("Crossref", max_retries)
+        self.hedger = hedge.create(hedge_ratio, num_concurrent_requests)
+
+        # One pooled keep-alive session shared by all worker threads, with a
+        # response cache of its own
+        cache_settings = tools.get_http_cache_settings()
+        doi_expire_after = cache_settings["doi_expire_after"]
+        self.session = create_session(
+            num_concurrent_requests,
+            headers=headers,
+            rate_limiter=self.rate_limiter,
+            retry_policy=self.retry_policy,
+            circuit_breaker=self.circuit_breaker,
+            cache_name=os.path.join(cache_dir, "crossref.sqlite"),
+            max_size=cache_settings["max_size"],
+            expire_after=cache_settings["search_expire_after"],
+            # Works looked up by DOI hardly ever change.
+            urls_expire_after={
+                re.compile(re.escape(self.api_url + "/")): doi_expire_after,
+                re.compile(re.escape(self.api_url + "?filter=doi")): doi_expire_after,
+            },
+        )
+
+        # The types of the books containing chapters, shared by all chapters
+        # of a book. The futures make sure that concurrent lookups of the same
+        # book only make one request; the store keeps the types across runs.
+        self._book_types = {}
+        self._book_types_lock = threading.Lock()
+        self.book_type_store = Store(
+            os.path.join(cache_dir, "crossref-books.sqlite"),
+            table="book_types",
+            expire_after=365 * 24 * 3600,
+        )
+
+        # a RequestStats to record all requests in
+        self.stats = None
         return
 
     def _crossref_to_bibtex_type(self, entry):
@@ -53,63 +179,130 @@ class Crossref(object):
         # incollection.
         crossref_type = entry["type"]
         if crossref_type == "book-chapter":
+            bibtex_type = _book_chapter_type_from_item(entry)
+            if bibtex_type is not None:
+                return bibtex_type
+
             # Get the containing book, and see if it has authors or editors. If
             # authors, consider it a monograph and use inbook; otherwise
             # incollection.
-            # To get the book, make use of the fact that the chapter DOIs are
-            # the book DOI plus some appendix, e.g., .ch3, _3, etc. In other
-            # words: Strip the last digits plus whatever is nondigit before it.
-            a = re.match("(.*?)([^0-9]+[0-9]+)$", entry["DOI"])
-            if a is None:
+            book_doi = _get_book_doi(entry)
+            if book_doi is None:
                 # The DOI doesn't have that structure; assume 'incollection'.
                 return "incollection"
 
-            book_doi = a.group(1)
+            return self._get_book_chapter_type(book_doi)
 
-            headers = {
-                "User-Agent": "betterbib/{} ({}; mailto:{})".format(
-                    __version__, __website__, __author_email__
-                )
-            }
+        return _crossref_to_bibtex_type(crossref_type)
 
-            # Try to get the book data
-            r = requests.get(self.api_url + "/" + book_doi, headers=headers)
-            if r.ok:
-                book_data = r.json()
-                if "author" in book_data["message"]:
-                    return "inbook"
-            # else
-            return "incollection"
-
-        # All other cases
-        _crossref_to_bibtex_type = {
-            "book": "book",
-            "dataset": "misc",
-            "journal-article": "article",
-            "monograph": "book",
-            "other": "misc",
-            "proceedings": "proceedings",
-            "proceedings-article": "inproceedings",
-            "report": "techreport",
-        }
-        return _crossref_to_bibtex_type[crossref_type]
+    def _get_book_chapter_type(self, book_doi):
+        with self._book_types_lock:
+            future = self._book_types.get(book_doi)
+            is_owner = future is None
+            if is_owner:
+                future = concurrent.futures.Future()
+                self._book_types[book_doi] = future
+
+        if not is_owner:
+            # Someone else is already looking up this book
+            return future.result()
+
+        try:
+            bibtex_type = self.book_type_store.get(book_doi)
+            if bibtex_type is None:
+                # Try to get the book data
+                try:
+                    r = self._get("book-parent", self.api_url + "/" + book_doi)
+                except HttpError:
+                    r = None
+                if r is not None and r.ok:
+                    bibtex_type = _book_chapter_type(r.json())
+                    self.book_type_store.set(book_doi, bibtex_type)
+                else:
+                    bibtex_type = _book_chapter_type(None)
+                    # Don't remember failures; the next chapter tries again.
+                    with self._book_types_lock:
+                        del self._book_types[book_doi]
+        except Exception as e:  # pylint: disable=broad-except
+            with self._book_types_lock:
+                self._book_types.pop(book_doi, None)
+            future.set_exception(e)
+            raise
+
+        future.set_result(bibtex_type)
+        return bibtex_type
+
+    def _get(self, endpoint, url, hedged=False, **kwargs):
+        if hedged:
+            return self.hedger.call(endpoint, self._send, endpoint, url, **kwargs)
+        return self._send(endpoint, url, **kwargs)
+
+    def _send(self, endpoint, url, **kwargs):
+        try:
+            if self.stats is None:
+                return self.session.get(url, **kwargs)
+            return self.stats.get(self.session, "crossref", endpoint, url, **kwargs)
+        except requests.RequestException as e:
+            # connection errors and timeouts, after all retries
+            raise HttpError("Failed request to {} ({})".format(url, e))
 
     def get_by_doi(self, doi):
-        headers = {
-            "User-Agent": "betterbib/{} ({}; mailto:{})".format(
-                __version__, __website__, __author_email__
-            )
-        }
         # https://api.crossref.org/works/10.1137/110820713
-        r = requests.get(self.api_url + "/" + doi, headers=headers)
-        assert r.ok
+        r = self._get("doi", self.api_url + "/" + doi, hedged=True)
+        if r.status_code == 404:
+            raise NotFoundError("Unknown DOI {}".format(doi))
+        if not r.ok:
+            raise HttpError("Failed request to {}".format(self.api_url))
         data = r.json()
         result = data["message"]
         return self._crossref_to_pybtex(result)
 
+    def get_by_dois(self, dois, batch_size=40):
+        """Resolve many DOIs with one request per `batch_size` DOIs. Returns a
+        dictionary mapping the lowercase DOIs to their entries; DOIs that
+        Crossref doesn't know are left out.
+        """
+        dois = list(dois)
+
+        out = {}
+        # Commas would break the filter syntax; resolve those one by one.
+        for doi in [doi for doi in dois if "," in doi]:
+            try:
+                out[doi.lower()] = self.get_by_doi(doi)
+            except NotFoundError:
+                pass
+
+        dois = [doi for doi in dois if "," not in doi]
+        for k in range(0, len(dois), batch_size):
+            batch = dois[k : k + batch_size]
+            # Filters of the same name are OR-ed, e.g.,
+            # https://api.crossref.org/works?filter=doi:10.1/a,doi:10.1/b&rows=2
+            params = {
+                "filter": ",".join("doi:{}".format(doi) for doi in batch),
+                "rows": len(batch),
+            }
+            r = self._get("doi", self.api_url, params=params)
+            if not r.ok:
+                raise HttpError("Failed request to {}".format(self.api_url))
+
+            for item in r.json()["message"]["items"]:
+                out[item["DOI"].lower()] = self._crossref_to_pybtex(item)
+
+        return out
+
     def find_unique(self, entry):
         d = pybtex_to_dict(entry)
 
+        r = self._get(
+            "search", self.api_url, hedged=True, params=self._get_search_params(d)
+        )
+        if not r.ok:
+            raise HttpError("Failed request to {}".format(self.api_url))
+
+        return self._crossref_to_pybtex(self._get_unique_item(r.json(), d))
+
+    @staticmethod
+    def _get_search_params(d):
         L = []
 
         keys = [
@@ -144,35 +337,28 @@ class Crossref(object):
 
         params = {"query": payload, "rows": 2}  # max number of results
 
-        crossref_types = _bibtex_to_crossref_type(entry.type)
+        crossref_types = _bibtex_to_crossref_type(d["genre"])
         if crossref_types:
             params["filter"] = ",".join("type:{}".format(ct) for ct in crossref_types)
 
-        # crossref etiquette,
-        # <https://github.com/CrossRef/rest-api-doc#good-manners--more-reliable-service>
-        headers = {
-            "User-Agent": "betterbib/{} ({}; mailto:{})".format(
-                __version__, __website__, __author_email__
-            )
-        }
-
-        r = requests.get(self.api_url, params=params, headers=headers)
-        if not r.ok:
-            raise HttpError("Failed request to {}".format(self.api_url))
+        return params
 
-        results = r.json()["message"]["items"]
+    @staticmethod
+    def _get_unique_item(data, d):
+        results = data["message"]["items"]
 
         if not results:
             raise NotFoundError("No match")
 
         if len(results) == 1:
-            return self._crossref_to_pybtex(results[0])
+            return results[0]
 
-        return self._crossref_to_pybtex(heuristic_unique_result(results, d))
+        return heuristic_unique_result(results, d)
 
     # pylint: disable=too-many-locals
-    def _crossref_to_pybtex(self, data):
-        """Translate a given data set into the bibtex data structure.
+    def _crossref_to_pybtex(self, data, bibtex_type=None):
+        """Translate a given data set into the bibtex data structure. If
+        `bibtex_type` isn't given, it is derived from the data.
         """
         # A typcial search result is
         #
@@ -263,7 +449,8 @@ class Crossref(object):
             publisher = None
 
         # translate the type
-        bibtex_type = self._crossref_to_bibtex_type(data)
+        if bibtex_type is None:
+            bibtex_type = self._crossref_to_bibtex_type(data)
         if bibtex_type == "article":
             if container_title:
                 fields_dict["journal"] = container_title
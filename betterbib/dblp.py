@@ -3,13 +3,15 @@
 from __future__ import print_function
 
 import codecs
+import os
 
 import pybtex
 import pybtex.database
 import requests
-import requests_cache
 
+from . import retry, tools
 from .errors import NotFoundError, HttpError
+from .session import create_session
 from .tools import pybtex_to_dict, heuristic_unique_result
 
 
@@ -102,18 +104,55 @@ class Dblp(object):
     """
     Documentation of the DBLP Search API:
     <http://dblp.uni-trier.de/faq/How+to+use+the+dblp+search+API.html>.
-    """
 
-    def __init__(self):
-        self.api_url = "https://dblp.org/search/publ/api"
+    `api_url`, as argument or in the DBLP section of the config file, points
+    betterbib at another server, e.g., a StandIn. Failed requests are retried
+    up to `max_retries` times (default: from the config file, see
+    betterbib.retry), and requests stop for a while once DBLP is clearly down.
+    """
 
-        requests_cache.install_cache("betterbib_cache", expire_after=3600)
-        # requests_cache.remove_expired_responses()
+    def __init__(self, num_concurrent_requests=10, api_url=None, max_retries=None):
+        self.api_url = api_url or tools.get_config_value(
+            "DBLP", "api_url", "https://dblp.org/search/publ/api"
+        )
+
+        # One pooled keep-alive session shared by all worker threads, with a
+        # response cache of its own
+        cache_settings = tools.get_http_cache_settings()
+        self.retry_policy, self.circuit_breaker = retry.create("DBLP", max_retries)
+        self.session = create_session(
+            num_concurrent_requests,
+            retry_policy=self.retry_policy,
+            circuit_breaker=self.circuit_breaker,
+            cache_name=os.path.join(tools.get_cache_dir(), "dblp.sqlite"),
+            max_size=cache_settings["max_size"],
+            expire_after=cache_settings["search_expire_after"],
+        )
+
+        # a RequestStats to record all requests in
+        self.stats = None
         return
 
+    def _get(self, endpoint, url, **kwargs):
+        try:
+            if self.stats is None:
+                return self.session.get(url, **kwargs)
+            return self.stats.get(self.session, "dblp", endpoint, url, **kwargs)
+        except requests.RequestException as e:
+            # connection errors and timeouts, after all retries
+            raise HttpError("Failed request to {} ({})".format(url, e))
+
     def find_unique(self, entry):
         d = pybtex_to_dict(entry)
 
+        r = self._get("search", self.api_url, params=self._get_search_params(d))
+        if not r.ok:
+            raise HttpError("Failed request to {}".format(self.api_url))
+
+        return _dblp_to_pybtex(self._get_unique_item(r.json(), d))
+
+    @staticmethod
+    def _get_search_params(d):
         # Be stingy on the search terms. DBLP search is not fuzzy, so one
         # misspelled word results in 0 hits.
         L = []
@@ -136,24 +175,20 @@ class Dblp(object):
         # <api>?q=vanroose+schl%C3%B6mer&h=5
         payload = codecs.decode(" ".join(L), "ulatex").replace(" ", "+")
 
-        params = {
+        return {
             "q": payload,
             "format": "json",
             "h": 2,  # max number of results (hits)
         }
 
-        r = requests.get(self.api_url, params=params)
-        if not r.ok:
-            raise HttpError("Failed request to {}".format(self.api_url))
-
-        data = r.json()
-
+    @staticmethod
+    def _get_unique_item(data, d):
         try:
             results = data["result"]["hits"]["hit"]
         except KeyError:
             raise NotFoundError("No match")
 
         if len(results) == 1:
-            return _dblp_to_pybtex(results[0]["info"])
+            return results[0]["info"]
 
-        return _dblp_to_pybtex(heuristic_unique_result(results, d)["info"])
+        return heuristic_unique_result(results, d)["info"]
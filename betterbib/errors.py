@@ -12,3 +12,11 @@ class UniqueError(Exception):
 
 class HttpError(Exception):
     pass
+
+
+class CircuitOpenError(HttpError):
+    pass
+
+
+class DeadlineError(HttpError):
+    pass
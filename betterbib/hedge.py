@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+#
+"""Hedged requests: if a request hasn't answered within the usual time, send
+it again and take whichever answer comes first. This cuts the few very slow
+requests that hold up the end of a sync. Set in the NETWORK section of the
+config file, e.g.,
+```
+[NETWORK]
+hedge_ratio=0.05
+hedge_percentile=95
+```
+"""
+from __future__ import division
+
+import collections
+import concurrent.futures
+import contextlib
+import contextvars
+import threading
+import time
+
+from . import stats, tools
+
+
+class Attempts(object):
+    """What a hedged request is doing: since when its current attempt has been
+    out on the network, None while it waits for the rate limiter or a retry,
+    and how long the last attempt took to answer.
+    """
+
+    def __init__(self):
+        self.started = None
+        self.seconds = None
+        return
+
+
+# the Attempts of the hedged request that the current thread or task makes
+_attempts = contextvars.ContextVar("attempts", default=None)
+
+
+@contextlib.contextmanager
+def tracking(attempts):
+    """Report the attempts of the request made in the block, in this thread or
+    task, to `attempts`, an Attempts.
+    """
+    token = _attempts.set(attempts)
+    try:
+        yield attempts
+    finally:
+        _attempts.reset(token)
+
+
+def attempt_started():
+    """Called by the transports right before a request goes out.
+    """
+    attempts = _attempts.get()
+    if attempts is not None:
+        attempts.started = time.time()
+    return
+
+
+def attempt_done(answered=True):
+    """Called by the transports when the request has been `answered`, or
+    has failed.
+    """
+    attempts = _attempts.get()
+    if attempts is not None and attempts.started is not None:
+        if answered:
+            attempts.seconds = time.time() - attempts.started
+        attempts.started = None
+    return
+
+
+def get_hedge_settings():
+    """Settings of the hedged requests from the [NETWORK] section of the
+    config file.
+    """
+    return {
+        "max_ratio": float(tools.get_config_value("NETWORK", "hedge_ratio", 0.05)),
+        "percentile": float(tools.get_config_value("NETWORK", "hedge_percentile", 95)),
+    }
+
+
+class Hedger(object):
+    """Sends a duplicate of a request whose attempt on the network hasn't
+    answered after the `percentile`-th percentile of the latencies of the last
+    `window` attempts of the same kind, e.g., an endpoint, once there are
+    `min_samples` of them. Requests that wait for the rate limiter or a retry
+    aren't duplicated, and the waiting doesn't count as latency. At most a
+    fraction `max_ratio` of all requests are duplicated, so that the source
+    sees only that many more. The transports report the attempts through
+    attempt_started and attempt_done.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        max_ratio=0.05,
+        percentile=95,
+        window=1000,
+        min_samples=20,
+        num_concurrent_requests=10,
+    ):
+        self.max_ratio = max_ratio
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.num_requests = 0
+        self.num_hedges = 0
+        self.num_wins = 0
+        self._latencies = collections.defaultdict(
+            lambda: collections.deque(maxlen=window)
+        )
+        self._delays = {}
+        self._lock = threading.Lock()
+        # The losers run on until they are done, so leave room for them.
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=3 * num_concurrent_requests
+        )
+        return
+
+    def record(self, kind, seconds):
+        """Record the latency of a request of `kind` that went to the network.
+        """
+        with self._lock:
+            self.num_requests += 1
+            latencies = self._latencies[kind]
+            latencies.append(seconds)
+            n = len(latencies)
+            # Sorting is cheap, but not for every request.
+            if n >= self.min_samples and (kind not in self._delays or n % 50 == 0):
+                self._delays[kind] = stats.percentile(
+                    sorted(latencies), self.percentile
+                )
+        return
+
+    def delay(self, kind):
+        """Seconds after which to hedge a request of `kind`, or None if it's
+        too early to tell or hedging is off.
+        """
+        if self.max_ratio <= 0.0:
+            return None
+        return self._delays.get(kind)
+
+    def won(self):
+        """Record that the hedge answered first.
+        """
+        with self._lock:
+            self.num_wins += 1
+        return
+
+    def allow(self):
+        """Whether another hedge fits into the budget; counts it if so.
+        """
+        with self._lock:
+            if self.num_hedges + 1 > self.max_ratio * self.num_requests:
+                return False
+            self.num_hedges += 1
+        return True
+
+    def _timed(self, kind, attempts, function, *args, **kwargs):
+        with tracking(attempts):
+            result = function(*args, **kwargs)
+        # Cache hits never went out.
+        if attempts.seconds is not None:
+            self.record(kind, attempts.seconds)
+        return result
+
+    def call(self, kind, function, *args, **kwargs):
+        """`function(*args, **kwargs)`, a request of `kind`, hedged. If the
+        first call raises, the result of the hedge is taken, and the other way
+        around.
+        """
+        delay = self.delay(kind)
+        attempts = Attempts()
+        if delay is None:
+            return self._timed(kind, attempts, function, *args, **kwargs)
+
+        first = self._executor.submit(
+            self._timed, kind, attempts, function, *args, **kwargs
+        )
+        while True:
+            timeout = hedge_in(attempts, delay)
+            if timeout <= 0.0:
+                break
+            try:
+                return first.result(timeout=timeout)
+            except concurrent.futures.TimeoutError:
+                pass
+        if not self.allow():
+            return first.result()
+
+        second = self._executor.submit(
+            self._timed, kind, Attempts(), function, *args, **kwargs
+        )
+        futures = [first, second]
+        done, pending = concurrent.futures.wait(
+            futures, return_when=concurrent.futures.FIRST_COMPLETED
+        )
+        winners = [f for f in futures if f in done and f.exception() is None]
+        if not winners:
+            # The first one to finish failed; wait for the other.
+            concurrent.futures.wait(pending)
+            winners = [f for f in futures if f.exception() is None]
+        if not winners:
+            return first.result()
+        if winners[0] is second:
+            self.won()
+        return winners[0].result()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+        return
+
+
+def hedge_in(attempts, delay):
+    """Seconds until a request whose `attempts` are as given is to be hedged
+    after `delay`, or until it's time to look again if it isn't on the network.
+    """
+    started = attempts.started
+    if started is None:
+        return delay / 4
+    return started + delay - time.time()
+
+
+def create(max_ratio=None, num_concurrent_requests=10):
+    """The Hedger according to the config file; `max_ratio`, if given,
+    overrides it.
+    """
+    settings = get_hedge_settings()
+    if max_ratio is None:
+        max_ratio = settings["max_ratio"]
+    return Hedger(
+        max_ratio,
+        settings["percentile"],
+        num_concurrent_requests=num_concurrent_requests,
+    )
@@ -0,0 +1,418 @@
+# -*- coding: utf-8 -*-
+#
+"""Compiled index of journal names and their abbreviations.
+
+The index is a single binary file that is memory-mapped, so loading it costs
+next to nothing and several processes share the same pages. It consists of
+open-addressing hash tables that point into one table of UTF-8 strings. All
+integers are little-endian uint32.
+```
+header     magic "BBJI", version, checksum of the source (see get_checksum),
+           number of strings, number of tables, bytes per posting (2 or 4)
+directory  (offset, number of slots) of every table
+offsets    (number of strings + 1) offsets into the string data
+tables     slots of (key string id + 1, value); 0 marks an empty slot
+names      per direction, the number of normalized names and their string ids
+postings   lists of normalized name numbers, each one preceded by its length
+strings    the concatenated UTF-8 strings
+```
+For each direction, long -> abbreviated and abbreviated -> long, there are
+three tables:
+
+ * the names themselves, with the id of the string they map to,
+ * the normalized names (see normalize), with the id of the name,
+ * the trigrams of the normalized names, with the offset of the list of the
+   numbers of the normalized names that contain them.
+
+The postings make up most of the file, so they refer to the normalized names
+by their number within the direction, which usually fits into two bytes.
+"""
+import array
+import codecs
+import collections
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import unicodedata
+import zlib
+
+# for "ulatex" codec
+import latexcodec  # noqa
+
+_MAGIC = b"BBJI"
+_VERSION = 3
+_HEADER = struct.Struct("<4sIIIII")
+_SLOT = struct.Struct("<II")
+_UINT = struct.Struct("<I")
+
+# tables per direction
+_EXACT, _NORMALIZED, _TRIGRAMS = range(3)
+_ABBREVIATE, _EXPAND = 0, 3
+
+_this_dir = os.path.dirname(os.path.realpath(__file__))
+json_file = os.path.join(_this_dir, "data", "journals.json")
+_packaged_index_file = os.path.join(_this_dir, "data", "journals.idx")
+
+# `key` is the journal name from the table that was matched, `name` the name it
+# maps to. `method` is one of "exact", "normalized", "fuzzy"; `confidence`
+# ranges from 0 to 1.
+JournalMatch = collections.namedtuple(
+    "JournalMatch", ["key", "name", "method", "confidence"]
+)
+
+
+def normalize(name):
+    """Reduce a journal name to lowercase ASCII words, e.g.,
+    `Journal of Physics \\& {Chemistry}.` becomes
+    `journal of physics and chemistry`.
+    """
+    if "\\" in name:
+        try:
+            name = codecs.decode(name, "ulatex")
+        except Exception:  # pylint: disable=broad-except
+            pass
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(char for char in name if not unicodedata.combining(char))
+    # braces only group, as in `f{\"u}r` or `{IEEE}`
+    name = name.replace("{", "").replace("}", "")
+    name = name.lower().replace("&", " and ")
+    name = re.sub(r"[\W_]+", " ", name)
+    return " ".join(name.split())
+
+
+def _trigrams(normalized_name):
+    padded = "  " + normalized_name + " "
+    return set(padded[k : k + 3] for k in range(len(padded) - 2))
+
+
+def _dice(a, b):
+    if not a or not b:
+        return 0.0
+    return 2.0 * len(a & b) / (len(a) + len(b))
+
+
+def _hash(data):
+    return zlib.crc32(data) & 0xFFFFFFFF
+
+
+def get_checksum(filename):
+    """Checksum of the file, e.g., journals.json, that an index is built
+    from. It is stored in the index, so that an index that's out of date can
+    be told apart.
+    """
+    with open(filename, "rb") as f:
+        return _hash(f.read())
+
+
+def _num_slots(n):
+    # at most half full to keep the probe sequences short
+    num_slots = 2
+    while num_slots < 2 * n:
+        num_slots *= 2
+    return num_slots
+
+
+def _hash_table(items, ids):
+    num_slots = _num_slots(len(items))
+    slots = [(0, 0)] * num_slots
+    mask = num_slots - 1
+    for key, value in items:
+        k = _hash(key.encode("utf-8")) & mask
+        while slots[k][0] != 0:
+            k = (k + 1) & mask
+        slots[k] = (ids[key] + 1, value)
+    return slots
+
+
+def build_index(table, filename, checksum=0):
+    """Write the index for `table`, a dictionary that maps long journal names
+    to their abbreviations (see tools/create_json), to `filename`. `checksum`
+    is that of the file `table` comes from, see get_checksum.
+    """
+    # Several journals may share an abbreviation. Like inverting the dictionary
+    # in Python, the last one wins.
+    inverse = {}
+    for key, value in table.items():
+        inverse[value] = key
+
+    strings = []
+    ids = {}
+
+    def get_id(string):
+        if string not in ids:
+            ids[string] = len(strings)
+            strings.append(string.encode("utf-8"))
+        return ids[string]
+
+    tables = []
+    names = []
+    postings = []
+    for mapping in [table, inverse]:
+        tables.append([(key, get_id(value)) for key, value in mapping.items()])
+
+        # If several names have the same normalized form, the first one wins.
+        normalized = collections.OrderedDict()
+        for key in mapping:
+            normalized.setdefault(normalize(key), get_id(key))
+        tables.append(list(normalized.items()))
+
+        names.append([get_id(name) for name in normalized])
+        trigram_postings = collections.OrderedDict()
+        for number, name in enumerate(normalized):
+            for trigram in sorted(_trigrams(name)):
+                trigram_postings.setdefault(trigram, []).append(number)
+        items = []
+        for trigram, numbers in trigram_postings.items():
+            get_id(trigram)
+            items.append((trigram, len(postings)))
+            postings.append(len(numbers))
+            postings.extend(numbers)
+        tables.append(items)
+
+    posting_format = "H" if max(len(n) for n in names) < 2 ** 16 else "I"
+
+    slots = [_hash_table(items, ids) for items in tables]
+
+    offsets = [0]
+    for string in strings:
+        offsets.append(offsets[-1] + len(string))
+
+    directory = []
+    offset = _HEADER.size + _SLOT.size * len(slots) + _UINT.size * len(offsets)
+    for s in slots:
+        directory.append((offset, len(s)))
+        offset += _SLOT.size * len(s)
+
+    # Other processes may be building the same index.
+    tmp = "{}.{}.tmp".format(filename, os.getpid())
+    with open(tmp, "wb") as f:
+        f.write(
+            _HEADER.pack(
+                _MAGIC,
+                _VERSION,
+                checksum,
+                len(strings),
+                len(slots),
+                struct.calcsize(posting_format),
+            )
+        )
+        for entry in directory:
+            f.write(_SLOT.pack(*entry))
+        f.write(struct.pack("<{}I".format(len(offsets)), *offsets))
+        for s in slots:
+            for slot in s:
+                f.write(_SLOT.pack(*slot))
+        for ids in names:
+            f.write(struct.pack("<{}I".format(len(ids) + 1), len(ids), *ids))
+        f.write(struct.pack("<{}{}".format(len(postings), posting_format), *postings))
+        f.write(b"".join(strings))
+    os.replace(tmp, filename)
+    return
+
+
+def _read_checksum(filename):
+    # The checksum in the header of an index, or None if the file is missing
+    # or no index of this version.
+    try:
+        with open(filename, "rb") as f:
+            header = f.read(_HEADER.size)
+    except (IOError, OSError):
+        return None
+    if len(header) < _HEADER.size:
+        return None
+    magic, version, checksum = _HEADER.unpack(header)[:3]
+    if magic != _MAGIC or version != _VERSION:
+        return None
+    return checksum
+
+
+def get_index_file():
+    """The index of data/journals.json. Releases ship it prebuilt as
+    data/journals.idx (see `make upload`). If that is missing, as in a git
+    checkout, or out of date, the index is built in the cache directory on
+    first use.
+    """
+    checksum = get_checksum(json_file)
+    if _read_checksum(_packaged_index_file) == checksum:
+        return _packaged_index_file
+
+    from .tools import get_cache_dir
+
+    filename = os.path.join(
+        get_cache_dir(), "journals-{}-{:08x}.idx".format(_VERSION, checksum)
+    )
+    if _read_checksum(filename) != checksum:
+        if not os.path.exists(get_cache_dir()):
+            os.makedirs(get_cache_dir())
+        with open(json_file, "r") as f:
+            table = json.load(f)
+        build_index(table, filename, checksum)
+    return filename
+
+
+class JournalIndex(object):
+    """Read-only view of an index file created by build_index.
+    """
+
+    def __init__(self, filename=None):
+        if filename is None:
+            filename = get_index_file()
+
+        with open(filename, "rb") as f:
+            self._buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        header = _HEADER.unpack_from(self._buf, 0)
+        magic, version, _, num_strings, num_tables, posting_size = header
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(
+                "{} is not a journal index (version {})".format(filename, _VERSION)
+            )
+
+        self.num_strings = num_strings
+        self._tables = [
+            _SLOT.unpack_from(self._buf, _HEADER.size + _SLOT.size * k)
+            for k in range(num_tables)
+        ]
+        self._offsets = _HEADER.size + _SLOT.size * num_tables
+
+        last_table, last_num_slots = self._tables[-1]
+        offset = last_table + _SLOT.size * last_num_slots
+        # string ids of the normalized names per direction
+        self._names = {}
+        for base in [_ABBREVIATE, _EXPAND]:
+            (n,) = _UINT.unpack_from(self._buf, offset)
+            self._names[base] = offset + _UINT.size
+            offset += _UINT.size * (n + 1)
+
+        self._posting_typecode = "H" if posting_size == 2 else "I"
+        self._posting_size = posting_size
+        self._postings_start = offset
+
+        (num_bytes,) = _UINT.unpack_from(
+            self._buf, self._offsets + _UINT.size * num_strings
+        )
+        self._strings = len(self._buf) - num_bytes
+        return
+
+    def _string_bytes(self, k):
+        start, end = _SLOT.unpack_from(self._buf, self._offsets + _UINT.size * k)
+        return self._buf[self._strings + start : self._strings + end]
+
+    def _string(self, k):
+        return self._string_bytes(k).decode("utf-8")
+
+    def _lookup(self, table, string):
+        offset, num_slots = self._tables[table]
+        key = string.encode("utf-8")
+        mask = num_slots - 1
+        k = _hash(key) & mask
+        while True:
+            key_id, value = _SLOT.unpack_from(self._buf, offset + _SLOT.size * k)
+            if key_id == 0:
+                return None
+            if self._string_bytes(key_id - 1) == key:
+                return value
+            k = (k + 1) & mask
+
+    def _postings(self, offset):
+        start = self._postings_start + self._posting_size * offset
+        postings = array.array(self._posting_typecode)
+        postings.frombytes(self._buf[start : start + self._posting_size])
+        n = postings.pop()
+        start += self._posting_size
+        postings.frombytes(self._buf[start : start + self._posting_size * n])
+        if sys.byteorder == "big":
+            postings.byteswap()
+        return postings
+
+    def _name_id(self, base, number):
+        (k,) = _UINT.unpack_from(self._buf, self._names[base] + _UINT.size * number)
+        return k
+
+    def abbreviate(self, name):
+        """The abbreviation of the journal `name`, or None if it's unknown.
+        """
+        value = self._lookup(_ABBREVIATE + _EXACT, name)
+        return None if value is None else self._string(value)
+
+    def expand(self, name):
+        """The long name of the journal abbreviated to `name`, or None if it's
+        unknown.
+        """
+        value = self._lookup(_EXPAND + _EXACT, name)
+        return None if value is None else self._string(value)
+
+    # pylint: disable=too-many-locals
+    def match(
+        self,
+        name,
+        long_journal_names=False,
+        fuzzy=True,
+        min_confidence=0.8,
+        max_postings=5000,
+        max_candidates=20,
+    ):
+        """Find the journal `name` (or the abbreviation, with
+        `long_journal_names`) even if it's written slightly differently, and
+        return a JournalMatch or None.
+
+        The exact name is looked up first, then its normalized form. Failing
+        that, and with `fuzzy`, the candidates are the names that share the
+        rarest trigrams with `name`, at most `max_postings` of them counted.
+        The `max_candidates` ones with the most shared trigrams are scored by
+        the Dice coefficient of the trigram sets, and the best one is returned
+        if the score is at least `min_confidence`. The effort is bounded
+        independently of the size of the table.
+        """
+        base = _EXPAND if long_journal_names else _ABBREVIATE
+
+        value = self._lookup(base + _EXACT, name)
+        if value is not None:
+            return JournalMatch(name, self._string(value), "exact", 1.0)
+
+        normalized = normalize(name)
+        key_id = self._lookup(base + _NORMALIZED, normalized)
+        if key_id is not None:
+            key = self._string(key_id)
+            value = self._lookup(base + _EXACT, key)
+            return JournalMatch(key, self._string(value), "normalized", 1.0)
+
+        if not fuzzy:
+            return None
+
+        trigrams = _trigrams(normalized)
+        lists = []
+        for trigram in trigrams:
+            offset = self._lookup(base + _TRIGRAMS, trigram)
+            if offset is not None:
+                lists.append(self._postings(offset))
+        lists.sort(key=len)
+
+        counts = collections.Counter()
+        num_postings = 0
+        for ids in lists:
+            if counts and num_postings + len(ids) > max_postings:
+                break
+            counts.update(ids[:max_postings])
+            num_postings += len(ids)
+
+        best = None
+        for number, _ in counts.most_common(max_candidates):
+            candidate = self._string(self._name_id(base, number))
+            score = _dice(trigrams, _trigrams(candidate))
+            if best is None or score > best[0]:
+                best = (score, candidate)
+
+        if best is None or best[0] < min_confidence:
+            return None
+
+        key = self._string(self._lookup(base + _NORMALIZED, best[1]))
+        value = self._lookup(base + _EXACT, key)
+        return JournalMatch(key, self._string(value), "fuzzy", best[0])
+
+    def close(self):
+        self._buf.close()
+        return
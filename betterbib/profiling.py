@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+#
+"""CPU and memory profiles of the command-line tools, for bug reports.
+
+The code marks its stages, e.g., parse, decode, network, format and write, with
+`stage(name)` or, for the stages of a stream of entries, `iterate(name,
+iterable)`. Stages nest; the time and memory of a stage don't include those of
+the stages within it. Without an active Profiler, both do nothing.
+"""
+import collections
+import contextlib
+import cProfile
+import json
+import time
+import tracemalloc
+
+_active = None
+
+
+@contextlib.contextmanager
+def stage(name):
+    if _active is None:
+        yield
+        return
+    _active.enter(name)
+    try:
+        yield
+    finally:
+        _active.exit()
+
+
+def iterate(name, iterable):
+    """`iterable`, with the time spent in getting its items attributed to the
+    stage `name`.
+    """
+    if _active is None:
+        return iterable
+    return _active.iterate(name, iterable)
+
+
+class Profiler(object):
+    """With `profile_file`, runs cProfile and writes the pstats to that file
+    (read it with `python -m pstats`). Only the main thread is profiled.
+    With `memory_file`, traces the allocations with tracemalloc and writes a
+    JSON report with, per stage, the time, the peak of the traced memory, the
+    most it grew while the stage ran, and the top `num_sites` allocation sites
+    at the peak.
+    """
+
+    def __init__(self, profile_file=None, memory_file=None, num_sites=10):
+        self.profile_file = profile_file
+        self.memory_file = memory_file
+        self.num_sites = num_sites
+        self._profile = None
+        self._stack = []
+        self._last = None
+        self._times = collections.Counter()
+        self._peaks = collections.Counter()
+        self._growths = collections.Counter()
+        self._sites = {}
+        # traced memory at the last switch
+        self._base = 0
+        return
+
+    def _switch(self):
+        # Attribute everything since the last switch to the innermost stage.
+        now = time.time()
+        current = self._stack[-1] if self._stack else "other"
+        self._times[current] += now - self._last
+        self._last = now
+        if self.memory_file is not None:
+            current_size, peak = tracemalloc.get_traced_memory()
+            # how far the stage went beyond what it started with
+            growth = peak - self._base
+            if growth > self._growths[current]:
+                self._growths[current] = growth
+            if peak > self._peaks[current]:
+                self._peaks[current] = peak
+                # Peaks grow only so often, so the snapshots are few.
+                previous = self._sites.get(current, (0, None))[0]
+                if current not in self._sites or peak > max(
+                    1.1 * previous, previous + 2 ** 20
+                ):
+                    self._sites[current] = (peak, self._top_sites())
+            if hasattr(tracemalloc, "reset_peak"):
+                # Python 3.9+; before, all peaks are the overall peak so far.
+                tracemalloc.reset_peak()
+            self._base = current_size
+        return
+
+    def _top_sites(self):
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)]
+        )
+        return [
+            {
+                "site": "{}:{}".format(s.traceback[0].filename, s.traceback[0].lineno),
+                "size": s.size,
+                "count": s.count,
+            }
+            for s in snapshot.statistics("lineno")[: self.num_sites]
+        ]
+
+    def enter(self, name):
+        self._switch()
+        self._stack.append(name)
+        return
+
+    def exit(self):
+        self._switch()
+        self._stack.pop()
+        return
+
+    def iterate(self, name, iterable):
+        iterator = iter(iterable)
+        while True:
+            self.enter(name)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.exit()
+            yield item
+
+    def start(self):
+        global _active  # pylint: disable=global-statement
+        assert _active is None, "Another profiler is active."
+        _active = self
+        if self.memory_file is not None:
+            tracemalloc.start()
+        if self.profile_file is not None:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        self._last = time.time()
+        return
+
+    def stop(self):
+        global _active  # pylint: disable=global-statement
+        self._switch()
+        if self._profile is not None:
+            self._profile.disable()
+            self._profile.dump_stats(self.profile_file)
+        if self.memory_file is not None:
+            self._save_memory_report()
+            tracemalloc.stop()
+        _active = None
+        return
+
+    def _save_memory_report(self):
+        stages = collections.OrderedDict()
+        for name in sorted(self._times, key=self._times.get, reverse=True):
+            _, sites = self._sites.get(name, (None, []))
+            stages[name] = collections.OrderedDict(
+                [
+                    ("seconds", self._times[name]),
+                    ("peak_bytes", self._peaks[name]),
+                    ("peak_growth_bytes", self._growths[name]),
+                    ("top_sites", sites),
+                ]
+            )
+        with open(self.memory_file, "w") as f:
+            json.dump({"stages": stages}, f, indent=2)
+        return
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+        return
+
+
+@contextlib.contextmanager
+def profile(profile_file=None, memory_file=None):
+    """Run the block under a Profiler if any of the files is given.
+    """
+    if profile_file is None and memory_file is None:
+        yield None
+        return
+    with Profiler(profile_file, memory_file) as profiler:
+        yield profiler
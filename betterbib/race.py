@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+#
+"""Look up entries in several sources at once, e.g., Crossref and DBLP, and
+take the first unique match.
+"""
+import concurrent.futures
+
+from . import tools
+from .errors import CircuitOpenError, HttpError, NotFoundError, UniqueError
+
+
+def pick_error(exceptions):
+    """The error to raise when no source found a unique match. A failed
+    request may have missed a match, so it wins over the not-found and
+    ambiguous answers, unless the source is down altogether. Anything
+    unexpected wins over all of these.
+    """
+
+    def rank(e):
+        if isinstance(e, CircuitOpenError):
+            return 0
+        if isinstance(e, NotFoundError):
+            return 1
+        if isinstance(e, UniqueError):
+            return 2
+        if isinstance(e, HttpError):
+            return 3
+        return 4
+
+    return max(exceptions, key=rank)
+
+
+def merge(data, others):
+    """Fill in the fields and persons that `data` lacks from the `others` that
+    are the same work, i.e., have the same DOI.
+    """
+    doi = data.fields.get("doi", "").lower()
+    if not doi:
+        return data
+    for other in others:
+        if other.fields.get("doi", "").lower() == doi:
+            # tools.update keeps what's in `data`.
+            data = tools.update(other, data)
+    return data
+
+
+class Race(object):
+    """Looks up every entry in all `sources` at the same time and takes the
+    first unique match. Lookups that haven't started by then are cancelled,
+    the others ignored. With `merge_wait`, the others are given that many
+    seconds more to finish, and what they find for the same work fills in the
+    gaps of the first match. DOIs are resolved by the first source that can.
+    """
+
+    def __init__(self, sources, merge_wait=0.0, num_concurrent_requests=10):
+        self.sources = sources
+        self.merge_wait = merge_wait
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=len(sources) * num_concurrent_requests
+        )
+        return
+
+    def get_by_dois(self, dois, batch_size=40):
+        # There's nothing to race for exact lookups.
+        for source in self.sources:
+            if hasattr(source, "get_by_dois"):
+                return source.get_by_dois(dois, batch_size)
+        return {}
+
+    def find_unique(self, entry):
+        futures = [
+            self._executor.submit(source.find_unique, entry) for source in self.sources
+        ]
+        pending = set(futures)
+        exceptions = []
+        try:
+            while pending:
+                done, pending = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                # in the order of the sources if several are done
+                for future in [f for f in futures if f in done]:
+                    if future.exception() is not None:
+                        exceptions.append(future.exception())
+                        continue
+                    data = future.result()
+                    if self.merge_wait > 0:
+                        if pending:
+                            _, pending = concurrent.futures.wait(
+                                pending, timeout=self.merge_wait
+                            )
+                        others = [
+                            f.result()
+                            for f in futures
+                            if f is not future and f.done() and f.exception() is None
+                        ]
+                        data = merge(data, others)
+                    return data
+        finally:
+            for future in pending:
+                future.cancel()
+        raise pick_error(exceptions)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+        return
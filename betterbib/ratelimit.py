@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+#
+from __future__ import division
+
+import calendar
+import contextlib
+import email.utils
+import json
+import os
+import re
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: the budget is then only shared between the threads of one
+    # process.
+    fcntl = None
+
+
+def parse_interval(string):
+    """Translate rate limit intervals like `1s`, `2m`, or `1h` into seconds.
+    """
+    m = re.match("^\\s*([0-9.]+)\\s*([smh]?)\\s*$", string)
+    if m is None:
+        raise ValueError("Illegal interval '{}'".format(string))
+    factor = {"": 1, "s": 1, "m": 60, "h": 3600}[m.group(2)]
+    return float(m.group(1)) * factor
+
+
+def parse_retry_after(string):
+    """Retry-After is either a number of seconds or an HTTP date.
+    """
+    try:
+        return max(0.0, float(string))
+    except ValueError:
+        pass
+    date = email.utils.parsedate_tz(string)
+    if date is None:
+        return None
+    return max(0.0, email.utils.mktime_tz(date) - calendar.timegm(time.gmtime()))
+
+
+class RateLimiter(object):
+    """Token bucket that allows `limit` requests per `interval` seconds. The
+    bucket lives in `filename` (guarded by a file lock) so that all betterbib
+    processes on the host draw from the same budget.
+    """
+
+    def __init__(self, filename, limit=50, interval=1.0):
+        self.filename = filename
+        self.default_limit = limit
+        self.default_interval = interval
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(filename)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        return
+
+    @contextlib.contextmanager
+    def _state(self):
+        with self._lock:
+            with open(self.filename, "a+") as f:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.seek(0)
+                    try:
+                        state = json.loads(f.read())
+                    except ValueError:
+                        # new or corrupted file
+                        state = {}
+
+                    state.setdefault("limit", self.default_limit)
+                    state.setdefault("interval", self.default_interval)
+                    state.setdefault("tokens", float(state["limit"]))
+                    state.setdefault("timestamp", time.time())
+                    state.setdefault("blocked_until", 0.0)
+
+                    yield state
+
+                    f.seek(0)
+                    f.truncate()
+                    f.write(json.dumps(state))
+                    f.flush()
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(f, fcntl.LOCK_UN)
+
+    def acquire(self):
+        """Block until a request may be sent.
+        """
+        while True:
+            with self._state() as state:
+                now = time.time()
+                rate = state["limit"] / state["interval"]
+                state["tokens"] = min(
+                    float(state["limit"]),
+                    state["tokens"] + (now - state["timestamp"]) * rate,
+                )
+                state["timestamp"] = now
+
+                if now >= state["blocked_until"] and state["tokens"] >= 1.0:
+                    state["tokens"] -= 1.0
+                    return
+
+                wait = max(state["blocked_until"] - now, (1.0 - state["tokens"]) / rate)
+            time.sleep(wait)
+
+    def update(self, headers):
+        """Adapt the budget to the `X-Rate-Limit-*` headers of a response.
+        """
+        try:
+            limit = int(headers["X-Rate-Limit-Limit"])
+            interval = parse_interval(headers["X-Rate-Limit-Interval"])
+        except (KeyError, ValueError):
+            return
+
+        if limit < 1 or interval <= 0.0:
+            return
+
+        with self._state() as state:
+            if state["limit"] != limit or state["interval"] != interval:
+                state["limit"] = limit
+                state["interval"] = interval
+                state["tokens"] = min(state["tokens"], float(limit))
+        return
+
+    def pause(self, seconds):
+        """Stop all requests for the given number of seconds, e.g., after a
+        429 response.
+        """
+        with self._state() as state:
+            state["blocked_until"] = max(state["blocked_until"], time.time() + seconds)
+            state["tokens"] = 0.0
+        return
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+#
+"""Retries with jittered exponential backoff and circuit breakers for the
+requests to the sources. Both can be set in the NETWORK section of the config
+file (see also tools.get_timeouts), e.g.,
+```
+[NETWORK]
+max_retries=3
+backoff_seconds=0.5
+failure_threshold=5
+reset_seconds=30
+```
+"""
+from __future__ import division
+
+import random
+import threading
+import time
+
+from . import tools
+from .errors import CircuitOpenError, DeadlineError
+
+# Too Many Requests and the server errors that usually go away
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+
+def get_retry_settings():
+    """Settings of the retries and circuit breakers from the [NETWORK]
+    section of the config file.
+    """
+    return {
+        "max_retries": int(tools.get_config_value("NETWORK", "max_retries", 3)),
+        "backoff": float(tools.get_config_value("NETWORK", "backoff_seconds", 0.5)),
+        "failure_threshold": int(
+            tools.get_config_value("NETWORK", "failure_threshold", 5)
+        ),
+        "reset_timeout": float(tools.get_config_value("NETWORK", "reset_seconds", 30)),
+    }
+
+
+class RetryPolicy(object):
+    """Up to `max_retries` retries of requests that fail with a status in
+    RETRY_STATUSES or a connection error. Before retry k (from 0), wait
+    `backoff * 2**k` seconds, at most `max_backoff`, of which the second half is
+    random so that concurrent clients don't come back all at once. A
+    Retry-After of the server takes precedence. No request goes beyond the
+    `deadline`, a time.time(), if set.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self, max_retries=3, backoff=0.5, max_backoff=30.0, deadline=None, seed=None
+    ):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.deadline = deadline
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        return
+
+    @staticmethod
+    def is_retryable(status):
+        return status in RETRY_STATUSES
+
+    def delay(self, k, retry_after=None):
+        """Seconds to wait before retry `k`, but not beyond the deadline.
+        """
+        if retry_after is None:
+            d = min(self.max_backoff, self.backoff * 2 ** k)
+            with self._lock:
+                retry_after = d / 2 + self._random.uniform(0, d / 2)
+        if self.deadline is not None:
+            retry_after = min(retry_after, max(0.0, self.deadline - time.time()))
+        return retry_after
+
+    def limit_timeout(self, timeout):
+        """`timeout`, in seconds or a (connect, read) pair, cut down to the time
+        left until the deadline. Raises DeadlineError once it has passed.
+        """
+        if self.deadline is None:
+            return timeout
+        left = self.deadline - time.time()
+        if left <= 0.0:
+            raise DeadlineError("Deadline passed")
+        if isinstance(timeout, tuple):
+            return tuple(left if t is None else min(t, left) for t in timeout)
+        return left if timeout is None else min(timeout, left)
+
+
+class CircuitBreaker(object):
+    """Stops the requests to a source that is clearly down. After
+    `failure_threshold` failed requests in a row, the circuit opens and all
+    requests fail right away with CircuitOpenError. After `reset_timeout`
+    seconds, one trial request is let through; if the source answers, the
+    circuit closes again, otherwise it stays open for another `reset_timeout`.
+    A trial that ends without an answer, e.g., because it was cancelled, must
+    be released so that the next request becomes the trial.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+        return
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+
+    def check(self):
+        """Raise CircuitOpenError unless a request may be sent now. Returns
+        True if the request is the trial; the caller must release it once the
+        request is done, however it ended.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            if not self._trial and time.time() >= self._opened_at + self.reset_timeout:
+                self._trial = True
+                return True
+        raise CircuitOpenError(
+            "{} is not responding; not trying again for now".format(self.name)
+        )
+
+    def retry_in(self):
+        """Seconds until the next request may be sent.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            return max(0.0, self._opened_at + self.reset_timeout - time.time())
+
+    def success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+        return
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial or self._failures >= self.failure_threshold:
+                self._opened_at = time.time()
+                self._trial = False
+        return
+
+    def record(self, status):
+        """Record a response with `status`. Server errors are failures. Too
+        Many Requests means busy, not down, so it only closes an open circuit.
+        """
+        if status >= 500:
+            self.failure()
+        elif status != 429 or self.is_open:
+            self.success()
+        return
+
+    def release(self):
+        """End the trial (see check) if it hasn't ended in success or failure.
+        """
+        with self._lock:
+            self._trial = False
+        return
+
+
+def create(name, max_retries=None):
+    """The RetryPolicy and the CircuitBreaker of the source `name` according
+    to the config file; `max_retries`, if given, overrides it.
+    """
+    settings = get_retry_settings()
+    if max_retries is None:
+        max_retries = settings["max_retries"]
+    policy = RetryPolicy(max_retries, settings["backoff"])
+    breaker = CircuitBreaker(
+        name, settings["failure_threshold"], settings["reset_timeout"]
+    )
+    return policy, breaker
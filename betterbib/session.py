@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+#
+import atexit
+import io
+import sqlite3
+import threading
+import time
+
+import requests
+import requests.adapters
+import requests_cache
+import urllib3
+
+from . import hedge, tools
+from .__about__ import __version__, __website__, __author_email__
+from .ratelimit import parse_retry_after
+
+
+def user_agent(mailto=None):
+    # crossref etiquette,
+    # <https://github.com/CrossRef/rest-api-doc#good-manners--more-reliable-service>
+    return "betterbib/{} ({}; mailto:{})".format(
+        __version__, __website__, mailto or __author_email__
+    )
+
+
+class RetryingAdapter(requests.adapters.HTTPAdapter):
+    """Transport adapter for the requests that actually go out to the network
+    (cache hits never get here). With a `rate_limiter`, it draws a token
+    before every request and pauses all requests on 429 Too Many Requests.
+    With a `retry_policy`, failed requests are retried (see RetryPolicy); with
+    a `circuit_breaker`, they aren't sent at all while the source is down
+    (see CircuitBreaker). Requests without a timeout of their own get
+    `timeout`, seconds or a (connect, read) pair.
+
+    A request sent with an `answer`, the (status, headers, body) of a response
+    received by other means, e.g., the asyncio engine, doesn't go out; the
+    answer is returned as the response, so that the session's cache can store
+    it.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        rate_limiter=None,
+        retry_policy=None,
+        circuit_breaker=None,
+        timeout=None,
+        **kwargs
+    ):
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy
+        self.circuit_breaker = circuit_breaker
+        self.timeout = timeout
+        super(RetryingAdapter, self).__init__(**kwargs)
+
+    # pylint: disable=arguments-differ
+    def send(self, request, answer=None, **kwargs):
+        if answer is not None:
+            return self._build_answer(request, answer)
+
+        timeout = kwargs.pop("timeout", None) or self.timeout
+        max_retries = 0 if self.retry_policy is None else self.retry_policy.max_retries
+        for k in range(max_retries + 1):
+            trial = self.circuit_breaker is not None and self.circuit_breaker.check()
+            try:
+                r = self._send_once(request, timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if k == max_retries:
+                    raise
+                time.sleep(self.retry_policy.delay(k))
+                continue
+            finally:
+                if trial:
+                    self.circuit_breaker.release()
+
+            if k == max_retries or not self.retry_policy.is_retryable(r.status_code):
+                break
+
+            delay = self.retry_policy.delay(
+                k, parse_retry_after(r.headers.get("Retry-After", ""))
+            )
+            if r.status_code == 429 and self.rate_limiter is not None:
+                # Hold back all other requests, too.
+                self.rate_limiter.pause(delay)
+            else:
+                time.sleep(delay)
+            r.close()
+        # for RequestStats
+        r.num_retries = k
+        return r
+
+    def _build_answer(self, request, answer):
+        status, headers, body = answer
+        # The body has been decoded already.
+        headers = {
+            key: value
+            for key, value in headers.items()
+            if key.lower() not in ["content-encoding", "content-length"]
+        }
+        raw = urllib3.HTTPResponse(
+            body=io.BytesIO(body),
+            headers=headers,
+            status=status,
+            preload_content=False,
+            request_url=request.url,
+        )
+        return self.build_response(request, raw)
+
+    def _send_once(self, request, timeout, **kwargs):
+        if self.retry_policy is not None:
+            timeout = self.retry_policy.limit_timeout(timeout)
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+
+        hedge.attempt_started()
+        try:
+            r = super(RetryingAdapter, self).send(request, timeout=timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            hedge.attempt_done(answered=False)
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.failure()
+            raise
+        hedge.attempt_done()
+
+        if self.rate_limiter is not None:
+            self.rate_limiter.update(r.headers)
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.record(r.status_code)
+        return r
+
+
+class LruCachedSession(requests_cache.CachedSession):
+    """Session with an SQLite response cache that is kept below `max_size`
+    bytes by dropping the least recently used responses, when the session is
+    created and whenever a tenth of `max_size` has been added since. Expired
+    responses are removed when the session is created.
+    """
+
+    def __init__(self, cache_name, max_size=None, **kwargs):
+        super(LruCachedSession, self).__init__(cache_name, backend="sqlite", **kwargs)
+        self.max_size = max_size
+
+        # Access times are collected in memory and written in batches.
+        self._access_times = {}
+        self._lock = threading.Lock()
+        # bytes added to the cache since the last eviction
+        self._added = 0
+        self._evicting = False
+        connection = self._connect()
+        with connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS access_times "
+                "(key TEXT PRIMARY KEY, time REAL)"
+            )
+        connection.close()
+        atexit.register(self.flush_access_times)
+
+        self.cache.delete(expired=True)
+        self.evict()
+        return
+
+    def _connect(self):
+        return sqlite3.connect(self.cache.responses.db_path, timeout=30)
+
+    def send(self, request, **kwargs):  # pylint: disable=arguments-differ
+        response = super(LruCachedSession, self).send(request, **kwargs)
+        key = getattr(response, "cache_key", None)
+        if key:
+            added = 0
+            if not getattr(response, "from_cache", False):
+                added = len(response.content or b"")
+            with self._lock:
+                self._access_times[key] = time.time()
+                is_full = len(self._access_times) >= 100
+                self._added += added
+                must_evict = (
+                    self.max_size is not None
+                    and self._added > self.max_size / 10
+                    and not self._evicting
+                )
+                if must_evict:
+                    self._evicting = True
+            if must_evict:
+                # evict flushes the access times, too
+                try:
+                    self.evict()
+                finally:
+                    with self._lock:
+                        self._evicting = False
+            elif is_full:
+                self.flush_access_times()
+        return response
+
+    def flush_access_times(self):
+        with self._lock:
+            items = list(self._access_times.items())
+            self._access_times.clear()
+        if items:
+            connection = self._connect()
+            with connection:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO access_times VALUES (?, ?)", items
+                )
+            connection.close()
+        return
+
+    def evict(self):
+        """Drop the least recently used responses until the cache is smaller
+        than `max_size`.
+        """
+        if self.max_size is None:
+            return
+
+        with self._lock:
+            self._added = 0
+        self.flush_access_times()
+        connection = self._connect()
+        rows = connection.execute(
+            "SELECT r.key, LENGTH(r.value) FROM {} r "
+            "LEFT JOIN access_times a ON r.key = a.key "
+            "ORDER BY COALESCE(a.time, 0)".format(self.cache.responses.table_name)
+        ).fetchall()
+        connection.close()
+
+        total = sum(size for _, size in rows)
+        keys = []
+        for key, size in rows:
+            if total <= self.max_size:
+                break
+            keys.append(key)
+            total -= size
+
+        if keys:
+            self.cache.delete(*keys)
+            connection = self._connect()
+            with connection:
+                connection.execute(
+                    "DELETE FROM access_times WHERE key NOT IN "
+                    "(SELECT key FROM {})".format(self.cache.responses.table_name)
+                )
+            connection.close()
+        return
+
+
+def create_session(
+    num_concurrent_requests=10,
+    headers=None,
+    rate_limiter=None,
+    retry_policy=None,
+    circuit_breaker=None,
+    timeout=None,
+    cache_name=None,
+    **cache_kwargs
+):
+    """Create a keep-alive HTTP session whose connection pool is large enough
+    for `num_concurrent_requests` workers to share it without opening and
+    discarding connections (and repeating TLS handshakes). With `cache_name`,
+    responses are cached in that SQLite file; see LruCachedSession. For
+    `rate_limiter`, `retry_policy`, `circuit_breaker` and `timeout` (default:
+    tools.get_timeouts), see RetryingAdapter.
+    """
+    if cache_name is None:
+        session = requests.Session()
+    else:
+        session = LruCachedSession(cache_name, **cache_kwargs)
+
+    kwargs = {"pool_connections": 2, "pool_maxsize": max(1, num_concurrent_requests)}
+    if timeout is None:
+        timeout = tools.get_timeouts()
+    adapter = RetryingAdapter(
+        rate_limiter, retry_policy, circuit_breaker, timeout, **kwargs
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    session.headers.update({"User-Agent": user_agent(), "Connection": "keep-alive"})
+    if headers:
+        session.headers.update(headers)
+    return session
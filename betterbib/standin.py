@@ -0,0 +1,394 @@
+# -*- coding: utf-8 -*-
+#
+"""A local stand-in for the Crossref and DBLP APIs, so that betterbib can be
+tested and load-tested without the network.
+
+Responses come from a cassette of recorded responses, are recorded from the
+real APIs on first use, or are made up from the request. On top of that,
+latency, 429 Too Many Requests, server errors and requests that never get an
+answer can be injected at random. Point the sources at the stand-in with
+```
+Crossref(api_url=standin.crossref_url)
+Dblp(api_url=standin.dblp_url)
+```
+or with `api_url` in the CROSSREF and DBLP sections of the config file.
+"""
+import collections
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, unquote, urlencode, urlsplit
+
+# The real APIs of the paths the stand-in serves
+UPSTREAMS = collections.OrderedDict(
+    [("/works", "https://api.crossref.org"), ("/search/publ/api", "https://dblp.org")]
+)
+
+
+def request_key(path):
+    """The key of the request for `path` in a cassette: the path with the
+    query parameters sorted.
+    """
+    parts = urlsplit(path)
+    query = sorted(parse_qsl(parts.query, keep_blank_values=True))
+    return parts.path + ("?" + urlencode(query) if query else "")
+
+
+class Cassette(object):
+    """Recorded responses, stored in `filename` as one JSON object with the
+    keys "key", "status" and "body" per line. New recordings are appended.
+    """
+
+    def __init__(self, filename=None):
+        self.filename = filename
+        self._responses = {}
+        self._lock = threading.Lock()
+        if filename is not None and os.path.exists(filename):
+            with open(filename, "r") as f:
+                for line in f:
+                    if line.strip():
+                        r = json.loads(line)
+                        self._responses[r["key"]] = (r["status"], r["body"])
+        return
+
+    def get(self, key):
+        """The (status, body) recorded for `key`, or None.
+        """
+        return self._responses.get(key)
+
+    def record(self, key, status, body):
+        with self._lock:
+            self._responses[key] = (status, body)
+            if self.filename is not None:
+                with open(self.filename, "a") as f:
+                    f.write(
+                        json.dumps({"key": key, "status": status, "body": body})
+                        + "\n"
+                    )
+        return
+
+    def __len__(self):
+        return len(self._responses)
+
+
+class Faults(object):
+    """What goes wrong, and how often. Every response is delayed by `latency`
+    plus a random amount up to `jitter` seconds. With the probabilities
+    `rate_429`, `rate_5xx` and `rate_timeout`, a request is answered with 429
+    (and `retry_after` seconds in Retry-After), with 503, or not at all for
+    `hang` seconds, after which the connection is closed.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        latency=0.0,
+        jitter=0.0,
+        rate_429=0.0,
+        rate_5xx=0.0,
+        rate_timeout=0.0,
+        retry_after=1.0,
+        hang=30.0,
+        seed=None,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.rate_timeout = rate_timeout
+        self.retry_after = retry_after
+        self.hang = hang
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        return
+
+    def draw(self):
+        """The delay of the next response and its fault, one of None, "429",
+        "5xx", and "timeout".
+        """
+        with self._lock:
+            delay = self.latency + self.jitter * self._random.random()
+            x = self._random.random()
+        for fault, rate in [
+            ("429", self.rate_429),
+            ("5xx", self.rate_5xx),
+            ("timeout", self.rate_timeout),
+        ]:
+            if x < rate:
+                return delay, fault
+            x -= rate
+        return delay, None
+
+
+def _digest(string):
+    return hashlib.sha1(string.encode("utf-8")).hexdigest()
+
+
+def _crossref_item(doi, words):
+    h = int(_digest(doi), 16)
+    year = 1950 + h % 70
+    return {
+        "DOI": doi,
+        "type": "journal-article",
+        "title": [" ".join(words[:8]).capitalize() or "Untitled"],
+        "author": [{"given": "Jane", "family": "Doe"}],
+        "container-title": ["Journal of Synthetic Results"],
+        "short-container-title": ["J. Synth. Res."],
+        "publisher": "Synthetic Publishing",
+        "issued": {"date-parts": [[year, 1 + h % 12]]},
+        "volume": str(1 + h % 200),
+        "issue": str(1 + h % 12),
+        "page": "{}-{}".format(1 + h % 900, 20 + h % 900),
+        "URL": "http://dx.doi.org/" + doi,
+        "source": "Crossref",
+        "score": 10.0,
+    }
+
+
+def synthesize(path, not_found=0.0):
+    """Make up a plausible (status, body) for the request `path` to Crossref
+    or DBLP. The same request always gives the same answer; a fraction
+    `not_found` of the searches finds nothing.
+    """
+    parts = urlsplit(path)
+    params = dict(parse_qsl(parts.query))
+    key = request_key(path)
+    found = int(_digest(key)[:8], 16) / 2.0 ** 32 >= not_found
+
+    if parts.path.startswith("/works/"):
+        doi = unquote(parts.path[len("/works/") :])
+        message = _crossref_item(doi, ["A", "work"])
+        return 200, json.dumps({"status": "ok", "message": message})
+
+    if parts.path == "/works":
+        # Searches are filtered by type, lookups by DOI.
+        dois = [
+            f[len("doi:") :]
+            for f in params.get("filter", "").split(",")
+            if f.startswith("doi:")
+        ]
+        if dois:
+            items = [_crossref_item(doi, ["A", "work"]) for doi in dois]
+        elif found:
+            words = params.get("query", "").split()
+            items = [_crossref_item("10.5555/" + _digest(key)[:10], words)]
+        else:
+            items = []
+        message = {"items": items, "total-results": len(items)}
+        return 200, json.dumps({"status": "ok", "message": message})
+
+    if parts.path == "/search/publ/api":
+        hits = {"@total": "0"}
+        if found:
+            words = params.get("q", "").replace("+", " ").split()
+            doi = "10.5555/" + _digest(key)[:10]
+            info = {
+                "authors": {"author": ["Jane Doe"]},
+                "title": " ".join(words[:8]).capitalize() + ".",
+                "venue": "J. Synth. Res.",
+                "volume": "1",
+                "pages": "1-20",
+                "year": "2000",
+                "type": "Journal Articles",
+                "doi": doi,
+                "ee": "https://doi.org/" + doi,
+            }
+            hits = {"@total": "1", "hit": [{"@score": "10", "info": info}]}
+        return 200, json.dumps({"result": {"hits": hits}})
+
+    return None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        # quiet; the stand-in counts instead
+        pass
+
+    def _send(self, status, body, headers=()):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in headers:
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+        return
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        standin = self.server.standin
+        standin.count("requests")
+
+        delay, fault = standin.faults.draw()
+        if delay > 0:
+            time.sleep(delay)
+
+        if fault == "timeout":
+            standin.count("timeout")
+            standin.stopped.wait(standin.faults.hang)
+            self.close_connection = True
+            return
+        if fault == "429":
+            standin.count("429")
+            retry_after = "{:g}".format(standin.faults.retry_after)
+            self._send(429, "", [("Retry-After", retry_after)])
+            return
+        if fault == "5xx":
+            standin.count("5xx")
+            self._send(503, "")
+            return
+
+        status, body = standin.respond(self.path)
+        self._send(status, body, standin.rate_limit_headers)
+        return
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients hang up, e.g., after a timeout; that's no error here.
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        ThreadingHTTPServer.handle_error(self, request, client_address)
+        return
+
+
+class StandIn(object):
+    """The stand-in server on `host`:`port` (0: any free port). Responses are
+    replayed from `cassette`, a Cassette or a file name; with `record`, the
+    ones that are missing are fetched from the real APIs and recorded, with
+    `synthesize`, made up (see synthesize). Everything else gets 404.
+    `faults` are injected (see Faults). With `rate_limit`, the responses
+    carry `X-Rate-Limit-*` headers that allow that many requests per second.
+
+    The server runs in a background thread between start and stop, or in a
+    `with` block. `stats` counts the requests and what happened to them.
+    """
+
+    # pylint: disable=too-many-arguments,too-many-instance-attributes
+    def __init__(
+        self,
+        cassette=None,
+        record=False,
+        synthesize=False,
+        not_found=0.0,
+        faults=None,
+        rate_limit=None,
+        host="127.0.0.1",
+        port=0,
+    ):
+        if not isinstance(cassette, Cassette):
+            cassette = Cassette(cassette)
+        self.cassette = cassette
+        self.record = record
+        self.synthesize = synthesize
+        self.not_found = not_found
+        self.faults = Faults() if faults is None else faults
+        self.rate_limit_headers = []
+        if rate_limit is not None:
+            self.rate_limit_headers = [
+                ("X-Rate-Limit-Limit", str(rate_limit)),
+                ("X-Rate-Limit-Interval", "1s"),
+            ]
+        self.stats = collections.Counter()
+        self.stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._upstream_session = None
+
+        self.server = _Server((host, port), _Handler)
+        self.server.standin = self
+        self._thread = None
+        return
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    @property
+    def crossref_url(self):
+        return self.url + "/works"
+
+    @property
+    def dblp_url(self):
+        return self.url + "/search/publ/api"
+
+    def count(self, what):
+        with self._lock:
+            self.stats[what] += 1
+        return
+
+    def respond(self, path):
+        """The (status, body) for the request `path`, without faults.
+        """
+        key = request_key(path)
+        response = self.cassette.get(key)
+        if response is not None:
+            self.count("replayed")
+            return response
+
+        if self.record:
+            response = self._fetch(path)
+            if response is not None:
+                self.count("recorded")
+                self.cassette.record(key, *response)
+                return response
+
+        if self.synthesize:
+            response = synthesize(path, self.not_found)
+            if response is not None:
+                self.count("synthesized")
+                return response
+
+        self.count("missing")
+        return 404, json.dumps({"status": "error", "message": "Not recorded"})
+
+    def _fetch(self, path):
+        upstream = None
+        for prefix, url in UPSTREAMS.items():
+            if urlsplit(path).path.startswith(prefix):
+                upstream = url
+        if upstream is None:
+            return None
+
+        if self._upstream_session is None:
+            # requests is slow to import; only do it when recording
+            from .session import create_session
+
+            self._upstream_session = create_session(10)
+        r = self._upstream_session.get(upstream + path, timeout=60)
+        return r.status_code, r.text
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self.server.serve_forever()
+        return
+
+    def stop(self):
+        # Let hanging requests go first.
+        self.stopped.set()
+        self.server.shutdown()
+        self.server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+        return
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+        return
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+#
+"""Statistics of the requests that a sync makes, to find out why it's slow.
+"""
+import collections
+import heapq
+import json
+import threading
+import time
+
+
+def percentile(sorted_values, p):
+    """The `p`-th percentile, 0 <= p <= 100, of the sorted list `sorted_values`
+    by the nearest-rank method, or None if it's empty.
+    """
+    if not sorted_values:
+        return None
+    k = max(0, -(-len(sorted_values) * p // 100) - 1)
+    return sorted_values[int(k)]
+
+
+class RequestStats(object):
+    """Collects, per source and endpoint, the number of requests, hits and
+    misses of the response cache, the bytes received, the retries, the hedges
+    and the latencies of the requests that went to the network. Also keeps the
+    `max_slowest` entries that took longest from the start of their lookup to
+    the result. All methods can be called from any thread.
+    """
+
+    def __init__(self, max_slowest=20):
+        self.max_slowest = max_slowest
+        self.start = time.time()
+        self._lock = threading.Lock()
+        self._requests = collections.defaultdict(collections.Counter)
+        self._counts = collections.defaultdict(collections.Counter)
+        self._latencies = collections.defaultdict(list)
+        self._slowest = []
+        self._entry_cache = collections.Counter()
+        return
+
+    # pylint: disable=too-many-arguments
+    def record(self, source, endpoint, seconds, from_cache=False, size=0, retries=0):
+        """Record a request to `endpoint` of `source` that took `seconds`.
+        """
+        with self._lock:
+            self._requests[source][endpoint] += 1
+            counts = self._counts[source]
+            if from_cache:
+                counts["cache_hits"] += 1
+            else:
+                counts["cache_misses"] += 1
+                counts["bytes"] += size
+                self._latencies[source].append(seconds)
+            counts["retries"] += retries
+        return
+
+    def get(self, session, source, endpoint, url, **kwargs):
+        """`session.get(url, **kwargs)`, recorded.
+        """
+        start = time.time()
+        r = session.get(url, **kwargs)
+        from_cache = getattr(r, "from_cache", False)
+        self.record(
+            source,
+            endpoint,
+            time.time() - start,
+            from_cache=from_cache,
+            size=0 if from_cache else len(r.content),
+            retries=getattr(r, "num_retries", 0),
+        )
+        return r
+
+    def record_hedges(self, source, sent, won):
+        """Record that `sent` requests to `source` were hedged (see
+        betterbib.hedge) and that the hedge answered first `won` times.
+        """
+        with self._lock:
+            counts = self._counts[source]
+            counts["hedges"] = sent
+            counts["hedges_won"] = won
+        return
+
+    def record_entry_cache(self, hit):
+        with self._lock:
+            self._entry_cache["hits" if hit else "misses"] += 1
+        return
+
+    def record_entry(self, bib_id, seconds, outcome):
+        """Record that the lookup of the entry `bib_id` took `seconds`.
+        """
+        with self._lock:
+            item = (seconds, bib_id, outcome)
+            if len(self._slowest) < self.max_slowest:
+                heapq.heappush(self._slowest, item)
+            else:
+                heapq.heappushpop(self._slowest, item)
+        return
+
+    def report(self):
+        """All statistics as a dictionary that can be serialized to JSON.
+        """
+        with self._lock:
+            sources = collections.OrderedDict()
+            for source in sorted(self._requests):
+                latencies = sorted(self._latencies[source])
+                counts = self._counts[source]
+                sources[source] = collections.OrderedDict(
+                    [
+                        ("requests", dict(self._requests[source])),
+                        ("cache_hits", counts["cache_hits"]),
+                        ("cache_misses", counts["cache_misses"]),
+                        ("bytes", counts["bytes"]),
+                        ("retries", counts["retries"]),
+                        ("hedges", counts["hedges"]),
+                        ("hedges_won", counts["hedges_won"]),
+                        (
+                            "latency",
+                            collections.OrderedDict(
+                                [
+                                    ("p50", percentile(latencies, 50)),
+                                    ("p95", percentile(latencies, 95)),
+                                    ("p99", percentile(latencies, 99)),
+                                    ("max", latencies[-1] if latencies else None),
+                                ]
+                            ),
+                        ),
+                    ]
+                )
+            slowest = [
+                collections.OrderedDict(
+                    [("key", bib_id), ("seconds", seconds), ("outcome", outcome)]
+                )
+                for seconds, bib_id, outcome in sorted(self._slowest, reverse=True)
+            ]
+            return collections.OrderedDict(
+                [
+                    ("elapsed", time.time() - self.start),
+                    ("sources", sources),
+                    ("entry_cache", dict(self._entry_cache)),
+                    ("slowest_entries", slowest),
+                ]
+            )
+
+    def save(self, filename):
+        with open(filename, "w") as f:
+            json.dump(self.report(), f, indent=2)
+        return
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+#
+"""Read BibTeX files entry by entry, so that large files can be processed in
+bounded memory.
+"""
+import re
+
+from pybtex.database import BibliographyDataError
+from pybtex.database.input import bibtex
+
+_tokens = re.compile(r'[@{}()"]')
+_header = re.compile(r"@\s*\w+\s*$")
+
+
+def _split(file_handle):
+    """Yield the text of every top-level `@...{...}` block in `file_handle`,
+    reading it line by line. Everything between the blocks is a comment as far
+    as BibTeX is concerned and is dropped.
+    """
+    chunk = []
+    # None between blocks, "@" after the @ of a block, otherwise the opening
+    # delimiter of the block
+    state = None
+    depth = 0
+    in_quotes = False
+    for line in file_handle:
+        begin = 0
+        for m in _tokens.finditer(line):
+            char = m.group()
+            if state is None:
+                if char == "@":
+                    state = "@"
+                    begin = m.start()
+                continue
+
+            if state == "@":
+                header = "".join(chunk) + line[begin : m.start()]
+                if char in "{(" and _header.match(header):
+                    state = char
+                    depth = 0
+                    in_quotes = False
+                    continue
+                # Not a block; leave the error message to pybtex.
+                state = "junk"
+
+            # Quotes delimit values only outside of braces.
+            if char == '"' and depth == 0:
+                in_quotes = not in_quotes
+            elif char == "{":
+                depth += 1
+            elif char == "}":
+                depth -= 1
+
+            if state == "{":
+                done = depth < 0
+            elif state == "(":
+                done = char == ")" and depth == 0 and not in_quotes
+            else:
+                done = True
+            if done:
+                chunk.append(line[begin : m.end()])
+                yield "".join(chunk)
+                chunk = []
+                state = None
+
+        if state is not None:
+            chunk.append(line[begin:])
+
+    if chunk:
+        # an unterminated block; pybtex will complain about it
+        yield "".join(chunk)
+
+
+def read(file_handle, chunk_size=2 ** 20):
+    """Yield the (key, entry) pairs of the BibTeX data in `file_handle` in
+    order. The input is parsed in pieces of about `chunk_size` characters, so
+    only those need to be in memory at any time. @string macros carry over from
+    one piece to the next.
+    """
+    macros = bibtex.Parser().macros
+    keys = set()
+
+    def parse(text):
+        parser = bibtex.Parser()
+        parser.macros = macros
+        for key, entry in parser.parse_string(text).entries.items():
+            if key.lower() in keys:
+                raise BibliographyDataError("repeated bibliograhpy entry: " + key)
+            keys.add(key.lower())
+            yield key, entry
+
+    pieces = []
+    size = 0
+    for text in _split(file_handle):
+        pieces.append(text)
+        size += len(text)
+        if size >= chunk_size:
+            for item in parse("\n".join(pieces)):
+                yield item
+            pieces = []
+            size = 0
+
+    if pieces:
+        for item in parse("\n".join(pieces)):
+            yield item
+
+
+class ReorderBuffer(object):
+    """Puts the results of work that completes out of order back into order.
+    Results are numbered from 0 by the position of their input. At most
+    `capacity` results starting at the oldest missing one can be held, so that
+    the memory stays bounded if that one takes long; has_room tells whether
+    work on a number can be started.
+    """
+
+    def __init__(self, capacity):
+        assert capacity > 0
+        self.capacity = capacity
+        self.next = 0
+        self._results = {}
+        return
+
+    def has_room(self, index):
+        return index < self.next + self.capacity
+
+    def put(self, index, result):
+        """Add the `result` number `index` and return the list of the results
+        that are now in order, possibly empty.
+        """
+        assert self.next <= index < self.next + self.capacity
+        assert index not in self._results
+        self._results[index] = result
+        ready = []
+        while self.next in self._results:
+            ready.append(self._results.pop(self.next))
+            self.next += 1
+        return ready
+
+    def __len__(self):
+        return len(self._results)
@@ -3,12 +3,11 @@
 from __future__ import print_function
 
 import codecs
+import collections
+import hashlib
 import json
 import os
 import re
-import requests
-
-import enchant
 
 # for "ulatex" codec
 import latexcodec  # noqa
@@ -24,22 +23,84 @@ from .__about__ import __version__
 from .errors import UniqueError
 
 
+# Only read, never written by betterbib, so there's no need to create the
+# directory.
 _config_dir = appdirs.user_config_dir("betterbib")
-if not os.path.exists(_config_dir):
-    os.makedirs(_config_dir)
 _config_file = os.path.join(_config_dir, "config.ini")
 
+_cache_dir = appdirs.user_cache_dir("betterbib")
+
+
+def get_config_value(section, option, default=None):
+    """Read a single option from the betterbib config file.
+    """
+    config = configparser.ConfigParser()
+    config.read(_config_file)
+    try:
+        return config.get(section, option)
+    except (configparser.NoSectionError, configparser.NoOptionError):
+        return default
+
+
+def get_cache_dir():
+    """Directory of all betterbib caches; the user cache directory unless set
+    in the [CACHE] section of the config file.
+    """
+    return os.path.expanduser(get_config_value("CACHE", "directory", _cache_dir))
+
+
+def get_http_cache_settings():
+    """Settings of the HTTP response caches from the [CACHE] section of the
+    config file, e.g.,
+    ```
+    [CACHE]
+    max_size_mb=100
+    doi_expire_days=90
+    search_expire_days=1
+    ```
+    """
+    max_size_mb = float(get_config_value("CACHE", "max_size_mb", 100))
+    doi_expire_days = float(get_config_value("CACHE", "doi_expire_days", 90))
+    search_expire_days = float(get_config_value("CACHE", "search_expire_days", 1))
+    return {
+        "max_size": max_size_mb * 1024 ** 2,
+        "doi_expire_after": doi_expire_days * 24 * 3600,
+        "search_expire_after": search_expire_days * 24 * 3600,
+    }
+
+
+def get_timeouts():
+    """The connect and read timeouts in seconds of all requests, from the
+    [NETWORK] section of the config file, e.g.,
+    ```
+    [NETWORK]
+    connect_timeout=10
+    read_timeout=30
+    ```
+    """
+    return (
+        float(get_config_value("NETWORK", "connect_timeout", 10)),
+        float(get_config_value("NETWORK", "read_timeout", 30)),
+    )
+
 
 def decode(od):
     """Decode an OrderedDict with LaTeX strings into a dict with unicode
     strings.
     """
     for entry in od.values():
-        for key, value in entry.fields.items():
-            entry.fields[key] = codecs.decode(value, "ulatex")
+        decode_entry(entry)
     return od
 
 
+def decode_entry(entry):
+    """Decode the LaTeX strings in the fields of `entry` into unicode strings.
+    """
+    for key, value in entry.fields.items():
+        entry.fields[key] = codecs.decode(value, "ulatex")
+    return entry
+
+
 def pybtex_to_dict(entry):
     """dict representation of BibTeX entry.
     """
@@ -56,11 +117,62 @@ def pybtex_to_dict(entry):
             }
             for p in persons
         ]
-    for field, value in entry.fields.iteritems():
+    for field, value in entry.fields.items():
         d[field.lower()] = value
     return d
 
 
+def _normalize_month(value):
+    months = [
+        "jan",
+        "feb",
+        "mar",
+        "apr",
+        "may",
+        "jun",
+        "jul",
+        "aug",
+        "sep",
+        "oct",
+        "nov",
+        "dec",
+    ]
+    try:
+        return months[int(value) - 1]
+    except (TypeError, ValueError, IndexError):
+        return u"{}".format(value)[:3].lower()
+
+
+def fingerprint(entry):
+    """Hash of the normalized content of a BibTeX entry. It doesn't change with
+    cosmetic edits like case, white space, curly braces, LaTeX escapes, the
+    spelling of the month, or DOI vs. DOI URL.
+    """
+
+    def normalize(value):
+        value = u"{}".format(value)
+        try:
+            value = codecs.decode(value, "ulatex")
+        except Exception:  # pylint: disable=broad-except
+            pass
+        value = value.replace("{", "").replace("}", "")
+        return u" ".join(value.lower().split())
+
+    items = [["type", entry.type.lower()]]
+    for key, persons in entry.persons.items():
+        items.append([key.lower(), [normalize(_get_person_str(p)) for p in persons]])
+    for key, value in entry.fields.items():
+        key = key.lower()
+        if key == "month":
+            value = _normalize_month(value)
+        elif key in ["doi", "url"]:
+            value = doi_from_url(u"{}".format(value)) or value
+        items.append([key, normalize(value)])
+
+    string = json.dumps(sorted(items), ensure_ascii=False)
+    return hashlib.sha1(string.encode("utf-8")).hexdigest()
+
+
 def translate_month(key):
     """The month value can take weird forms. Sometimes, it's given as an int,
     sometimes as a string representing an int, and sometimes the name of the
@@ -104,7 +216,11 @@ def translate_month(key):
 
 
 def create_dict():
-    d = enchant.DictWithPWL("en_US")
+    # enchant loads its C library and the dictionary files on import, so only
+    # import it when a dictionary is really needed.
+    import enchant
+
+    d = enchant.DictWithPWL(_dictionary_tag)
 
     # read extra names from config file
     config = configparser.ConfigParser()
@@ -132,36 +248,221 @@ def create_dict():
     return d
 
 
-def _translate_word(word, d):
+# the enchant dictionary that titles are checked against
+_dictionary_tag = "en_US"
+
+_default_dict = None
+
+
+def _get_default_dict():
+    # The dictionary is expensive to create; do it once, on first use.
+    global _default_dict  # pylint: disable=global-statement
+    if _default_dict is None:
+        _default_dict = create_dict()
+    return _default_dict
+
+
+def _needs_protection(word, d):
     # Check if the word needs to be protected by curly braces to prevent
     # recapitalization.
     if not word:
-        needs_protection = False
-    elif word.count("{") != word.count("}"):
-        needs_protection = False
-    elif word[0] == "{" and word[-1] == "}":
-        needs_protection = False
-    elif any([char.isupper() for char in word[1:]]):
-        needs_protection = True
-    else:
-        needs_protection = (
-            any([char.isupper() for char in word])
-            and d.check(word)
-            and not d.check(word.lower())
+        return False
+    if word.count("{") != word.count("}"):
+        return False
+    if word[0] == "{" and word[-1] == "}":
+        return False
+    if any([char.isupper() for char in word[1:]]):
+        return True
+    return (
+        any([char.isupper() for char in word])
+        and d.check(word)
+        and not d.check(word.lower())
+    )
+
+
+def _describe_dictionary():
+    """The versions of pyenchant and the enchant library and the providers,
+    e.g., hunspell, of the dictionary. This imports enchant, so it's only
+    called once the dictionary is needed anyway.
+    """
+    try:
+        import enchant
+    except ImportError:
+        return None
+    providers = sorted(
+        [provider.name, provider.file]
+        for tag, provider in enchant.Broker().list_dicts()
+        if tag == _dictionary_tag
+    )
+    return [
+        _dictionary_tag,
+        enchant.__version__,
+        enchant.get_enchant_version(),
+        providers,
+    ]
+
+
+def _dictionary_config_hash():
+    """Hash of the configuration the protection of a word depends on: the
+    dictionary, the DICTIONARY add/remove lists in the config file, and the
+    betterbib version. The versions of the dictionary are checked separately,
+    see _describe_dictionary.
+    """
+    config = configparser.ConfigParser()
+    config.read(_config_file)
+    lists = []
+    for option in ["add", "remove"]:
+        try:
+            words = config.get("DICTIONARY", option).split(",")
+        except (configparser.NoSectionError, configparser.NoOptionError):
+            words = []
+        lists.append(sorted(word.strip() for word in words))
+    string = json.dumps([__version__, _dictionary_tag, lists])
+    return hashlib.sha1(string.encode("utf-8")).hexdigest()
+
+
+class WordProtectionCache(object):
+    """Remembers which words need to be {}-protected in titles. A bibliography
+    shares most of its vocabulary across titles, so the dictionary has to be
+    consulted only once per unique word. At most `max_size` decisions are kept,
+    dropping the least recently used first.
+
+    With `filename`, the decisions are loaded from and saved to that file, one
+    JSON line per word. New decisions are appended on save. They are all
+    discarded if the dictionary or the DICTIONARY section of the config file
+    has changed since. A new version of the dictionary is noticed on the first
+    word that isn't cached, when the dictionary is loaded anyway.
+    """
+
+    def __init__(self, dictionary=None, max_size=100000, filename=None):
+        self._dictionary = dictionary
+        self.max_size = max_size
+        self.filename = filename
+        self.config_hash = _dictionary_config_hash()
+        # the versions of the dictionary the decisions were made with, see
+        # _describe_dictionary, and whether they have been checked
+        self.description = None
+        self._checked = False
+        self._decisions = collections.OrderedDict()
+        # the decisions not saved yet, and the number of them in the file, or
+        # None if it must be rewritten
+        self._new = collections.OrderedDict()
+        self._num_lines = None
+        if filename is not None:
+            self.load()
+        return
+
+    @property
+    def dictionary(self):
+        # Only create the dictionary if there is a word that's not cached.
+        if self._dictionary is None:
+            self._dictionary = _get_default_dict()
+        return self._dictionary
+
+    def needs_protection(self, word):
+        if word not in self._decisions and not self._checked:
+            self._check_description()
+        try:
+            decision = self._decisions.pop(word)
+        except KeyError:
+            decision = _needs_protection(word, self.dictionary)
+            self._new[word] = decision
+        self._decisions[word] = decision
+        if len(self._decisions) > self.max_size:
+            self._decisions.popitem(last=False)
+        return decision
+
+    def _check_description(self):
+        self._checked = True
+        description = _describe_dictionary()
+        if description != self.description:
+            # made with another version of the dictionary
+            self._decisions.clear()
+            self._new.clear()
+            self._num_lines = None
+            self.description = description
+        return
+
+    def load(self):
+        try:
+            with open(self.filename) as f:
+                header = json.loads(f.readline())
+                if header.get("config") != self.config_hash:
+                    return
+                self.description = header.get("dictionary")
+                num_lines = 0
+                for line in f:
+                    try:
+                        word, decision = json.loads(line)
+                    except ValueError:
+                        # torn by an interrupted save
+                        continue
+                    self._decisions.pop(word, None)
+                    self._decisions[word] = decision
+                    num_lines += 1
+        except (IOError, OSError, ValueError, AttributeError):
+            return
+        self._num_lines = num_lines
+        while len(self._decisions) > self.max_size:
+            self._decisions.popitem(last=False)
+        return
+
+    def save(self):
+        """Append the decisions made since the last save to the file. It is
+        only rewritten if it's missing or stale, or if it has grown to twice
+        `max_size` lines.
+        """
+        if self._num_lines is not None and not self._new:
+            return
+        directory = os.path.dirname(self.filename)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        rewrite = (
+            self._num_lines is None
+            or self._num_lines + len(self._new) > 2 * self.max_size
+        )
+        if rewrite:
+            tmp = self.filename + ".tmp"
+            with open(tmp, "w") as f:
+                header = {"config": self.config_hash, "dictionary": self.description}
+                f.write(json.dumps(header) + "\n")
+                for item in self._decisions.items():
+                    f.write(json.dumps(item) + "\n")
+            os.replace(tmp, self.filename)
+            self._num_lines = len(self._decisions)
+        else:
+            with open(self.filename, "a") as f:
+                for item in self._new.items():
+                    f.write(json.dumps(item) + "\n")
+            self._num_lines += len(self._new)
+        self._new.clear()
+        return
+
+
+_default_protection_cache = None
+
+
+def _get_default_protection_cache():
+    global _default_protection_cache  # pylint: disable=global-statement
+    if _default_protection_cache is None:
+        _default_protection_cache = WordProtectionCache(
+            filename=os.path.join(get_cache_dir(), "word-protection.json")
         )
+    return _default_protection_cache
+
+
+def _translate_word(word, d):
+    if isinstance(d, WordProtectionCache):
+        needs_protection = d.needs_protection(word)
+    else:
+        needs_protection = _needs_protection(word, d)
 
     if needs_protection:
         return "{" + word + "}"
     return word
 
 
-def _translate_title(val, dictionary=create_dict()):
-    """The capitalization of BibTeX entries is handled by the style, so names
-    (Newton) or abbreviations (GMRES) may not be capitalized. This is unless
-    they are wrapped in curly braces.
-    This function takes a raw title string as input and {}-protects those parts
-    whose capitalization should not change.
-    """
+def _title_words(val):
     # If the title is completely capitalized, it's probably by mistake.
     if val == val.upper():
         val = val.title()
@@ -175,22 +476,46 @@ def _translate_title(val, dictionary=create_dict()):
     for k in range(len(words)):
         if k > 0 and words[k - 1][-1] == ":" and words[k][0] != "{":
             words[k] = "{" + words[k].capitalize() + "}"
+    return words
+
+
+def _translate_title(val, dictionary=None):
+    """The capitalization of BibTeX entries is handled by the style, so names
+    (Newton) or abbreviations (GMRES) may not be capitalized. This is unless
+    they are wrapped in curly braces.
+    This function takes a raw title string as input and {}-protects those parts
+    whose capitalization should not change. `dictionary` is an enchant
+    dictionary or a WordProtectionCache.
+    """
+    if dictionary is None:
+        dictionary = _get_default_protection_cache()
 
     words = [
         "-".join([_translate_word(w, dictionary) for w in word.split("-")])
-        for word in words
+        for word in _title_words(val)
     ]
 
     return " ".join(words)
 
 
+def _encode(key, value):
+    try:
+        value = codecs.encode(value, "ulatex")
+    except Exception as exc:
+        # expected unicode for encode input, but got int instead
+        import warnings
+        warnings.warn("For key: %s\n%s" % (key, str(exc)))
+        pass
+    return value
+
+
 # pylint: disable=too-many-locals,too-many-arguments
 def pybtex_to_bibtex_string(
     entry,
     bibtex_key,
     brace_delimeters=True,
     tab_indent=False,
-    dictionary=create_dict(),
+    dictionary=None,
     sort=False,
 ):
     """String representation of BibTeX entry.
@@ -210,14 +535,7 @@ def pybtex_to_bibtex_string(
         keys = sorted(keys)
 
     for key in keys:
-        value = entry.fields[key]
-        try:
-            value = codecs.encode(value, "ulatex")
-        except Exception as exc:
-            # expected unicode for encode input, but got int instead
-            import warnings
-            warnings.warn("For key: %s\n%s" % (key, str(exc)))
-            pass
+        value = _encode(key, entry.fields[key])
 
         # Always make keys lowercase
         key = key.lower()
@@ -251,9 +569,29 @@ def doi_from_url(url):
     return None
 
 
-def get_short_doi(doi):
+def get_short_doi(doi, session=None, stats=None):
+    """Look up the shortDOI for `doi`. Pass a `session` when resolving many DOIs
+    to reuse its pooled connections. The request is recorded in `stats`, a
+    RequestStats, if given.
+    """
+    if session is None:
+        from .session import create_session
+
+        session = create_session(1)
+
+    from requests import RequestException
+
     url = "http://shortdoi.org/" + doi
-    r = requests.get(url, params={"format": "json"})
+    try:
+        if stats is None:
+            r = session.get(url, params={"format": "json"})
+        else:
+            r = stats.get(
+                session, "shortdoi", "shortDOI", url, params={"format": "json"}
+            )
+    except RequestException:
+        # e.g., timed out
+        return None
     if not r.ok:
         return None
 
@@ -343,20 +681,69 @@ def heuristic_unique_result(results, d):
     raise UniqueError("Could not find a positively unique match.")
 
 
-def write(od, file_handle, delimeter_type, tab_indent):
-    # Create the dictionary only once
-    dictionary = create_dict()
+def _format_entries(items, brace_delimeters, tab_indent):
+    # Runs in a worker process, with the worker's own dictionary.
+    return [
+        pybtex_to_bibtex_string(
+            d, bib_id, brace_delimeters=brace_delimeters, tab_indent=tab_indent
+        )
+        for bib_id, d in items
+    ]
+
+
+def _format_in_parallel(items, jobs, chunk_size, brace_delimeters, tab_indent):
+    """Format the (key, entry) pairs `items` in chunks in `jobs` processes and
+    yield the strings in order.
+    """
+    import concurrent.futures
+    import itertools
+
+    items = iter(items)
+    pending = collections.deque()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        while True:
+            chunk = list(itertools.islice(items, chunk_size))
+            if chunk:
+                pending.append(
+                    executor.submit(_format_entries, chunk, brace_delimeters, tab_indent)
+                )
+            # Only keep a few chunks in flight so that streamed input stays
+            # streamed.
+            while pending and (not chunk or len(pending) >= 2 * jobs):
+                for string in pending.popleft().result():
+                    yield string
+            if not chunk:
+                break
+
+
+def write(
+    od, file_handle, delimeter_type, tab_indent, jobs=1, chunk_size=256, flush=False
+):
+    """Write the entries in `od`, a dictionary from BibTeX keys to entries, to
+    `file_handle`. For streaming, `od` can also be an iterable of (key, entry)
+    pairs; every entry is then written as soon as it comes in. With `flush`,
+    it's also passed on right away, e.g., to the next program in a pipe.
+
+    With `jobs` > 1, chunks of `chunk_size` entries are formatted in that many
+    processes. The order of the entries is preserved.
+    """
+    # The protection of every word is decided once, then taken from the cache.
+    dictionary = _get_default_protection_cache()
+    items = od.items() if hasattr(od, "items") else od
 
     # Write header to the output file.
-    segments = [
+    file_handle.write(
         "%comment{{This file was created with betterbib v{}.}}\n\n".format(__version__)
-    ]
+    )
 
     brace_delimeters = delimeter_type == "braces"
 
-    # Add segments for each bibtex entry in order
-    segments.extend(
-        [
+    if jobs > 1:
+        strings = _format_in_parallel(
+            items, jobs, chunk_size, brace_delimeters, tab_indent
+        )
+    else:
+        strings = (
             pybtex_to_bibtex_string(
                 d,
                 bib_id,
@@ -364,12 +751,23 @@ def write(od, file_handle, delimeter_type, tab_indent):
                 tab_indent=tab_indent,
                 dictionary=dictionary,
             )
-            for bib_id, d in od.items()
-        ]
-    )
+            for bib_id, d in items
+        )
+
+    from . import profiling
 
-    # Write all segments to the file at once
-    file_handle.write("\n\n".join(segments) + "\n")
+    # Write the entries in order
+    for string in profiling.iterate("format", strings):
+        file_handle.write("\n\n" + string)
+        if flush:
+            file_handle.flush()
+    file_handle.write("\n")
+
+    try:
+        dictionary.save()
+    except (IOError, OSError):
+        # The cache directory is not writable; that's fine.
+        pass
 
 
 def update(entry1, entry2):
@@ -394,19 +792,36 @@ def update(entry1, entry2):
 
 
 class JournalNameUpdater(object):
-    def __init__(self, long_journal_names=False):
-        this_dir = os.path.dirname(os.path.realpath(__file__))
-        with open(os.path.join(this_dir, "data/journals.json"), "r") as f:
-            self.table = json.load(f)
+    """Replaces journal names by their abbreviations or, with
+    `long_journal_names`, the other way around. Names that are written slightly
+    differently from the table are matched after normalization and, with
+    `fuzzy`, by similarity; see JournalIndex.match.
+    """
+
+    def __init__(self, long_journal_names=False, fuzzy=False, min_confidence=0.8):
+        # The compiled index is memory-mapped; there's nothing to load.
+        from .journals import JournalIndex
 
-        if long_journal_names:
-            self.table = {v: k for k, v in self.table.items()}
+        self.index = JournalIndex()
+        self.long_journal_names = long_journal_names
+        self.fuzzy = fuzzy
+        self.min_confidence = min_confidence
         return
 
     def update(self, entry):
+        """Update the journal name of `entry` and return the JournalMatch, or
+        None if the name is unknown.
+        """
         try:
             journal_name = entry.fields["journal"]
-            entry.fields["journal"] = self.table[journal_name]
         except KeyError:
-            pass
-        return
+            return None
+        match = self.index.match(
+            journal_name,
+            long_journal_names=self.long_journal_names,
+            fuzzy=self.fuzzy,
+            min_confidence=self.min_confidence,
+        )
+        if match is not None:
+            entry.fields["journal"] = match.name
+        return match
@@ -23,40 +23,44 @@ setup(
     author=about["__author__"],
     author_email=about["__author_email__"],
     packages=find_packages(),
-    package_data={"betterbib": ["data/journals.json"]},
+    package_data={"betterbib": ["data/journals.json", "data/journals.idx"]},
     description="Better BibTeX data",
     long_description=read("README.md"),
     long_description_content_type="text/markdown",
     url=about["__website__"],
     license=about["__license__"],
     platforms="any",
+    python_requires=">=3.7",
     install_requires=[
         "latexcodec",
         "pipdate >=0.3.0, <0.4.0",
         "pybtex >= 0.19.0",
         "pyenchant",
         "requests",
-        "requests_cache",
+        "requests_cache >= 1.0",
         "tqdm",
     ],
+    extras_require={"async": ["aiohttp"]},
     classifiers=[
         about["__status__"],
         about["__license__"],
         "Intended Audience :: Science/Research",
         "Operating System :: OS Independent",
         "Programming Language :: Python",
-        "Programming Language :: Python :: 2",
         "Programming Language :: Python :: 3",
+        "Programming Language :: Python :: 3 :: Only",
         "Topic :: Scientific/Engineering",
         "Topic :: Utilities",
     ],
     scripts=["tools/betterbib"],
     entry_points={
         "console_scripts": [
-            "betterbib-dedup-doi = betterbib.cli.dedup_doi:main"
+            "betterbib-dedup-doi = betterbib.cli.dedup_doi:main",
             "betterbib-doi2bibtex = betterbib.cli.doi2bibtex:main",
             "betterbib-format = betterbib.cli.format:main",
             "betterbib-journal-abbrev = betterbib.cli.journal_abbrev:main",
+            "betterbib-pipeline = betterbib.cli.pipeline:main",
+            "betterbib-standin = betterbib.cli.standin:main",
             "betterbib-sync = betterbib.cli.sync:main",
         ]
     },
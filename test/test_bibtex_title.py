@@ -1,5 +1,8 @@
 # -*- coding: utf-8 -*-
 #
+import os
+import tempfile
+
 import betterbib
 
 
@@ -62,3 +65,69 @@ def test():
         == "{Aaa {${\\text{Pt/Co/AlO}}_{x}$} aaa bbb}"
     )
     return
+
+
+def test_word_protection_cache(monkeypatch):
+    filename = tempfile.NamedTemporaryFile().name
+    config_file = tempfile.NamedTemporaryFile().name
+    monkeypatch.setattr(betterbib.tools, "_config_file", config_file)
+
+    cache = betterbib.tools.WordProtectionCache(max_size=2, filename=filename)
+    assert betterbib.tools._translate_title("Newton and GMRES", cache) == (
+        "{Newton} and {GMRES}"
+    )
+    # only the two most recently used words are kept
+    assert list(cache._decisions) == ["and", "GMRES"]
+    cache.save()
+
+    cache = betterbib.tools.WordProtectionCache(filename=filename)
+    assert cache._decisions == {"and": False, "GMRES": True}
+
+    # Only new decisions are written, and they are appended.
+    with open(filename) as f:
+        content = f.read()
+    cache.needs_protection("GMRES")
+    cache.save()
+    with open(filename) as f:
+        assert f.read() == content
+    cache.needs_protection("Newton")
+    cache.save()
+    with open(filename) as f:
+        assert f.read() == content + '["Newton", true]\n'
+    cache = betterbib.tools.WordProtectionCache(filename=filename)
+    assert cache._decisions == {"and": False, "GMRES": True, "Newton": True}
+
+    # A new version of the dictionary invalidates the saved decisions. It's
+    # only looked at once a word isn't cached.
+    descriptions = []
+
+    def describe_new_version():
+        descriptions.append(["en_US", "3.2.3", "2.3.3", []])
+        return descriptions[-1]
+
+    monkeypatch.setattr(betterbib.tools, "_describe_dictionary", describe_new_version)
+    cache = betterbib.tools.WordProtectionCache(filename=filename)
+    assert cache.needs_protection("GMRES")
+    assert not descriptions
+    assert not cache.needs_protection("title")
+    assert len(descriptions) == 1
+    assert cache._decisions == {"title": False}
+    cache.save()
+    cache = betterbib.tools.WordProtectionCache(filename=filename)
+    assert cache._decisions == {"title": False}
+    cache.needs_protection("and")
+    assert len(descriptions) == 2
+    assert cache._decisions == {"title": False, "and": False}
+    cache.save()
+    monkeypatch.undo()
+    monkeypatch.setattr(betterbib.tools, "_config_file", config_file)
+
+    # changing the dictionary config invalidates the saved decisions, too
+    with open(config_file, "w") as f:
+        f.write("[DICTIONARY]\nadd=Newton\n")
+    cache = betterbib.tools.WordProtectionCache(filename=filename)
+    assert not cache._decisions
+
+    os.remove(filename)
+    os.remove(config_file)
+    return
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+#
+import os
+import tempfile
+
+import pybtex
+import pybtex.database
+
+import betterbib
+from betterbib.cache import EntryCache, Journal, Store
+from betterbib.session import create_session
+from betterbib.standin import StandIn
+
+
+def test_store():
+    filename = tempfile.NamedTemporaryFile().name
+
+    store = Store(filename)
+    store.set("a", {"b": [1, 2]})
+    assert store.get("a") == {"b": [1, 2]}
+    assert store.get("c") is None
+    store.close()
+
+    # expired values are gone
+    store = Store(filename, expire_after=-1.0)
+    assert store.get("a") is None
+    store.close()
+
+    os.remove(filename)
+    return
+
+
+def test_entry_cache():
+    filename = tempfile.NamedTemporaryFile().name
+
+    data = pybtex.database.Entry(
+        "article",
+        fields={"title": u"A Framework", "year": 2013, "doi": u"10.1137/110820713"},
+        persons={"author": [pybtex.database.Person(u"Gaul, Andr\xe9")]},
+    )
+
+    cache = EntryCache(filename, "crossref")
+    cache.set("abc", data)
+    assert cache.get("def") is None
+    assert EntryCache(filename, "dblp").get("abc") is None
+
+    out = cache.get("abc")
+    assert betterbib.pybtex_to_bibtex_string(
+        out, "key", sort=True
+    ) == betterbib.pybtex_to_bibtex_string(data, "key", sort=True)
+
+    os.remove(filename)
+    return
+
+
+def test_journal():
+    filename = tempfile.NamedTemporaryFile().name
+    entry = pybtex.database.Entry(
+        "article",
+        fields={"title": "A title", "doi": "10.1/a"},
+        persons={"author": [pybtex.database.Person("Doe, Jane")]},
+    )
+
+    journal = Journal(filename, "crossref:short")
+    journal.record("a", "1234", "found", entry)
+    journal.record("b", "5678", "not found", None)
+    journal.close()
+    # killed in the middle of a line
+    with open(filename, "a") as f:
+        f.write('{"key": "c", "fing')
+
+    journal = Journal(filename, "crossref:short", resume=True)
+    assert len(journal) == 2
+    outcome, data = journal.get("a", "1234")
+    assert outcome == "found"
+    assert data.fields["title"] == "A title"
+    assert str(data.persons["author"][0]) == "Doe, Jane"
+    assert journal.get("b", "5678") == ("not found", None)
+    # changed since
+    assert journal.get("a", "4321") is None
+    journal.record("c", "9", "ambiguous", None)
+    journal.close()
+
+    journal = Journal(filename, "crossref:short", resume=True)
+    assert len(journal) == 3
+    journal.close()
+
+    # another source: start over
+    journal = Journal(filename, "dblp:short", resume=True)
+    assert len(journal) == 0
+    journal.close()
+
+    os.remove(filename)
+    return
+
+
+def test_lru_session(tmp_path):
+    cache_name = str(tmp_path / "responses.sqlite")
+    max_size = 8000
+    with StandIn(synthesize=True) as standin:
+        session = create_session(cache_name=cache_name, max_size=max_size)
+        for k in range(40):
+            assert session.get(standin.crossref_url + "/10.1/{}".format(k)).ok
+        # evicted while running, not only when the session is created
+        connection = session._connect()
+        (size,) = connection.execute(
+            "SELECT SUM(LENGTH(value)) FROM responses"
+        ).fetchone()
+        connection.close()
+        assert 0 < size <= 1.1 * max_size + 2000
+
+        # the most recently used responses are kept
+        assert session.get(standin.crossref_url + "/10.1/39").from_cache
+    return
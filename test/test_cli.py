@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 #
 import os
+import subprocess
+import sys
 import tempfile
 
 import betterbib
@@ -96,6 +98,31 @@ def test_cli_journal_abbrev():
     return
 
 
+def test_cli_journal_abbrev_fuzzy():
+    infile = tempfile.NamedTemporaryFile().name
+    with open(infile, "w") as f:
+        f.write("@article{foobar,\njournal={SIAM Journal on Scientific Computng}\n}")
+
+    outfile = tempfile.NamedTemporaryFile().name
+
+    # the flag doesn't take the infile for its value
+    betterbib.cli.journal_abbrev(["--fuzzy", infile, outfile])
+
+    with open(outfile, "r") as f:
+        assert " journal = {SIAM J. Sci. Comput.},\n" in f.read()
+
+    # not as confident as that
+    betterbib.cli.journal_abbrev(
+        ["--fuzzy", "--min-confidence", "0.999", infile, outfile]
+    )
+    with open(outfile, "r") as f:
+        assert " journal = {SIAM Journal on Scientific Computng},\n" in f.read()
+
+    os.remove(infile)
+    os.remove(outfile)
+    return
+
+
 def test_cli_sync():
     infile = tempfile.NamedTemporaryFile().name
     with open(infile, "w") as f:
@@ -166,3 +193,16 @@ def test_cli_doit2bibtex():
 
     os.remove(outfile)
     return
+
+
+def test_cli_submodule_import():
+    # Importing the module of a tool first doesn't hide its main function.
+    code = (
+        "import importlib\n"
+        "importlib.import_module('betterbib.cli.sync')\n"
+        "import betterbib\n"
+        "betterbib.cli.sync(['--version'])\n"
+    )
+    out = subprocess.check_output([sys.executable, "-c", code])
+    assert out.decode("utf-8").startswith("betterbib ")
+    return
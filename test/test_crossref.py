@@ -1,10 +1,14 @@
 # -*- coding: utf-8 -*-
 #
+import concurrent.futures
+
 import pybtex
 import pybtex.database
 import pytest
 
 import betterbib
+from betterbib import tools
+from betterbib.standin import Faults, StandIn
 
 
 def test_crossref_article0():
@@ -416,6 +420,54 @@ def test_doi_only():
     return
 
 
+def test_dois_batch():
+    source = betterbib.Crossref()
+
+    dois = [u"10.1137/110820713", u"10.1002/0470868279", u"10.1234/does-not-exist"]
+    out = source.get_by_dois(dois, batch_size=2)
+
+    assert sorted(out.keys()) == [u"10.1002/0470868279", u"10.1137/110820713"]
+    for doi in out:
+        assert betterbib.pybtex_to_bibtex_string(
+            out[doi], "key", sort=True
+        ) == betterbib.pybtex_to_bibtex_string(
+            source.get_by_doi(doi), "key", sort=True
+        )
+    return
+
+
+def test_book_chapter_type(monkeypatch, tmp_path):
+    monkeypatch.setattr(tools, "_cache_dir", str(tmp_path))
+    chapters = [
+        {"type": "book-chapter", "DOI": "10.1007/978-3-319-1_{}".format(k)}
+        for k in range(8)
+    ]
+
+    # Slow enough for all chapters to ask for the book at the same time
+    with StandIn(synthesize=True, faults=Faults(latency=0.2)) as standin:
+        source = betterbib.Crossref(api_url=standin.crossref_url)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+            types = list(executor.map(source._crossref_to_bibtex_type, chapters))
+    assert types == 8 * ["inbook"]
+    assert standin.stats["synthesized"] == 1
+
+    # Another instance reads the type from the store; this stand-in doesn't
+    # know the book.
+    with StandIn() as standin:
+        source = betterbib.Crossref(api_url=standin.crossref_url)
+        assert source._crossref_to_bibtex_type(chapters[0]) == "inbook"
+    assert sum(standin.stats.values()) == 0
+
+    # If the book can't be reached, the chapter is taken to be part of a
+    # collection, and the next one tries again.
+    source = betterbib.Crossref(api_url="http://127.0.0.1:1", max_retries=0)
+    chapter = {"type": "book-chapter", "DOI": "10.1007/978-3-319-2_0"}
+    assert source._crossref_to_bibtex_type(chapter) == "incollection"
+    assert source.book_type_store.get("10.1007/978-3-319-2") is None
+    assert not source._book_types
+    return
+
+
 def test_standard():
 
     source = betterbib.Crossref()
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+#
+import threading
+import time
+
+from betterbib import hedge
+from betterbib.hedge import Hedger
+
+
+def test_delay():
+    hedger = Hedger(max_ratio=0.1, percentile=50, min_samples=5)
+    for _ in range(4):
+        hedger.record("search", 0.1)
+    # too early to tell
+    assert hedger.delay("search") is None
+    hedger.record("search", 0.1)
+    assert abs(hedger.delay("search") - 0.1) < 1.0e-10
+    assert hedger.delay("doi") is None
+
+    # off
+    hedger = Hedger(max_ratio=0.0, min_samples=1)
+    hedger.record("search", 0.1)
+    assert hedger.delay("search") is None
+    return
+
+
+def test_budget():
+    hedger = Hedger(max_ratio=0.1, min_samples=1)
+    for _ in range(20):
+        hedger.record("search", 0.1)
+    assert hedger.allow()
+    assert hedger.allow()
+    assert not hedger.allow()
+    assert hedger.num_hedges == 2
+    return
+
+
+def test_call():
+    hedger = Hedger(max_ratio=1.0, percentile=50, min_samples=1)
+    hedger.record("search", 0.01)
+
+    calls = []
+    lock = threading.Lock()
+
+    def request():
+        with lock:
+            calls.append(None)
+            k = len(calls)
+        # the first one is stuck on the network
+        hedge.attempt_started()
+        time.sleep(2.0 if k == 1 else 0.0)
+        hedge.attempt_done()
+        return k
+
+    start = time.time()
+    assert hedger.call("search", request) == 2
+    assert time.time() - start < 1.0
+    assert hedger.num_hedges == 1
+    assert hedger.num_wins == 1
+
+    # the hedge fails, the first one is taken
+    def failing():
+        with lock:
+            calls.append(None)
+            k = len(calls)
+        if k == 4:
+            raise RuntimeError()
+        hedge.attempt_started()
+        time.sleep(0.2)
+        hedge.attempt_done()
+        return k
+
+    assert hedger.call("search", failing) == 3
+    assert hedger.num_wins == 1
+    hedger.shutdown()
+    return
+
+
+def test_waiting():
+    hedger = Hedger(max_ratio=1.0, percentile=50, min_samples=1)
+    hedger.record("search", 0.05)
+
+    def request():
+        # backing off before the attempt that answers
+        time.sleep(0.5)
+        hedge.attempt_started()
+        time.sleep(0.01)
+        hedge.attempt_done()
+        return 1
+
+    assert hedger.call("search", request) == 1
+    # not hedged while waiting, and the wait isn't latency
+    assert hedger.num_hedges == 0
+    assert hedger.num_requests == 2
+    assert max(hedger._latencies["search"]) < 0.25
+    hedger.shutdown()
+    return
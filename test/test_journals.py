@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+#
+import json
+import os
+import tempfile
+
+from betterbib import journals, tools
+from betterbib.journals import (
+    JournalIndex,
+    build_index,
+    get_checksum,
+    json_file,
+    normalize,
+)
+
+
+def test_index():
+    filename = tempfile.NamedTemporaryFile().name
+    build_index({"Long Name": "L. N.", "Lõng Nàme": "L. N.", "Other": "O."}, filename)
+
+    index = JournalIndex(filename)
+    assert index.abbreviate("Long Name") == "L. N."
+    assert index.abbreviate("Lõng Nàme") == "L. N."
+    assert index.abbreviate("L. N.") is None
+    # the last journal with an abbreviation wins
+    assert index.expand("L. N.") == "Lõng Nàme"
+    assert index.expand("O.") == "Other"
+    assert index.expand("Other") is None
+    index.close()
+
+    os.remove(filename)
+    return
+
+
+def test_default_index():
+    with open(json_file) as f:
+        table = json.load(f)
+
+    index = JournalIndex()
+    for key, value in table.items():
+        assert index.abbreviate(key) == value
+    for value, key in {v: k for k, v in table.items()}.items():
+        assert index.expand(value) == key
+    index.close()
+    return
+
+
+def test_index_file(monkeypatch, tmp_path):
+    table = {"Long Name": "L. N."}
+    small_json_file = str(tmp_path / "journals.json")
+    with open(small_json_file, "w") as f:
+        json.dump(table, f)
+    monkeypatch.setattr(journals, "json_file", small_json_file)
+    monkeypatch.setattr(tools, "_cache_dir", str(tmp_path / "cache"))
+
+    # A packaged index that is up to date is used.
+    packaged = str(tmp_path / "journals.idx")
+    build_index(table, packaged, get_checksum(small_json_file))
+    monkeypatch.setattr(journals, "_packaged_index_file", packaged)
+    assert journals.get_index_file() == packaged
+
+    # One that doesn't match journals.json isn't used, but built anew.
+    build_index({"Other": "O."}, packaged, checksum=1)
+    filename = journals.get_index_file()
+    assert os.path.dirname(filename) == str(tmp_path / "cache")
+    index = JournalIndex()
+    assert index.abbreviate("Long Name") == "L. N."
+    assert index.abbreviate("Other") is None
+    index.close()
+
+    # and only once
+    mtime = os.stat(filename).st_mtime
+    assert journals.get_index_file() == filename
+    assert os.stat(filename).st_mtime == mtime
+    return
+
+
+def test_normalize():
+    assert normalize("Journal of Physics \\& {Chemistry}.") == (
+        "journal of physics and chemistry"
+    )
+    assert normalize('Zeitschrift f\\"{u}r Physik') == "zeitschrift fur physik"
+    assert normalize("Zeitschrift für  Physik") == "zeitschrift fur physik"
+    return
+
+
+def test_match():
+    index = JournalIndex()
+
+    m = index.match("SIAM Journal on Matrix Analysis and Applications")
+    assert m.name == "SIAM J. Matrix Anal. Appl."
+    assert (m.method, m.confidence) == ("exact", 1.0)
+
+    m = index.match("SIAM journal on matrix analysis \\& applications")
+    assert m.key == "SIAM Journal on Matrix Analysis and Applications"
+    assert (m.method, m.confidence) == ("normalized", 1.0)
+
+    m = index.match("Siam J Matrix Anal Appl", long_journal_names=True)
+    assert m.name == "SIAM Journal on Matrix Analysis and Applications"
+    assert m.method == "normalized"
+
+    m = index.match("SIAM Journal on Matrix Analysis and Aplications")
+    assert m.key == "SIAM Journal on Matrix Analysis and Applications"
+    assert m.method == "fuzzy"
+    assert 0.8 < m.confidence < 1.0
+
+    m = index.match("SIAM Journal on Matrix Analysis and Aplications", fuzzy=False)
+    assert m is None
+    assert index.match("Something completely different") is None
+    index.close()
+    return
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+#
+import json
+import pstats
+
+from betterbib import profiling
+
+
+def test_profile(tmp_path):
+    profile_file = str(tmp_path / "out.prof")
+    memory_file = str(tmp_path / "out.json")
+
+    # without a profiler, nothing happens
+    with profiling.stage("parse"):
+        assert list(profiling.iterate("decode", range(3))) == [0, 1, 2]
+
+    with profiling.profile(profile_file, memory_file):
+        with profiling.stage("parse"):
+            data = [str(k) * 100 for k in range(1000)]
+        assert len(list(profiling.iterate("decode", iter(data)))) == 1000
+        with profiling.stage("write"):
+            with profiling.stage("format"):
+                "".join(data)
+
+    assert profiling._active is None  # pylint: disable=protected-access
+    pstats.Stats(profile_file)
+
+    with open(memory_file, "r") as f:
+        stages = json.load(f)["stages"]
+    assert set(stages) == {"parse", "decode", "write", "format", "other"}
+    for stage in stages.values():
+        assert set(stage) == {"seconds", "peak_bytes", "peak_growth_bytes", "top_sites"}
+    assert stages["parse"]["peak_growth_bytes"] > 100 * 1000
+    assert stages["parse"]["top_sites"]
+    return
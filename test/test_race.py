@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+#
+import pybtex
+import pybtex.database
+import pytest
+
+from betterbib import crossref, dblp, errors, tools
+from betterbib.race import Race, merge, pick_error
+from betterbib.standin import Faults, StandIn
+
+ENTRY = pybtex.database.Entry(
+    "article",
+    fields={"title": "Krylov subspace methods"},
+    persons={"author": [pybtex.database.Person("Gaul, André")]},
+)
+
+
+def test_race(monkeypatch, tmp_path):
+    monkeypatch.setattr(tools, "_cache_dir", str(tmp_path))
+
+    for latencies, winner in [((0.5, 0.0), "DBLP"), ((0.0, 0.5), "Crossref")]:
+        with StandIn(
+            synthesize=True, faults=Faults(latency=latencies[0])
+        ) as standin1, StandIn(
+            synthesize=True, faults=Faults(latency=latencies[1])
+        ) as standin2:
+            race = Race(
+                [
+                    crossref.Crossref(api_url=standin1.crossref_url),
+                    dblp.Dblp(api_url=standin2.dblp_url),
+                ]
+            )
+            assert race.find_unique(ENTRY).fields["source"] == winner
+            race.shutdown()
+
+    # The slower source has a match where the faster one has none.
+    with StandIn(synthesize=True, not_found=1.0) as standin1, StandIn(
+        synthesize=True, faults=Faults(latency=0.2)
+    ) as standin2:
+        race = Race(
+            [
+                crossref.Crossref(api_url=standin1.crossref_url),
+                dblp.Dblp(api_url=standin2.dblp_url),
+            ]
+        )
+        assert race.find_unique(ENTRY).fields["source"] == "DBLP"
+
+        # nothing anywhere
+        standin2.not_found = 1.0
+        entry = pybtex.database.Entry("article", fields={"title": "Deflation"})
+        with pytest.raises(errors.NotFoundError):
+            race.find_unique(entry)
+        race.shutdown()
+    return
+
+
+def test_merge():
+    a = pybtex.database.Entry("article", fields={"doi": "10.1/A", "title": "A"})
+    b = pybtex.database.Entry(
+        "article", fields={"doi": "10.1/a", "title": "B", "pages": "1-2"}
+    )
+    c = pybtex.database.Entry("article", fields={"doi": "10.1/c", "volume": "3"})
+    out = merge(a, [b, c])
+    assert out.fields["title"] == "A"
+    assert out.fields["pages"] == "1-2"
+    assert "volume" not in out.fields
+    return
+
+
+def test_pick_error():
+    not_found = errors.NotFoundError("No match")
+    failed = errors.HttpError("Failed request")
+    down = errors.CircuitOpenError("DBLP is not responding")
+    assert pick_error([not_found, failed]) is failed
+    assert pick_error([down, not_found]) is not_found
+    assert pick_error([down, ValueError()]).__class__ is ValueError
+    return
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+#
+import os
+import tempfile
+import time
+
+from betterbib.ratelimit import RateLimiter, parse_interval, parse_retry_after
+
+
+def test_parse():
+    assert parse_interval("1s") == 1.0
+    assert parse_interval("2m") == 120.0
+    assert parse_retry_after("3") == 3.0
+    # dates in the past mean "now"
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert parse_retry_after("soon") is None
+    return
+
+
+def test_token_bucket():
+    filename = tempfile.NamedTemporaryFile().name
+
+    limiter = RateLimiter(filename, limit=5, interval=1.0)
+    t = time.time()
+    for _ in range(10):
+        limiter.acquire()
+    elapsed = time.time() - t
+    # 5 tokens right away, 5 more at a rate of 5/s
+    assert 0.9 < elapsed < 2.0
+
+    # The budget is shared with every limiter on the same file
+    other = RateLimiter(filename)
+    other.update({"X-Rate-Limit-Limit": "100", "X-Rate-Limit-Interval": "1s"})
+    limiter.pause(0.5)
+    t = time.time()
+    limiter.acquire()
+    assert time.time() - t >= 0.45
+
+    os.remove(filename)
+    return
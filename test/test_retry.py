@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+#
+import asyncio
+import time
+
+import pybtex
+import pybtex.database
+import pytest
+
+from betterbib import crossref, errors, tools
+from betterbib.retry import CircuitBreaker, RetryPolicy
+from betterbib.standin import Faults, StandIn
+
+
+def test_backoff():
+    policy = RetryPolicy(max_retries=5, backoff=1.0, max_backoff=6.0, seed=0)
+    for k, d in enumerate([1.0, 2.0, 4.0, 6.0, 6.0]):
+        assert d / 2 <= policy.delay(k) <= d
+    # Retry-After wins
+    assert policy.delay(3, retry_after=0.25) == 0.25
+    assert RetryPolicy.is_retryable(503)
+    assert not RetryPolicy.is_retryable(404)
+    return
+
+
+def test_circuit_breaker():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=0.1)
+    breaker.failure()
+    breaker.success()
+    breaker.failure()
+    breaker.check()
+    breaker.failure()
+    assert breaker.is_open
+    with pytest.raises(errors.CircuitOpenError):
+        breaker.check()
+
+    time.sleep(0.1)
+    # one trial request ...
+    breaker.check()
+    with pytest.raises(errors.CircuitOpenError):
+        breaker.check()
+    # ... which fails
+    breaker.failure()
+    with pytest.raises(errors.CircuitOpenError):
+        breaker.check()
+
+    time.sleep(0.1)
+    breaker.check()
+    breaker.success()
+    assert not breaker.is_open
+    breaker.check()
+    return
+
+
+def test_trial(monkeypatch, tmp_path):
+    monkeypatch.setattr(tools, "_cache_dir", str(tmp_path))
+
+    def open_breaker(breaker):
+        breaker.reset_timeout = 0.0
+        for _ in range(breaker.failure_threshold):
+            breaker.failure()
+        assert breaker.is_open
+        return
+
+    # A trial that gets 429 closes the circuit: the source is there.
+    breaker = CircuitBreaker("test", failure_threshold=1)
+    open_breaker(breaker)
+    assert breaker.check()
+    breaker.record(429)
+    assert not breaker.is_open
+    # but 429 doesn't count as success otherwise
+    breaker.failure()
+    assert breaker.is_open
+
+    # A trial that doesn't get an answer is released.
+    with StandIn(synthesize=True, faults=Faults(latency=2.0)) as standin:
+        source = crossref.Crossref(api_url=standin.crossref_url)
+
+        open_breaker(source.circuit_breaker)
+        source.retry_policy.deadline = time.time() - 1.0
+        with pytest.raises(errors.DeadlineError):
+            source.get_by_doi("10.1/a")
+        assert source.circuit_breaker.check()
+        source.circuit_breaker.release()
+
+        # cancelled, as a lost race or hedge is
+        aiohttp = pytest.importorskip("aiohttp")
+        from betterbib import aio
+
+        async def cancel():
+            async with aiohttp.ClientSession() as session:
+                task = asyncio.ensure_future(
+                    aio._get_json(
+                        session,
+                        standin.crossref_url + "/10.1/b",
+                        circuit_breaker=source.circuit_breaker,
+                    )
+                )
+                await asyncio.sleep(0.2)
+                task.cancel()
+                with pytest.raises(asyncio.CancelledError):
+                    await task
+            return
+
+        asyncio.run(cancel())
+        assert source.circuit_breaker.check()
+    return
+
+
+def test_retries(monkeypatch, tmp_path):
+    monkeypatch.setattr(tools, "_cache_dir", str(tmp_path))
+    entry = pybtex.database.Entry("article", fields={"title": "Krylov methods"})
+
+    # Half of the requests fail, the retries get through.
+    faults = Faults(rate_5xx=0.5, seed=1)
+    with StandIn(synthesize=True, faults=faults) as standin:
+        source = crossref.Crossref(api_url=standin.crossref_url, max_retries=10)
+        source.retry_policy.backoff = 0.0
+        source.circuit_breaker.failure_threshold = 100
+        for k in range(5):
+            entry.fields["year"] = str(2000 + k)
+            source.find_unique(entry)
+    assert standin.stats["5xx"] > 0
+
+    # Unknown DOIs aren't failures.
+    with StandIn() as standin:
+        source = crossref.Crossref(api_url=standin.crossref_url)
+        with pytest.raises(errors.NotFoundError):
+            source.get_by_doi("10.1/unknown")
+        assert source.get_by_dois(["10.1/a,b"]) == {}
+        assert not source.circuit_breaker.is_open
+
+    # A source that is down is left alone once the circuit is open.
+    with StandIn(synthesize=True, faults=Faults(rate_5xx=1.0)) as standin:
+        source = crossref.Crossref(api_url=standin.crossref_url, max_retries=10)
+        source.retry_policy.backoff = 0.0
+        with pytest.raises(errors.CircuitOpenError):
+            source.find_unique(entry)
+    assert standin.stats["5xx"] == source.circuit_breaker.failure_threshold
+    return
+
+
+def test_timeouts(monkeypatch, tmp_path):
+    monkeypatch.setattr(tools, "_cache_dir", str(tmp_path))
+    monkeypatch.setattr(tools, "get_timeouts", lambda: (1.0, 0.2))
+    entry = pybtex.database.Entry("article", fields={"title": "Krylov methods"})
+
+    with StandIn(synthesize=True, faults=Faults(rate_timeout=1.0, hang=10)) as standin:
+        source = crossref.Crossref(api_url=standin.crossref_url, max_retries=1)
+        source.retry_policy.backoff = 0.0
+        start = time.time()
+        with pytest.raises(errors.HttpError):
+            source.find_unique(entry)
+        assert time.time() - start < 2.0
+        assert standin.stats["timeout"] == 2
+
+        # Nothing goes out after the deadline.
+        source.retry_policy.deadline = time.time() - 1.0
+        with pytest.raises(errors.DeadlineError):
+            source.find_unique(entry)
+        assert standin.stats["requests"] == 2
+    return
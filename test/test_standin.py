@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+#
+import json
+
+import pybtex
+import pybtex.database
+import pytest
+
+from betterbib import crossref, dblp, errors, tools
+from betterbib.standin import Cassette, Faults, StandIn, request_key
+
+ENTRY = pybtex.database.Entry(
+    "article",
+    fields={"title": "A Framework for Deflated and Augmented Krylov Subspace Methods"},
+    persons={"author": [pybtex.database.Person("Liesen, J.")]},
+)
+
+
+def test_synthesize(monkeypatch, tmp_path):
+    monkeypatch.setattr(tools, "_cache_dir", str(tmp_path))
+
+    with StandIn(synthesize=True) as standin:
+        source = crossref.Crossref(api_url=standin.crossref_url)
+        entry = source.find_unique(ENTRY)
+        assert entry.fields["journal"] == "J. Synth. Res."
+        # the same request, the same answer
+        assert source.find_unique(ENTRY).fields["doi"] == entry.fields["doi"]
+
+        out = source.get_by_dois(["10.1/a", "10.1/b"])
+        assert sorted(out) == ["10.1/a", "10.1/b"]
+
+        source = dblp.Dblp(api_url=standin.dblp_url)
+        assert source.find_unique(ENTRY).fields["journal"] == "J. Synth. Res."
+
+    # the repeated search came from the response cache
+    assert standin.stats["synthesized"] == 3
+    return
+
+
+def test_replay(monkeypatch, tmp_path):
+    monkeypatch.setattr(tools, "_cache_dir", str(tmp_path))
+
+    filename = str(tmp_path / "cassette.jsonl")
+    cassette = Cassette(filename)
+    body = {"status": "ok", "message": {"items": []}}
+    cassette.record(request_key("/works?query=a+b"), 200, json.dumps(body))
+
+    # read back from the file; the order of the parameters doesn't matter
+    cassette = Cassette(filename)
+    assert cassette.get(request_key("/works?rows=2&query=a+b")) is None
+    assert cassette.get(request_key("/works?query=a+b")) is not None
+
+    with StandIn(cassette=filename) as standin:
+        source = crossref.Crossref(api_url=standin.crossref_url)
+        monkeypatch.setattr(source, "_get_search_params", lambda d: {"query": "a b"})
+        with pytest.raises(errors.NotFoundError):
+            source.find_unique(ENTRY)
+
+        # not recorded
+        monkeypatch.setattr(source, "_get_search_params", lambda d: {"query": "c"})
+        with pytest.raises(errors.HttpError):
+            source.find_unique(ENTRY)
+
+    assert standin.stats["replayed"] == 1
+    assert standin.stats["missing"] == 1
+    return
+
+
+def test_faults(monkeypatch, tmp_path):
+    monkeypatch.setattr(tools, "_cache_dir", str(tmp_path))
+
+    with StandIn(synthesize=True, faults=Faults(rate_5xx=1.0)) as standin:
+        source = dblp.Dblp(api_url=standin.dblp_url, max_retries=1)
+        with pytest.raises(errors.HttpError):
+            source.find_unique(ENTRY)
+    assert standin.stats["5xx"] == 2
+
+    # Crossref retries after 429
+    faults = Faults(rate_429=1.0, retry_after=0.0)
+    with StandIn(synthesize=True, faults=faults) as standin:
+        source = crossref.Crossref(api_url=standin.crossref_url)
+        with pytest.raises(errors.HttpError):
+            source.find_unique(ENTRY)
+    assert standin.stats["429"] == 4
+    return
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+#
+import pybtex
+import pybtex.database
+
+from betterbib import crossref, tools
+from betterbib.standin import StandIn
+from betterbib.stats import RequestStats, percentile
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 100) == 100
+    assert percentile([3.0], 99) == 3.0
+    assert percentile([], 50) is None
+    return
+
+
+def test_report(monkeypatch, tmp_path):
+    monkeypatch.setattr(tools, "_cache_dir", str(tmp_path))
+
+    entry = pybtex.database.Entry("article", fields={"title": "Krylov methods"})
+    stats = RequestStats(max_slowest=2)
+    with StandIn(synthesize=True) as standin:
+        source = crossref.Crossref(api_url=standin.crossref_url)
+        source.stats = stats
+        source.find_unique(entry)
+        # from the response cache
+        source.find_unique(entry)
+        source.get_by_dois(["10.1/a", "10.1/b"])
+
+    for k, seconds in enumerate([0.1, 0.3, 0.2]):
+        stats.record_entry("key{}".format(k), seconds, "found")
+
+    report = stats.report()
+    r = report["sources"]["crossref"]
+    assert r["requests"] == {"search": 2, "doi": 1}
+    assert r["cache_hits"] == 1
+    assert r["cache_misses"] == 2
+    assert r["bytes"] > 0
+    assert r["latency"]["p50"] <= r["latency"]["p99"]
+    assert [e["key"] for e in report["slowest_entries"]] == ["key1", "key2"]
+    return
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+#
+import io
+
+import pytest
+from pybtex.database import BibliographyDataError
+from pybtex.database.input import bibtex
+
+from betterbib import stream
+
+BIB = """Comments are ignored.
+@string{jcp = "Journal of Computational Physics"}
+@article{a, title = {x {y} z}, journal = jcp}
+@comment{ blah }
+@article
+{c, title = "a (b {c}"}  @article(d, title = {e)}, note = "f)g")
+@book{e,
+  author = {Doe, John and Roe, Jane},
+  title = {Some {T}itle},
+  month = jan,
+}
+"""
+
+
+def test_read():
+    reference = bibtex.Parser().parse_string(BIB).entries
+
+    # one entry at a time, and all at once
+    for chunk_size in [1, 2 ** 20]:
+        entries = list(stream.read(io.StringIO(BIB), chunk_size=chunk_size))
+        assert [key for key, _ in entries] == list(reference)
+        for key, entry in entries:
+            assert entry.type == reference[key].type
+            assert dict(entry.fields) == dict(reference[key].fields)
+            assert entry.persons == reference[key].persons
+    return
+
+
+def test_repeated_key():
+    with pytest.raises(BibliographyDataError):
+        list(stream.read(io.StringIO("@misc{a, note={1}}\n@misc{A, note={2}}"), 1))
+    return
+
+
+def test_reorder_buffer():
+    buffer = stream.ReorderBuffer(3)
+    assert buffer.put(1, "b") == []
+    assert buffer.put(2, "c") == []
+    # the oldest one is missing, so there is no room beyond the window
+    assert buffer.has_room(2)
+    assert not buffer.has_room(3)
+    assert buffer.put(0, "a") == ["a", "b", "c"]
+    assert buffer.has_room(5)
+    assert not buffer.has_room(6)
+    assert buffer.put(3, "d") == ["d"]
+    assert len(buffer) == 0
+    return
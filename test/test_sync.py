@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+#
+import importlib
+import json
+import os
+import threading
+import time
+
+import pybtex
+import pybtex.database
+
+from betterbib import crossref, tools
+from betterbib.standin import Faults, StandIn
+
+sync = importlib.import_module("betterbib.cli.sync")
+
+BIB = "".join(
+    "@article{{k{0},\n title = {{A Study of Krylov Subspace Methods, Part {0}}},\n"
+    " author = {{Liesen, J.}},\n}}\n\n".format(i)
+    for i in range(5)
+)
+
+
+def _items(n):
+    return [
+        (
+            "k{}".format(k),
+            pybtex.database.Entry(
+                "article",
+                fields={"title": "A Study of Krylov Subspace Methods, Part {}".format(k)},
+                persons={"author": [pybtex.database.Person("Liesen, J.")]},
+            ),
+            True,
+        )
+        for k in range(n)
+    ]
+
+
+def _sync(tmp_path, api_url, *options):
+    infile = tmp_path / "in.bib"
+    if not infile.exists():
+        infile.write_text(BIB)
+    outfile = tmp_path / "out.bib"
+    sync.main(
+        [str(infile), str(outfile), "--api-url", api_url, "--entry-cache-days", "0"]
+        + list(options)
+    )
+    return outfile
+
+
+def test_state(monkeypatch, tmp_path):
+    monkeypatch.setenv("BETTERBIB_NO_UPDATE_CHECK", "1")
+    state = str(tmp_path / "state.json")
+
+    with StandIn(synthesize=True) as standin:
+        for k in range(2):
+            # without the response cache of the first run
+            monkeypatch.setattr(tools, "_cache_dir", str(tmp_path / str(k)))
+            _sync(tmp_path, standin.crossref_url, "--state", state)
+
+    # The second run found all entries of the input unchanged.
+    assert standin.stats["synthesized"] == 5
+    with open(state) as f:
+        entries = json.load(f)["entries"]
+    assert sorted(entries) == ["k{}".format(i) for i in range(5)]
+    assert all(e["outcome"] == "found" for e in entries.values())
+    return
+
+
+def test_retry_queue(monkeypatch, tmp_path):
+    monkeypatch.setattr(tools, "_cache_dir", str(tmp_path))
+
+    # Some searches fail; they aren't retried within the request.
+    with StandIn(synthesize=True, faults=Faults(rate_5xx=0.3, seed=2)) as standin:
+        source = crossref.Crossref(api_url=standin.crossref_url, max_retries=0)
+        source.circuit_breaker.failure_threshold = 100
+
+        # (title, start, end) of every lookup
+        calls = []
+        lock = threading.Lock()
+        find_unique = source.find_unique
+
+        def logged(entry):
+            start = time.time()
+            try:
+                return find_unique(entry)
+            finally:
+                with lock:
+                    calls.append((entry.fields["title"], start, time.time()))
+
+        source.find_unique = logged
+        results = list(sync._lookup_in_order(_items(10), source, 4))
+
+    assert [r[0] for r in results] == ["k{}".format(k) for k in range(10)]
+    titles = [c[0] for c in calls]
+    retried = {t for t in titles if titles.count(t) == 2}
+    assert retried
+    assert len(calls) == 10 + len(retried)
+    # The failed lookups were tried again once all others were done.
+    first_done = max(end for title, _, end in calls[:10])
+    for title, start, _ in calls[10:]:
+        assert title in retried
+        assert start >= first_done
+    assert standin.stats["5xx"] >= len(retried)
+    assert all(r[3] in ["found", "error"] for r in results)
+    return
+
+
+def test_deadline(monkeypatch, tmp_path):
+    monkeypatch.setattr(tools, "_cache_dir", str(tmp_path))
+
+    with StandIn(synthesize=True, faults=Faults(latency=0.4)) as standin:
+        source = crossref.Crossref(api_url=standin.crossref_url)
+        items = _items(10)
+        start = time.time()
+        results = list(sync._lookup_in_order(items, source, 2, deadline=start + 1.0))
+        assert time.time() - start < 1.5
+
+    # all entries, in order, some of them looked up
+    assert [r[0] for r in results] == ["k{}".format(k) for k in range(10)]
+    assert [r[1] for r in results] == [item[1] for item in items]
+    outcomes = [r[3] for r in results]
+    assert outcomes[0] == "found"
+    assert outcomes[-1] is None
+    # Only the first ones finished.
+    num_found = outcomes.count("found")
+    assert outcomes == num_found * ["found"] + (10 - num_found) * [None]
+    assert all(r[2] is None for r in results[num_found:])
+    return
+
+
+def test_resume(monkeypatch, tmp_path):
+    monkeypatch.setenv("BETTERBIB_NO_UPDATE_CHECK", "1")
+    journal = str(tmp_path / "out.bib.journal")
+
+    with StandIn(synthesize=True, faults=Faults(latency=0.4)) as standin:
+        # interrupted by the deadline
+        monkeypatch.setattr(tools, "_cache_dir", str(tmp_path / "0"))
+        _sync(tmp_path, standin.crossref_url, "-c", "1", "--deadline", "1.0")
+        with open(journal) as f:
+            # the header, then one line per lookup
+            num_journaled = len(f.readlines()) - 1
+        assert 0 < num_journaled < 5
+        num_requests = standin.stats["requests"]
+
+        # without the response cache of the first run
+        monkeypatch.setattr(tools, "_cache_dir", str(tmp_path / "1"))
+        outfile = _sync(tmp_path, standin.crossref_url, "--resume")
+
+    assert standin.stats["requests"] - num_requests == 5 - num_journaled
+    with open(str(outfile)) as f:
+        assert f.read().count("J. Synth. Res.") == 5
+    # done, so the journal is gone
+    assert not os.path.exists(journal)
+    return
+
+
+def test_async_cache(monkeypatch, tmp_path):
+    monkeypatch.setenv("BETTERBIB_NO_UPDATE_CHECK", "1")
+    monkeypatch.setattr(tools, "_cache_dir", str(tmp_path / "cache"))
+
+    outputs = []
+    with StandIn(synthesize=True) as standin:
+        # The engines share the HTTP cache.
+        for engine in ["async", "threads", "async"]:
+            outfile = _sync(tmp_path, standin.crossref_url, "--engine", engine)
+            with open(str(outfile)) as f:
+                outputs.append(f.read())
+            assert standin.stats["requests"] == 5
+    assert outputs[0].count("J. Synth. Res.") == 5
+    assert outputs[1] == outputs[0]
+    assert outputs[2] == outputs[0]
+    return
@@ -1,5 +1,8 @@
 # -*- coding: utf-8 -*-
 #
+import collections
+import io
+
 import pybtex
 import pybtex.database
 
@@ -60,3 +63,49 @@ def test_journal_name():
 def test_month_range():
     assert betterbib.translate_month("June-July") == 'jun # "-" # jul'
     return
+
+
+def test_fingerprint():
+    entry = pybtex.database.Entry(
+        "article",
+        fields={"title": "The Magnus expansion", "month": "January", "doi": "10.1/a"},
+        persons={"author": [pybtex.database.Person("Doe, John")]},
+    )
+    cosmetic = pybtex.database.Entry(
+        "Article",
+        fields={
+            "title": "The  {M}agnus Expansion",
+            "month": 1,
+            "doi": "https://doi.org/10.1/a",
+        },
+        persons={"author": [pybtex.database.Person("John Doe")]},
+    )
+    changed = pybtex.database.Entry(
+        "article",
+        fields={"title": "The Magnus expansion", "month": "January", "doi": "10.1/b"},
+        persons={"author": [pybtex.database.Person("Doe, John")]},
+    )
+    assert betterbib.tools.fingerprint(entry) == betterbib.tools.fingerprint(cosmetic)
+    assert betterbib.tools.fingerprint(entry) != betterbib.tools.fingerprint(changed)
+    return
+
+
+def test_write_jobs():
+    od = collections.OrderedDict(
+        (
+            "key{}".format(k),
+            pybtex.database.Entry(
+                "article",
+                fields={"title": "Title number {}".format(k), "year": "2000"},
+                persons={"author": [pybtex.database.Person("Doe, John")]},
+            ),
+        )
+        for k in range(10)
+    )
+
+    serial = io.StringIO()
+    betterbib.write(od, serial, "braces", tab_indent=False)
+    parallel = io.StringIO()
+    betterbib.write(od, parallel, "braces", tab_indent=False, jobs=3, chunk_size=2)
+    assert parallel.getvalue() == serial.getvalue()
+    return